@@ -0,0 +1,52 @@
+"""
+Packet encode/decode throughput on one core, against the former SHA-256 header codec.
+
+    python -m benchmarks.codec [packets]
+"""
+import sys, time, struct, hashlib
+from src.models.packet import Packet, parse_packet
+from src.models.constants import MTU, PACKET_HEADER_SIZE, PAYLOAD
+
+_PAYLOAD = bytes(range(256)) * 6
+_PAYLOAD = _PAYLOAD[:MTU - PACKET_HEADER_SIZE]
+_LEGACY_HEADER_SIZE = 15
+
+
+def _legacy_encode(packet):
+    pack = struct.pack("!I I B H", packet.seq_number, packet.ack_number, packet.operation, packet.payload_size)
+    checksum = struct.pack('! 4s', hashlib.sha256(pack).digest())
+    return bytes(pack + checksum + packet.payload)
+
+
+def _legacy_decode(datagram):
+    packet = Packet.__new__(Packet)
+    header = datagram[:_LEGACY_HEADER_SIZE - 4]
+    packet.checksum = datagram[_LEGACY_HEADER_SIZE - 4:_LEGACY_HEADER_SIZE]
+    packet.ver_cksm = struct.pack('!4s', hashlib.sha256(header).digest()) == packet.checksum
+    packet.seq_number, packet.ack_number, packet.operation, packet.payload_size = struct.unpack("!I I B H", header)
+    packet.payload = datagram[_LEGACY_HEADER_SIZE:]
+    return packet
+
+
+def _rate(count, method, argument):
+    start = time.perf_counter()
+    for _ in range(count):
+        method(argument)
+    return int(count / (time.perf_counter() - start))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    packet = Packet(seq=1, oper=PAYLOAD, ack=0, payload=_PAYLOAD)
+    datagram = bytes(packet)
+    buffer = bytearray(len(datagram))
+    print('packets per second, {} byte payload'.format(len(_PAYLOAD)))
+    print('encode sha256 (former)', _rate(count, _legacy_encode, packet))
+    print('encode crc32 bytes()  ', _rate(count, bytes, packet))
+    print('encode crc32 into     ', _rate(count, packet.encode_into, buffer))
+    print('decode sha256 (former)', _rate(count, _legacy_decode, datagram))
+    print('decode crc32 view     ', _rate(count, parse_packet, datagram))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""
+Handshake benchmark: sustained handshakes per second completed against a ReliableServer, optionally under a
+flood of SYNs that never complete the handshake, for every SYN handling mode. Reports the handshake rate and
+latency, and the server's pending handshakes, memory and threads.
+
+    python -m benchmarks.handshake [--modes stateful,cookies,auto] [--duration 5] [--concurrency 32]
+                                   [--flood 2000] [--output handshake-results.json]
+"""
+import argparse, json, multiprocessing, platform, resource, selectors, socket, threading, time
+from src.models.metrics import percentiles
+from src.models.packet import Packet, parse_packet, generate_id
+from src.models.constants import SYN, SYN_ACK, ACK
+
+# syn_cookies argument of the server in every mode
+MODES = {'stateful': False, 'cookies': True, 'auto': None}
+
+
+def _server(mode, conn):
+    """
+    Runs the server in its own process, so its memory and threads are its own
+    """
+    from src.sockets.server import ReliableServer
+    server = ReliableServer('127.0.0.1', 0, syn_cookies=MODES[mode])
+    server.listen()
+
+    def accept():
+        while True:
+            server.accept()
+    # SYNs are ignored while no acceptor waits
+    for _ in range(4):
+        threading.Thread(target=accept, daemon=True).start()
+    conn.send(server.socket.socket.getsockname())
+    peak = 0
+    while not conn.poll(0.05):
+        peak = max(peak, len(server.awaiting_connections))
+    stats = server.snapshot()
+    stats.update({'awaiting_peak': peak, 'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  'threads': threading.active_count()})
+    conn.send(stats)
+
+
+def _flood(address, rate, stop, counter):
+    """
+    Sends SYNs from fresh source ports, never answering the SYN_ACKs
+    """
+    syn = Packet(seq=0, oper=SYN)
+    interval = 1 / rate
+    due = time.perf_counter()
+    while not stop.is_set():
+        syn.seq_number = generate_id()
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(bytes(syn), address)
+        counter[0] += 1
+        due += interval
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _handshakes(address, duration, concurrency, timeout):
+    """
+    Keeps a number of handshakes in progress, each from its own socket, for the given duration. Sockets stay
+    open until the end: a reused port would reach the session of a previous handshake instead
+    :return: (tuple) completed handshakes' latencies and number of handshakes given up
+    """
+    selector = selectors.DefaultSelector()
+    latencies = []
+    failed = 0
+    done = []
+
+    def start():
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        except OSError:
+            # out of file descriptors, the remaining handshakes end the run
+            return
+        sock.setblocking(False)
+        seq_number = generate_id()
+        sock.sendto(bytes(Packet(seq=seq_number, oper=SYN)), address)
+        selector.register(sock, selectors.EVENT_READ, (seq_number, time.perf_counter()))
+
+    def finish(key):
+        selector.unregister(key.fileobj)
+        done.append(key.fileobj)
+        start()
+
+    end = time.perf_counter() + duration
+    for _ in range(concurrency):
+        start()
+    while time.perf_counter() < end:
+        for key, events in selector.select(0.05):
+            seq_number, started = key.data
+            try:
+                packet = parse_packet(key.fileobj.recv(2048))
+            except OSError:
+                continue
+            if packet.operation != SYN_ACK:
+                continue
+            key.fileobj.sendto(bytes(Packet(seq=seq_number, oper=ACK, ack=packet.seq_number)), address)
+            latencies.append(time.perf_counter() - started)
+            finish(key)
+        now = time.perf_counter()
+        for key in list(selector.get_map().values()):
+            if now - key.data[1] > timeout:
+                failed += 1
+                finish(key)
+    for sock in done + [key.fileobj for key in selector.get_map().values()]:
+        sock.close()
+    selector.close()
+    return latencies, failed
+
+
+def run(mode, options):
+    """
+    Runs the benchmark against a server in the given mode
+    :return: (dict) result
+    """
+    context = multiprocessing.get_context('spawn')
+    conn, child_conn = context.Pipe()
+    server = context.Process(target=_server, args=(mode, child_conn), daemon=True)
+    server.start()
+    address = conn.recv()
+    stop = threading.Event()
+    flooded = [0]
+    if options['flood']:
+        threading.Thread(target=_flood, args=(address, options['flood'], stop, flooded), daemon=True).start()
+    latencies, failed = _handshakes(address, options['duration'], options['concurrency'], options['timeout'])
+    stop.set()
+    # lets the last ACKs arrive
+    time.sleep(0.2)
+    conn.send('stop')
+    stats = conn.recv()
+    server.join(5)
+    if server.is_alive():
+        server.kill()
+    return {
+        'mode': mode,
+        'handshakes': len(latencies),
+        'handshakes_s': round(len(latencies) / options['duration'], 1),
+        'failed': failed,
+        'latency_s': {key: round(value, 6) if value is not None else None
+                      for key, value in percentiles(latencies).items()},
+        'flood_syns': flooded[0],
+        'server': stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RUDP handshake benchmark')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--duration', type=float, default=5, help='seconds per mode')
+    parser.add_argument('--concurrency', type=int, default=32, help='handshakes in progress')
+    parser.add_argument('--timeout', type=float, default=1, help='seconds before a handshake is given up')
+    parser.add_argument('--flood', type=float, default=0, help='SYNs per second never completing the handshake')
+    parser.add_argument('--output', default='handshake-results.json')
+    args = parser.parse_args()
+    # a socket per handshake
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    options = {'duration': args.duration, 'concurrency': args.concurrency, 'timeout': args.timeout,
+               'flood': args.flood}
+
+    results = []
+    for mode in args.modes.split(','):
+        result = run(mode, options)
+        results.append(result)
+        server = result['server']
+        print('{:9} {:9.1f} handshakes/s  p99 {:.4f} s  failed {:5}  pending peak {:6}  cookies {:7}  '
+              'rss {:7} kB  threads {}'.format(mode, result['handshakes_s'], result['latency_s']['p99'] or 0,
+                                               result['failed'], server['awaiting_peak'], server['syn_cookies'],
+                                               server['max_rss_kb'], server['threads']))
+
+    with open(args.output, 'w') as output:
+        json.dump({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                   'platform': platform.platform(), 'options': options, 'results': results}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+UDP forwarding proxy impairing the traffic between local clients and a server: loss, delay, jitter,
+reordering, duplication and a bandwidth cap, applied to both directions.
+
+    python -m benchmarks.proxy listen_port server_port [--loss 0.01] [--delay 0.02] ...
+"""
+import argparse, heapq, random, select, socket, time
+from src.models.constants import SOCKET_BUFFER_SIZE
+from src.sockets.sock import set_buffer_size
+
+_DATAGRAM_SIZE = 65535
+
+
+class _Link:
+    """
+    One direction of the impaired path
+    """
+    def __init__(self, rate, queue_limit):
+        """
+        :param rate: bandwidth cap in bytes per second, None for no cap
+        :param queue_limit: bytes queued behind the cap before tail drops
+        """
+        self.rate = rate
+        self.queue_limit = queue_limit
+        self.free_at = 0
+
+    def departure(self, now, size):
+        """
+        Returns when a datagram finishes serializing on the link, or None if the queue overflows
+        """
+        if not self.rate:
+            return now
+        start = max(now, self.free_at)
+        if (start - now) * self.rate > self.queue_limit:
+            return None
+        self.free_at = start + size / self.rate
+        return self.free_at
+
+
+class ImpairmentProxy:
+    """
+    Forwards datagrams from clients to a server and back, every client through its own upstream socket
+    so the server tells them apart
+    """
+    def __init__(self, target, listen=('127.0.0.1', 0), loss=0, delay=0, jitter=0, reorder=0, duplicate=0,
+                 rate=None, queue_limit=256000, seed=None):
+        """
+        :param target: server's (ip, port) address
+        :param listen: proxy's (ip, port) address clients send to
+        :param loss: probability of dropping a datagram
+        :param delay: one way delay in seconds
+        :param jitter: max random extra delay in seconds
+        :param reorder: probability of holding a datagram back behind the next ones
+        :param duplicate: probability of delivering a datagram twice
+        :param rate: bandwidth cap in bytes per second of each direction, None for no cap
+        :param queue_limit: bytes queued behind the bandwidth cap before tail drops
+        :param seed: random seed, for reproducible runs
+        """
+        self.target = target
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.reorder = reorder
+        self.duplicate = duplicate
+        self.random = random.Random(seed)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # sized as the library's sockets, so a full window isn't lost in the proxy's kernel buffers
+        set_buffer_size(self.socket, SOCKET_BUFFER_SIZE)
+        self.socket.bind(listen)
+        self.address = self.socket.getsockname()
+        self.upstream = {}
+        self.clients = {}
+        self.links = (_Link(rate, queue_limit), _Link(rate, queue_limit))
+        # (due time, counter, socket, datagram, address)
+        self.queue = []
+        self.counter = 0
+        self.stats = {'forwarded': 0, 'lost': 0, 'reordered': 0, 'duplicated': 0, 'overflowed': 0}
+        self.run = False
+
+    def __upstream(self, client):
+        sock = self.upstream.get(client)
+        if not sock:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            set_buffer_size(sock, SOCKET_BUFFER_SIZE)
+            sock.bind((self.address[0], 0))
+            self.upstream[client] = sock
+            self.clients[sock] = client
+        return sock
+
+    def __impair(self, link, sock, datagram, address, now):
+        """
+        Schedules a datagram's delivery
+        """
+        if self.random.random() < self.loss:
+            self.stats['lost'] += 1
+            return
+        departure = link.departure(now, len(datagram))
+        if departure is None:
+            self.stats['overflowed'] += 1
+            return
+        copies = 1
+        if self.random.random() < self.duplicate:
+            self.stats['duplicated'] += 1
+            copies = 2
+        for _ in range(copies):
+            due = departure + self.delay + self.random.random() * self.jitter
+            if self.random.random() < self.reorder:
+                # held back long enough for a few following datagrams to overtake it
+                self.stats['reordered'] += 1
+                due += max(self.delay, 0.001) + self.jitter
+            self.counter += 1
+            heapq.heappush(self.queue, (due, self.counter, sock, datagram, address))
+
+    def __deliver(self, now):
+        while self.queue and self.queue[0][0] <= now:
+            due, counter, sock, datagram, address = heapq.heappop(self.queue)
+            try:
+                sock.sendto(datagram, address)
+                self.stats['forwarded'] += 1
+            except OSError:
+                pass
+
+    def serve(self):
+        """
+        Forwards datagrams until stop() is called
+        """
+        self.run = True
+        while self.run:
+            now = time.monotonic()
+            self.__deliver(now)
+            timeout = min(max(self.queue[0][0] - now, 0), 0.05) if self.queue else 0.05
+            readable, _, _ = select.select([self.socket] + list(self.clients), [], [], timeout)
+            now = time.monotonic()
+            for sock in readable:
+                try:
+                    datagram, address = sock.recvfrom(_DATAGRAM_SIZE)
+                except OSError:
+                    continue
+                if sock is self.socket:
+                    self.__impair(self.links[0], self.__upstream(address), datagram, self.target, now)
+                else:
+                    self.__impair(self.links[1], self.socket, datagram, self.clients[sock], now)
+
+    def stop(self):
+        self.run = False
+
+    def close(self):
+        self.socket.close()
+        for sock in self.upstream.values():
+            sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='UDP impairment proxy')
+    parser.add_argument('listen_port', type=int)
+    parser.add_argument('server_port', type=int)
+    parser.add_argument('--server-ip', default='127.0.0.1')
+    parser.add_argument('--loss', type=float, default=0)
+    parser.add_argument('--delay', type=float, default=0, help='one way delay, seconds')
+    parser.add_argument('--jitter', type=float, default=0, help='seconds')
+    parser.add_argument('--reorder', type=float, default=0)
+    parser.add_argument('--duplicate', type=float, default=0)
+    parser.add_argument('--rate', type=float, default=None, help='bandwidth cap, Mbit/s')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    proxy = ImpairmentProxy((args.server_ip, args.server_port), ('127.0.0.1', args.listen_port), args.loss,
+                            args.delay, args.jitter, args.reorder, args.duplicate,
+                            args.rate * 125000 if args.rate else None, seed=args.seed)
+    try:
+        proxy.serve()
+    except KeyboardInterrupt:
+        print(proxy.stats)
+    finally:
+        proxy.close()
+
+
+if __name__ == '__main__':
+    main()
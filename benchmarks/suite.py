@@ -0,0 +1,269 @@
+"""
+End to end benchmarks of ReliableSocket/ReliableServer over localhost, through the impairment proxy.
+Reports goodput, tail latency, retransmission ratio and CPU per MB of every scenario under every
+network profile, and writes them to a JSON file. With --baseline, results worse than a previous run
+by more than --tolerance are reported as regressions and the exit status is 1.
+
+    python -m benchmarks.suite [--scenarios bulk,rr,many] [--profiles clean,lossy,wan] [--output results.json]
+                               [--baseline previous.json] [--tolerance 0.2] [--fec 10[:2]]
+"""
+import argparse, json, multiprocessing, os, platform, threading, time
+from .proxy import ImpairmentProxy
+from src.models.metrics import percentiles
+
+PROFILES = {
+    'clean': {},
+    'lossy': {'loss': 0.01, 'delay': 0.005},
+    'wan': {'delay': 0.025, 'jitter': 0.005, 'loss': 0.005, 'reorder': 0.01, 'duplicate': 0.005,
+            'rate': 100 * 125000},
+    'constrained': {'delay': 0.01, 'loss': 0.001, 'rate': 10 * 125000},
+}
+
+SCENARIOS = ('bulk', 'rr', 'many')
+
+
+def _proxy(target, profile, conn, parent):
+    proxy = ImpairmentProxy(target, seed=1, **profile)
+    conn.send(proxy.address)
+    thread = threading.Thread(target=proxy.serve, daemon=True)
+    thread.start()
+    # runs until asked to stop, or until the scenario's process was killed
+    while not conn.poll(1) and os.getppid() == parent:
+        pass
+    proxy.stop()
+    thread.join()
+    conn.send(proxy.stats)
+    proxy.close()
+
+
+def _set_fec(session, options):
+    """
+    Turns on forward error correction of a session's sends, if asked for
+    """
+    if options['fec']:
+        session.set_fec(*options['fec'])
+
+
+def _receive_exactly(session, size):
+    received = 0
+    while received < size:
+        received += len(session.receive(size - received))
+
+
+def _bulk(server, address, options, clients):
+    from src.sockets.client import ReliableSocket
+    size = options['size']
+
+    def serve():
+        session = server.accept()
+        _set_fec(session, options)
+        _receive_exactly(session, size)
+        session.send(b'ok')
+    threading.Thread(target=serve, daemon=True).start()
+    client = ReliableSocket(*address)
+    client.connect()
+    _set_fec(client.session, options)
+    clients.append(client)
+    start = time.perf_counter()
+    client.send(bytes(size))
+    _receive_exactly(client, 2)
+    elapsed = time.perf_counter() - start
+    return size, elapsed, [elapsed]
+
+
+def _rr(server, address, options, clients):
+    from src.sockets.client import ReliableSocket
+    size = options['message']
+
+    def serve():
+        session = server.accept()
+        _set_fec(session, options)
+        while True:
+            _receive_exactly(session, size)
+            session.send(bytes(size))
+    threading.Thread(target=serve, daemon=True).start()
+    client = ReliableSocket(*address)
+    client.connect()
+    _set_fec(client.session, options)
+    clients.append(client)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(options['iterations']):
+        sent = time.perf_counter()
+        client.send(bytes(size))
+        _receive_exactly(client, size)
+        latencies.append(time.perf_counter() - sent)
+    return 2 * size * options['iterations'], time.perf_counter() - start, latencies
+
+
+def _many(server, address, options, clients):
+    from src.sockets.client import ReliableSocket
+    size = options['size'] // options['clients']
+    latencies = []
+
+    def serve(session):
+        _set_fec(session, options)
+        _receive_exactly(session, size)
+        session.send(b'ok')
+
+    def accept():
+        for _ in range(options['clients']):
+            threading.Thread(target=serve, args=(server.accept(),), daemon=True).start()
+
+    def run_client():
+        client = ReliableSocket(*address)
+        client.connect()
+        _set_fec(client.session, options)
+        clients.append(client)
+        started = time.perf_counter()
+        client.send(bytes(size))
+        _receive_exactly(client, 2)
+        latencies.append(time.perf_counter() - started)
+    threading.Thread(target=accept, daemon=True).start()
+    threads = [threading.Thread(target=run_client) for _ in range(options['clients'])]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return size * options['clients'], time.perf_counter() - start, latencies
+
+
+def _worker(scenario, profile, options, conn):
+    """
+    Runs one scenario in its own process, so CPU time is the client's and the server's only
+    and their threads are gone with it
+    """
+    from src.sockets.server import ReliableServer
+    server = ReliableServer('127.0.0.1', 0)
+    server.listen()
+    context = multiprocessing.get_context('spawn')
+    proxy_conn, child_conn = context.Pipe()
+    proxy = context.Process(target=_proxy, args=(server.socket.socket.getsockname(), PROFILES[profile],
+                                                 child_conn, os.getpid()))
+    proxy.start()
+    address = proxy_conn.recv()
+    clients = []
+    cpu = time.process_time()
+    size, elapsed, latencies = globals()['_' + scenario](server, address, options, clients)
+    cpu = time.process_time() - cpu
+
+    snapshots = [client.session.snapshot() for client in clients] + \
+                [session.snapshot() for session in list(server.sessions.values())]
+    packets = sum(snapshot['packets_sent'] for snapshot in snapshots)
+    retransmits = sum(snapshot['retransmits'] for snapshot in snapshots)
+    proxy_conn.send('stop')
+    proxy_stats = proxy_conn.recv()
+    proxy.join()
+    megabytes = size / 1000000
+    conn.send({
+        'scenario': scenario,
+        'profile': profile,
+        'completed': True,
+        'bytes': size,
+        'seconds': round(elapsed, 4),
+        'goodput_mb_s': round(megabytes / elapsed, 3),
+        'latency_s': {key: round(value, 6) for key, value in percentiles(latencies).items()},
+        'retransmit_ratio': round(retransmits / packets, 4) if packets else 0,
+        'cpu_s_per_mb': round(cpu / megabytes, 4),
+        'drops': sum(snapshot['drops'] for snapshot in snapshots),
+        'fec_recovered': sum(snapshot['fec_recovered'] for snapshot in snapshots),
+        'proxy': proxy_stats,
+    })
+    conn.close()
+    # client and server threads never return
+    os._exit(0)
+
+
+def run(scenario, profile, options, timeout):
+    """
+    Runs a scenario under a network profile
+    :return: (dict) result
+    """
+    context = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_worker, args=(scenario, profile, options, child_conn))
+    process.start()
+    result = parent_conn.recv() if parent_conn.poll(timeout) else None
+    process.join(1)
+    if process.is_alive():
+        process.kill()
+    return result if result else {'scenario': scenario, 'profile': profile, 'completed': False}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Lists results worse than the baseline's by more than the tolerance
+    :param results: list of results
+    :param baseline: list of a previous run's results
+    :param tolerance: allowed relative change
+    :return: list of regression descriptions
+    """
+    previous = {(result['scenario'], result['profile']): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get((result['scenario'], result['profile']))
+        if not old or not old['completed']:
+            continue
+        name = '{}/{}'.format(result['scenario'], result['profile'])
+        if not result['completed']:
+            regressions.append('{}: did not complete'.format(name))
+            continue
+        checks = (('goodput_mb_s', result['goodput_mb_s'], old['goodput_mb_s'], -1),
+                  ('latency p99', result['latency_s']['p99'], old['latency_s']['p99'], 1),
+                  ('cpu_s_per_mb', result['cpu_s_per_mb'], old['cpu_s_per_mb'], 1))
+        for metric, new_value, old_value, direction in checks:
+            if old_value and (new_value - old_value) * direction > old_value * tolerance:
+                regressions.append('{}: {} {} -> {}'.format(name, metric, old_value, new_value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RUDP benchmark suite')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--profiles', default='clean,lossy,wan')
+    parser.add_argument('--size', type=float, default=4, help='MB transferred by bulk and many clients')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=200, help='request/response round trips')
+    parser.add_argument('--message', type=int, default=64, help='request/response message size')
+    parser.add_argument('--fec', default=None, help='forward error correction of every session, as GROUP or '
+                                                     'GROUP:PARITY; parity adapts to loss if omitted')
+    parser.add_argument('--timeout', type=float, default=120, help='seconds per scenario')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+    fec = None
+    if args.fec:
+        group, _, parity = args.fec.partition(':')
+        fec = (int(group), int(parity) if parity else None)
+    options = {'size': int(args.size * 1000000), 'clients': args.clients, 'iterations': args.iterations,
+               'message': args.message, 'fec': fec}
+
+    results = []
+    for profile in args.profiles.split(','):
+        for scenario in args.scenarios.split(','):
+            result = run(scenario, profile, options, args.timeout)
+            results.append(result)
+            if result['completed']:
+                print('{:6} {:12} {:8.3f} MB/s  p99 {:8.4f} s  retransmits {:6.2%}  cpu {:.4f} s/MB'.format(
+                    scenario, profile, result['goodput_mb_s'], result['latency_s']['p99'],
+                    result['retransmit_ratio'], result['cpu_s_per_mb']))
+            else:
+                print('{:6} {:12} did not complete'.format(scenario, profile))
+
+    with open(args.output, 'w') as output:
+        json.dump({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                   'platform': platform.platform(), 'options': options, 'results': results}, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline)['results'], args.tolerance)
+        for regression in regressions:
+            print('regression', regression)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Syscalls per MB of the per-datagram and the batched Socket I/O paths over loopback.
+
+    python -m benchmarks.syscalls [megabytes]
+"""
+import sys, time, socket
+from src.sockets.sock import Socket
+from src.models.packet import Packet
+from src.models.constants import MTU, PACKET_HEADER_SIZE, PAYLOAD, IO_BATCH
+
+_PAYLOAD = bytes(MTU - PACKET_HEADER_SIZE)
+
+
+def _run(megabytes, batched, use_mmsg=True, use_gso=True):
+    receiver = Socket()
+    receiver.bind('127.0.0.1', 0)
+    receiver.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 24)
+    sender = Socket()
+    sender.use_mmsg = receiver.use_mmsg = use_mmsg and sender.use_mmsg
+    sender.use_gso = use_gso and sender.use_gso
+    address = receiver.socket.getsockname()
+    packets = [Packet(seq=i, oper=PAYLOAD, ack=0, payload=_PAYLOAD) for i in range(IO_BATCH)]
+    total = megabytes * 1000000 // len(_PAYLOAD)
+    sent = received = 0
+    start = time.perf_counter()
+    while sent < total:
+        count = min(IO_BATCH, total - sent)
+        if batched:
+            sender.send_batch(address, packets[:count])
+            receiver.select(1)
+            received += len(receiver.read_packets())
+        else:
+            for packet in packets[:count]:
+                sender.send(address, packet)
+            for i in range(count):
+                receiver.select(1)
+                if not receiver.is_readable():
+                    break
+                receiver.read_packet()
+                received += 1
+        sent += count
+    elapsed = time.perf_counter() - start
+    gso = sender.use_gso
+    syscalls = sender.syscalls + receiver.syscalls
+    sender.close()
+    receiver.close()
+    return {'syscalls_per_mb': round(syscalls / megabytes, 1), 'delivered': round(received / total, 4),
+            'seconds': round(elapsed, 3), 'gso': gso}
+
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print('per datagram      ', _run(megabytes, False))
+    print('drain + sendmmsg  ', _run(megabytes, True, use_gso=False))
+    print('drain + UDP GSO   ', _run(megabytes, True))
+    print('portable fallback ', _run(megabytes, True, use_mmsg=False, use_gso=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,119 @@
 
-PACKET_HEADER_SIZE = 15
+PACKET_HEADER_SIZE = 22
+# IP packet size used until the path MTU is known
 MTU = 1500
 SEQ_LIMIT = 4000000000
 
 # packets resend
-RESEND_ATTEMPTS = 0 #change
-ACK_TIMEOUT = 0#3
+RESEND_ATTEMPTS = 6
+# initial retransmission timeout, adapted to the measured RTT once acks arrive
+ACK_TIMEOUT = 1
+MIN_RTO = 0.02
+MAX_RTO = 60
+
+# sliding window
+SEND_WINDOW = 512
+SACK_BLOCKS_LIMIT = 32
+RECEIVE_WINDOW = 1024
+
+# flow control: bytes a session buffers for the application, advertised to the peer in ACKs. Once reading
+# opened the window by FLOW_WINDOW_UPDATE bytes, the peer is told at once
+FLOW_WINDOW = 4194304
+FLOW_WINDOW_UPDATE = FLOW_WINDOW // 4
+
+# streams: each side of a session keeps up to MAX_STREAMS streams it opened, until both sides closed them
+MAX_STREAMS = 256
+
+# delayed acks: ack every ACK_FREQUENCY in order packets or after DELAYED_ACK_TIMEOUT
+DELAYED_ACKS = True
+ACK_FREQUENCY = 2
+DELAYED_ACK_TIMEOUT = 0.01
+
+# congestion control
+CONGESTION_CONTROL = 'newreno'
+INITIAL_CWND = 10
+MIN_CWND = 2
+MAX_CWND = SEND_WINDOW
+PACING_GAIN = 1.25
+PACING_BURST = 4
+
+# retransmission timers
+TIMER_TICK = 0.005
+TIMER_WHEEL_SLOTS = 512
 
 SYN_ATTEMPTS = 3
 SYN_TIMEOUT = 3
 
-FIN_ATTEMPTS = 3
+# stateless handshakes: SYN cookies answer SYNs once SYN_BACKLOG handshakes are pending, a cookie is
+# valid for SYN_COOKIE_PERIODS periods of SYN_COOKIE_PERIOD seconds
+SYN_BACKLOG = 128
+SYN_COOKIE_PERIOD = 4
+SYN_COOKIE_PERIODS = 4
+
+# connection close: queued data gets DRAIN_TIMEOUT seconds to be acked before FIN is sent. FIN is resent every
+# retransmission timeout, backing off up to FIN_TIMEOUT seconds, and given up after FIN_ATTEMPTS unanswered FINs.
+# A closed connection lingers TIME_WAIT seconds to answer its peer's late FINs, a server keeps TIME_WAIT_LIMIT
+# lingering addresses at most
+DRAIN_TIMEOUT = 30
+FIN_ATTEMPTS = 4
 FIN_TIMEOUT = 3
+TIME_WAIT = 2 * FIN_TIMEOUT
+TIME_WAIT_LIMIT = 4096
+
+# path MTU discovery (IP packet sizes)
+PMTU_DISCOVERY = True
+IP_UDP_OVERHEAD = 28
+BASE_PLPMTU = 1200
+MAX_PLPMTU = 9000
+PMTU_PROBE_ATTEMPTS = 3
+PMTU_SEARCH_GRANULARITY = 32
+# black hole detection: a packet of the current size timing out that many times in a row
+PMTU_BLACK_HOLE_TIMEOUTS = 3
+RECV_BUFFER_SIZE = 65535
+# kernel buffers of a socket: a full send window of jumbo segments, and a full receive window
+SOCKET_BUFFER_SIZE = max(SEND_WINDOW * MAX_PLPMTU, FLOW_WINDOW)
+
+# seconds between the stats reports of cluster workers, and seconds workers may take to listen
+CLUSTER_STATS_INTERVAL = 1
+CLUSTER_START_TIMEOUT = 10
+
+# latest samples kept for metrics percentiles
+METRICS_SAMPLES = 1024
+
+# bytes of a file queued for sending at a time
+FILE_CHUNK_SIZE = 4194304
+
+# payload compression: segments shorter than COMPRESSION_MIN_SIZE are sent as they are, and a segment
+# saving less than COMPRESSION_MIN_SAVING of its size stops compression for COMPRESSION_BACKOFF segments,
+# doubled up to COMPRESSION_MAX_BACKOFF while data stays incompressible
+COMPRESSION_MIN_SIZE = 128
+COMPRESSION_MIN_SAVING = 0.1
+COMPRESSION_BACKOFF = 16
+COMPRESSION_MAX_BACKOFF = 128
+
+# forward error correction: groups of up to FEC_MAX_GROUP payload packets, each followed by up to
+# FEC_MAX_PARITY parity packets. Adaptive redundancy sends FEC_LOSS_MARGIN times the parity packets the loss
+# rate calls for, the rate being averaged with a FEC_LOSS_GAIN weight per group
+FEC_MAX_GROUP = 64
+FEC_MAX_PARITY = 16
+FEC_LOSS_GAIN = 0.125
+FEC_LOSS_MARGIN = 2
+
+# egress scheduling of server sessions: EGRESS_CLASSES priority classes, 0 first, sessions of a class take
+# turns of EGRESS_QUANTUM bytes times their weight. A session queues up to EGRESS_QUEUE_LIMIT datagrams and
+# the reactor sends up to EGRESS_BATCH of them at a time. Bandwidth caps let at least EGRESS_BURST bytes
+# go back to back
+EGRESS_CLASSES = 3
+EGRESS_DEFAULT_CLASS = 1
+EGRESS_QUANTUM = 9000
+EGRESS_QUEUE_LIMIT = 256
+EGRESS_BATCH = 64
+EGRESS_BURST = 65536
+
+# batched datagram I/O
+IO_BATCH = 64
+GSO_MAX_SEGMENTS = 64
+GSO_MAX_BYTES = 65000
 
 # packets operations
 SYN = 0
@@ -19,4 +121,18 @@ ACK = 1
 SYN_ACK = 2
 FIN = 3
 FIN_ACK = 4
-PAYLOAD = 5
\ No newline at end of file
+PAYLOAD = 5
+PROBE = 6
+PROBE_ACK = 7
+FORWARD = 8
+PARITY = 9
+
+# packets flags
+# ack number of a PAYLOAD packet carries a cumulative ack
+FLAG_ACK = 0x01
+# payload is delivered as soon as it arrives, regardless of its stream's order
+FLAG_UNORDERED = 0x02
+# payload is zlib compressed; on SYN and SYN_ACK, the sender supports compression
+FLAG_COMPRESSED = 0x04
+# last packet of its stream, the sender closed the stream
+FLAG_FIN = 0x08
\ No newline at end of file
@@ -0,0 +1,182 @@
+import collections
+from .event import EventEmitter
+from .constants import METRICS_SAMPLES
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """
+    Returns percentiles of samples by the nearest rank
+    :param samples: iterable of numbers
+    :param points: percentiles to compute
+    :return: (dict) 'p<point>' keys, None values if there are no samples
+    """
+    ordered = sorted(samples)
+    result = {}
+    for point in points:
+        if ordered:
+            result['p{}'.format(point)] = ordered[min(len(ordered) - 1, len(ordered) * point // 100)]
+        else:
+            result['p{}'.format(point)] = None
+    return result
+
+
+class SessionMetrics:
+    """
+    Session's counters. They're plain attributes updated in place on the hot path, without locks; snapshot()
+    computes the derived values. Subscribers of emitter are notified of events as emit(event=, value=)
+    """
+    def __init__(self, samples=METRICS_SAMPLES):
+        """
+        :param samples: number of latest RTT and ack latency samples kept for percentiles
+        """
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.packets_received = 0
+        self.bytes_received = 0
+        self.acks_sent = 0
+        self.acks_received = 0
+        self.retransmits = 0
+        self.drops = 0
+        self.duplicates = 0
+        self.checksum_errors = 0
+        # expired data the session gave up sending, and peer's expired data skipped on its request
+        self.abandoned = 0
+        self.forwarded = 0
+        # parity packets sent, and payload packets rebuilt from the peer's parity packets
+        self.fec_sent = 0
+        self.fec_recovered = 0
+        # streams the peer opened beyond MAX_STREAMS, their data is discarded
+        self.streams_refused = 0
+        self.handshake_time = None
+        self.close_time = None
+        self.rtt_samples = collections.deque(maxlen=samples)
+        self.ack_latency_samples = collections.deque(maxlen=samples)
+        self.emitter = EventEmitter()
+
+    def sent(self, packets, size):
+        """
+        Counts payload packets sent for the first time
+        :param packets: number of packets
+        :param size: their payload bytes
+        """
+        self.packets_sent += packets
+        self.bytes_sent += size
+
+    def received(self, size):
+        self.packets_received += 1
+        self.bytes_received += size
+
+    def retransmit(self, seq_number):
+        self.retransmits += 1
+        if self.emitter.subs:
+            self.emitter.emit(event='retransmit', value=seq_number)
+
+    def drop(self, seq_number):
+        self.drops += 1
+        if self.emitter.subs:
+            self.emitter.emit(event='drop', value=seq_number)
+
+    def rtt(self, sample):
+        self.rtt_samples.append(sample)
+        if self.emitter.subs:
+            self.emitter.emit(event='rtt', value=sample)
+
+    def ack_latency(self, latency):
+        """
+        :param latency: seconds an ack was held back by delayed acking
+        """
+        self.ack_latency_samples.append(latency)
+
+    def handshake(self, duration):
+        self.handshake_time = duration
+        if self.emitter.subs:
+            self.emitter.emit(event='handshake', value=duration)
+
+    def closed(self, duration):
+        self.close_time = duration
+        if self.emitter.subs:
+            self.emitter.emit(event='close', value=duration)
+
+    def snapshot(self):
+        """
+        Returns the counters and the RTT and ack latency percentiles
+        :return: (dict) metrics
+        """
+        return {
+            'packets_sent': self.packets_sent,
+            'bytes_sent': self.bytes_sent,
+            'packets_received': self.packets_received,
+            'bytes_received': self.bytes_received,
+            'acks_sent': self.acks_sent,
+            'acks_received': self.acks_received,
+            'retransmits': self.retransmits,
+            'drops': self.drops,
+            'duplicates': self.duplicates,
+            'checksum_errors': self.checksum_errors,
+            'abandoned': self.abandoned,
+            'forwarded': self.forwarded,
+            'fec_sent': self.fec_sent,
+            'fec_recovered': self.fec_recovered,
+            'streams_refused': self.streams_refused,
+            'rtt': percentiles(tuple(self.rtt_samples)),
+            'ack_latency': percentiles(tuple(self.ack_latency_samples)),
+            'handshake_time': self.handshake_time,
+            'close_time': self.close_time,
+        }
+
+
+class ServerMetrics:
+    """
+    Server's counters, updated without locks like the sessions' ones
+    """
+    def __init__(self):
+        self.datagrams_received = 0
+        self.syn_received = 0
+        self.connections_accepted = 0
+        self.connections_closed = 0
+        self.unknown_packets = 0
+        self.checksum_errors = 0
+        # handshakes answered statelessly, and handshake ACKs dropped for a wrong cookie
+        self.syn_cookies = 0
+        self.invalid_cookies = 0
+        # pending handshakes given up for their ACK never came, and clients asked again for their lost ACK
+        self.handshakes_expired = 0
+        self.handshake_acks_requested = 0
+        # packets of closed sessions answered or dropped while their address lingers in TIME_WAIT
+        self.time_wait_packets = 0
+        self.emitter = EventEmitter()
+
+    def accepted(self, session):
+        self.connections_accepted += 1
+        if self.emitter.subs:
+            self.emitter.emit(event='accept', value=session)
+
+    def closed(self, session):
+        self.connections_closed += 1
+        if self.emitter.subs:
+            self.emitter.emit(event='close', value=session)
+
+    def snapshot(self, sessions=None):
+        """
+        Returns server's counters
+        :param sessions: server's sessions table, to include every session's snapshot keyed by 'ip:port'
+        :return: (dict) metrics
+        """
+        snapshot = {
+            'datagrams_received': self.datagrams_received,
+            'syn_received': self.syn_received,
+            'connections_accepted': self.connections_accepted,
+            'connections_closed': self.connections_closed,
+            'unknown_packets': self.unknown_packets,
+            'checksum_errors': self.checksum_errors,
+            'syn_cookies': self.syn_cookies,
+            'invalid_cookies': self.invalid_cookies,
+            'handshakes_expired': self.handshakes_expired,
+            'handshake_acks_requested': self.handshake_acks_requested,
+            'time_wait_packets': self.time_wait_packets,
+        }
+        if sessions is not None:
+            snapshot['active_sessions'] = len(sessions)
+            snapshot['sessions'] = {'{}:{}'.format(*address): session.snapshot()
+                                    for address, session in list(sessions.items())}
+        return snapshot
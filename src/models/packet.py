@@ -1,21 +1,60 @@
-import struct, random, hashlib
-from .constants import ACK, SYN, FIN, SYN_ACK, FIN_ACK, PACKET_HEADER_SIZE
+import struct, random
+from zlib import crc32
+from .constants import ACK, SYN, FIN, SYN_ACK, FIN_ACK, PROBE, PROBE_ACK, PACKET_HEADER_SIZE
 
-_INT_MAX = 4294967296
 _HEADER_SIZE = PACKET_HEADER_SIZE
-_CHECKSUM_LEN = 4
-_PACK_FORMAT = "!I I B H"
-_UNPACK_FORMAT = "!I I B H"
+# header fields covered by the checksum, followed by the checksum itself
+_FIELDS = struct.Struct("!I I B B H H I")
+_CHECKSUM = struct.Struct("!I")
+_HEADER = struct.Struct("!I I B B H H I I")
+_WINDOW = struct.Struct("!I")
+_SACK_BLOCK = struct.Struct("!I I")
+_new = object.__new__
 
 def generate_id():
-    return random.randint(0, _INT_MAX)
+    return random.getrandbits(32)
 
 
-def _calculate_checksum(header):
-    checksum = hashlib.sha256(header)
-    return struct.pack("!I", checksum)
+def encode_ack(window, blocks):
+    """
+    Encodes receiver's window and selective ack blocks into an ACK payload
+    :param window: bytes the receiver can still buffer
+    :param blocks: list of (start, end) sequence ranges, end exclusive
+    :return: (bytes) ACK payload
+    """
+    return _WINDOW.pack(min(window, 0xFFFFFFFF)) + b''.join(_SACK_BLOCK.pack(start, end) for start, end in blocks)
+
+
+def decode_ack(payload):
+    """
+    Decodes receiver's window and selective ack blocks from an ACK payload
+    :param payload: ACK payload
+    :return: (tuple) window, None if the ACK doesn't advertise it, and list of (start, end) sequence ranges
+    """
+    if len(payload) < _WINDOW.size:
+        return None, []
+    window, = _WINDOW.unpack_from(payload)
+    length = len(payload) - _WINDOW.size
+    blocks = payload[_WINDOW.size:len(payload) - length % _SACK_BLOCK.size]
+    return window, list(_SACK_BLOCK.iter_unpack(blocks))
+
+
+def parse_packet(datagram):
+    """
+    Parses a received datagram
+    :param datagram: (bytes-like) packet header and payload
+    :return: (Packet) parsed packet, failing the checksum if the datagram is truncated
+    """
+    packet = _new(Packet)
+    packet.dissect(datagram)
+    return packet
+
 
 class Packet:
+    # no per-instance dict: packets are created and dissected once per datagram
+    __slots__ = ('seq_number', 'ack_number', 'operation', 'flags', 'payload_size', 'stream_id', 'stream_seq',
+                 'checksum', 'payload', 'ver_cksm')
+
     def __init__(self, **fields):
         if 'header' in fields:
             self.dissect(fields['header'])
@@ -23,28 +62,38 @@ class Packet:
             self.seq_number = fields['seq'] if 'seq' in fields else None
             self.operation = fields['oper'] if 'oper' in fields else None
             self.ack_number = fields['ack'] if 'ack' in fields else generate_id()
+            self.flags = fields['flags'] if 'flags' in fields else 0
+            # stream the payload belongs to and its sequence number within the stream
+            self.stream_id = fields['stream'] if 'stream' in fields else 0
+            self.stream_seq = fields['stream_seq'] if 'stream_seq' in fields else 0
             self.payload = fields['payload'] if 'payload' in fields else bytes()
+            if type(self.payload) == str:
+                self.payload = self.payload.encode('utf-8')
             self.payload_size = len(self.payload) if self.payload else 0
             self.checksum = None
             self.ver_cksm = False
 
-    def dissect(self, header):
+    def dissect(self, datagram):
         """
-        Dissects a packet
-        :param header: (bytes) packet header
+        Dissects a packet without copying it, the payload is a view of the datagram
+        :param datagram: (bytes-like) packet header and payload
         :return:
         """
-        checksum_pointer = _HEADER_SIZE - _CHECKSUM_LEN
-        self.checksum =  header[checksum_pointer:]
-        header = header[:checksum_pointer]
-        checksum = struct.pack('!4s', hashlib.sha256(header).digest())
-        self.ver_cksm = checksum == self.checksum
-
-        header = struct.unpack(_UNPACK_FORMAT, header)
-        self.seq_number = header[0]
-        self.ack_number = header[1]
-        self.operation = header[2]
-        self.payload_size = header[3]
+        view = memoryview(datagram)
+        if len(view) < _HEADER_SIZE:
+            # too short for a header, dropped like a corrupted packet
+            self.seq_number = self.ack_number = self.operation = self.checksum = None
+            self.flags = self.payload_size = self.stream_id = self.stream_seq = 0
+            self.payload = view[:0]
+            self.ver_cksm = False
+            return
+        self.seq_number, self.ack_number, self.operation, self.flags, size, self.stream_id, self.stream_seq, \
+            checksum = _HEADER.unpack_from(view)
+        end = _HEADER_SIZE + size
+        self.payload = payload = view[_HEADER_SIZE:end]
+        self.payload_size = size
+        self.checksum = checksum
+        self.ver_cksm = len(view) >= end and crc32(payload, crc32(view[:_FIELDS.size])) == checksum
 
     def verify_checksum(self):
         return self.ver_cksm
@@ -60,20 +109,40 @@ class Packet:
             operation = SYN_ACK
         elif self.operation == FIN:
             operation = FIN_ACK
+        elif self.operation == PROBE:
+            operation = PROBE_ACK
         packet = Packet(seq=seq_number, oper=operation, ack=self.ack_number)
 
         return packet
 
+    def encode_into(self, buffer, offset=0):
+        """
+        Encodes the packet into a reusable buffer. The checksum (CRC32) covers the header and the payload
+        :param buffer: writable buffer
+        :param offset: packet's position in the buffer
+        :return: (int) encoded length
+        """
+        _FIELDS.pack_into(buffer, offset, self.seq_number, self.ack_number, self.operation, self.flags,
+                          self.payload_size, self.stream_id, self.stream_seq)
+        start = offset + _HEADER_SIZE
+        buffer[start:start + self.payload_size] = self.payload
+        checksum = crc32(self.payload, crc32(buffer[offset:offset + _FIELDS.size]))
+        _CHECKSUM.pack_into(buffer, offset + _FIELDS.size, checksum)
+        return _HEADER_SIZE + self.payload_size
+
+    def header(self):
+        """
+        Returns the encoded header, its checksum covering the payload too
+        """
+        fields = _FIELDS.pack(self.seq_number, self.ack_number, self.operation, self.flags, self.payload_size,
+                              self.stream_id, self.stream_seq)
+        return fields + _CHECKSUM.pack(crc32(self.payload, crc32(fields)))
+
     def __bytes__(self):
         """
         Returns pack in bytes
         """
-        pack = struct.pack(_PACK_FORMAT, self.seq_number, self.ack_number, self.operation, self.payload_size)
-        checksum = struct.pack('! 4s', hashlib.sha256(pack).digest())
-        if type(self.payload) == str:
-            self.payload = self.payload.encode('utf-8')
-
-        return bytes(pack + checksum + self.payload)
+        return b''.join((self.header(), self.payload))
 
     def __len__(self):
         return _HEADER_SIZE + self.payload_size
@@ -82,5 +151,8 @@ class Packet:
         return 'Sequence number: {}\t' \
                'Operation: {}\t' \
                'Ack number: {}\t' \
+               'Flags: {}\t' \
+               'Stream: {}:{}\t' \
                'Payload len: {}\n'.format(str(self.seq_number), str(self.operation),
-                                       str(self.ack_number), self.payload_size)
+                                       str(self.ack_number), self.flags, self.stream_id, self.stream_seq,
+                                       self.payload_size)
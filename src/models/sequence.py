@@ -0,0 +1,24 @@
+from .constants import SEQ_LIMIT
+
+_HALF_SPACE = SEQ_LIMIT // 2
+
+
+def seq_add(seq, count=1):
+    """
+    Moves a sequence number forward, wrapping around SEQ_LIMIT
+    :param seq: sequence number
+    :param count: number of steps
+    """
+    return (seq + count) % SEQ_LIMIT
+
+
+def seq_diff(seq, base):
+    """
+    Returns the signed distance from base to seq in the wrapped sequence space
+    :param seq: sequence number
+    :param base: reference sequence number
+    """
+    diff = (seq - base) % SEQ_LIMIT
+    if diff >= _HALF_SPACE:
+        diff -= SEQ_LIMIT
+    return diff
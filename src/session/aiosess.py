@@ -0,0 +1,308 @@
+import asyncio
+from .session import Session
+from .stream import Stream
+from .models.timer import LoopScheduler
+from .models.filemap import FileSource, FileSink
+from ..models.packet import Packet
+from ..models.event import EventEmitter
+from ..models.sequence import seq_add
+from ..sockets.sock import Socket, set_dont_fragment, allow_fragments
+from ..models.constants import FIN, FIN_ACK, FIN_ATTEMPTS, FIN_TIMEOUT, FILE_CHUNK_SIZE, DRAIN_TIMEOUT
+
+
+class AsyncStream(Stream):
+    """
+    Stream of an asyncio session
+    """
+    async def send(self, data, ttl=None, ordered=True):
+        """
+        Sends data on the stream, waiting until congestion control released all of it
+        :param data: data to send
+        :param ttl: seconds the data is worth delivering, None to deliver it reliably
+        :param ordered: False to deliver the data as soon as it arrives, it must fit in a packet
+        """
+        await self.session._send_on(self, data, ttl, ordered)
+
+    async def receive(self, length):
+        """
+        Returns data received on the stream, waiting until some arrives
+        :param length: max data length
+        :return: (bytes) data, empty once the stream or the session is closed
+        """
+        return await self.session._receive_on(self, length)
+
+    async def receive_into(self, buffer):
+        """
+        Writes data received on the stream straight into a caller's buffer, waiting until some arrives
+        :param buffer: writable bytes-like object (bytearray, memoryview)
+        :return: (int) number of bytes written, 0 once the stream or the session is closed
+        """
+        return await self.session._receive_into_on(self, buffer)
+
+    async def send_file(self, file, offset=0, count=None):
+        """
+        Sends a file on the stream, memory mapped and segmented without copies
+        :param file: file path, or binary file object opened for reading
+        :param offset: position of the first byte to send
+        :param count: number of bytes to send, None up to the end of the file
+        :return: (int) number of bytes sent, returned once the peer acked all of them
+        """
+        return await self.session._send_file_on(self, file, offset, count)
+
+    async def receive_to_file(self, file, length):
+        """
+        Writes data received on the stream straight into a file, waiting until all of it arrives
+        :param file: file path, or binary file object written from its current position
+        :param length: number of bytes to receive
+        :return: (int) number of bytes written, less than length if the session is closed
+        """
+        return await self.session._receive_file_on(self, file, length)
+
+
+class AsyncSession(Session):
+    """
+    Session running on an asyncio event loop. Packets are fed by a datagram protocol and all timers run on the loop
+    """
+    def __init__(self, address, local_seq, peer_seq, transport, loop):
+        """
+        :param address: peer's address
+        :param local_seq: local initial sequence number
+        :param peer_seq: peer's initial sequence number
+        :param transport: datagram transport of the endpoint
+        :param loop: asyncio event loop
+        """
+        super().__init__(address, local_seq, peer_seq, LoopScheduler(loop))
+        self.transport = transport
+        self.loop = loop
+        sock = transport.get_extra_info('socket')
+        self.pmtu_discovery = self.pmtu_discovery and sock is not None and set_dont_fragment(sock)
+        self.incoming_streams = asyncio.Queue()
+        self.close_emitter = EventEmitter()
+        self.closing_process = False
+        self.session_closed = False
+        self.close_started = None
+        self.__closed = loop.create_future()
+        self.__data_ready = asyncio.Event()
+        self.__drained = asyncio.Event()
+        self.data_emitter.subscribe(self.__on_data)
+        self.drain_emitter.subscribe(self.__on_drain)
+
+    def handle_packet(self, packet):
+        """
+        Handles an income packet routed to this session
+        :param packet: income packet
+        """
+        if not packet.verify_checksum():
+            self.metrics.checksum_errors += 1
+            return
+        if packet.operation == FIN:
+            self.close_started = self.loop.time()
+            self._send_packet(packet.ack())
+            self.close_session()
+            self.__set_closed()
+        elif self.closing_process:
+            if packet.operation == FIN_ACK:
+                self._send_packet(packet.ack())
+                self.close_session()
+                self.__set_closed()
+        else:
+            self._Session__income_packet(packet)
+
+    def _send_packet(self, packet):
+        if not self.transport.is_closing():
+            self.transport.sendto(bytes(packet), self.address)
+
+    def _send_fragmentable(self, packet):
+        sock = self.transport.get_extra_info('socket')
+        if not self.pmtu_discovery or self.transport.is_closing():
+            return Session._send_fragmentable(self, packet)
+        allow_fragments(sock, True)
+        try:
+            self.transport.sendto(bytes(packet), self.address)
+        finally:
+            allow_fragments(sock, False)
+
+    def _route_mtu(self):
+        return Socket.path_mtu(self.address)
+
+    def __on_data(self, **args):
+        self.__data_ready.set()
+
+    def __on_drain(self, **args):
+        self.__drained.set()
+
+    def __set_closed(self):
+        if not self.session_closed:
+            self.session_closed = True
+            if self.close_started is not None:
+                self.metrics.closed(self.loop.time() - self.close_started)
+            self.stream.close()
+            self.__data_ready.set()
+            if not self.__closed.done():
+                self.__closed.set_result(True)
+            self.close_emitter.emit(session=self)
+
+    def _new_stream(self, stream_id):
+        return AsyncStream(self, stream_id)
+
+    def _stream_opened(self, stream):
+        self.incoming_streams.put_nowait(stream)
+
+    async def accept_stream(self):
+        """
+        Returns a stream opened by the peer, waiting until one is
+        :return: (AsyncStream) peer's stream, None once the session is closed
+        """
+        if self.session_closed:
+            return None
+        return await self.incoming_streams.get()
+
+    async def receive(self, length):
+        """
+        Returns received data, waiting until some arrives
+        :param length: max data length
+        :return: (bytes) data, empty once the session is closed
+        """
+        return await self._receive_on(self.default_stream, length)
+
+    async def receive_into(self, buffer):
+        """
+        Writes received data straight into a caller's buffer, waiting until some arrives
+        :param buffer: writable bytes-like object (bytearray, memoryview)
+        :return: (int) number of bytes written, 0 once the session is closed
+        """
+        return await self._receive_into_on(self.default_stream, buffer)
+
+    async def send(self, data, ttl=None, ordered=True):
+        """
+        Sends data to peer, waiting until congestion control released all of it
+        :param data: data to send
+        :param ttl: seconds the data is worth delivering, None to deliver it reliably
+        :param ordered: False to deliver the data as soon as it arrives, it must fit in a packet
+        """
+        await self._send_on(self.default_stream, data, ttl, ordered)
+
+    async def send_file(self, file, offset=0, count=None):
+        """
+        Sends a file, memory mapped and segmented without copies. The file must not change until the call returns
+        :param file: file path, or binary file object opened for reading
+        :param offset: position of the first byte to send
+        :param count: number of bytes to send, None up to the end of the file
+        :return: (int) number of bytes sent, returned once the peer acked all of them
+        """
+        return await self._send_file_on(self.default_stream, file, offset, count)
+
+    async def receive_to_file(self, file, length):
+        """
+        Writes received data straight into a file, waiting until all of it arrives
+        :param file: file path, or binary file object written from its current position
+        :param length: number of bytes to receive
+        :return: (int) number of bytes written, less than length if the session is closed
+        """
+        return await self._receive_file_on(self.default_stream, file, length)
+
+    async def _send_file_on(self, stream, file, offset=0, count=None):
+        source = FileSource(file, offset, count)
+        try:
+            for pointer in range(0, source.length, FILE_CHUNK_SIZE):
+                if self.session_closed:
+                    raise Exception("Data transfer failure: connection is closed")
+                self.__drained.clear()
+                self._enqueue(source.view[pointer:pointer + FILE_CHUNK_SIZE], stream)
+                await self.__wait_sent(stream)
+            if source.length:
+                # lost packets are resent from the map, it's closed once none can be
+                await self.__wait_acked(seq_add(self.next_sent_seq, -1))
+        finally:
+            source.close()
+        return source.length
+
+    async def _receive_file_on(self, stream, file, length):
+        sink = FileSink(file, length)
+        try:
+            sink.fill(stream.buffer)
+            stream.sink = sink
+            while not sink.complete() and not self.session_closed:
+                self.__data_ready.clear()
+                await self.__data_ready.wait()
+        finally:
+            stream.sink = None
+            sink.close()
+        return sink.written
+
+    async def _receive_on(self, stream, length):
+        while True:
+            data = stream.buffer.fetch(length, 0)
+            if data or stream.buffer.closed or self.session_closed:
+                return data
+            self.__data_ready.clear()
+            await self.__data_ready.wait()
+
+    async def _receive_into_on(self, stream, buffer):
+        while True:
+            length = stream.buffer.fetch_into(buffer, 0)
+            if length or stream.buffer.closed or self.session_closed:
+                return length
+            self.__data_ready.clear()
+            await self.__data_ready.wait()
+
+    async def _send_on(self, stream, data, ttl=None, ordered=True):
+        if self.session_closed:
+            raise Exception("Data transfer failure: connection is closed")
+        self.__drained.clear()
+        self._enqueue(data, stream, ttl, ordered, self.blocking)
+        if self.blocking:
+            await self.__wait_sent(stream)
+
+    async def __wait_sent(self, stream):
+        while not self._drained(stream):
+            await self.__drained.wait()
+            self.__drained.clear()
+
+    async def __wait_acked(self, seq_number):
+        while self.active and not self.awaiting_ack.released(seq_number):
+            self.__drained.clear()
+            try:
+                # acks only signal drained streams once every stream is, the timeout covers busy streams
+                await asyncio.wait_for(self.__drained.wait(), self.rtt.timeout())
+            except asyncio.TimeoutError:
+                pass
+
+    async def __wait_idle(self):
+        while self.active and not self._idle():
+            self.__drained.clear()
+            await self.__drained.wait()
+
+    async def close(self, timeout=DRAIN_TIMEOUT):
+        """
+        Closes session, FIN is sent once the queued data was acked
+        :param timeout: seconds the queued data may take to be acked, None to wait until all of it is
+        """
+        if self.session_closed:
+            return
+        self.close_started = self.loop.time()
+        try:
+            await asyncio.wait_for(self.__wait_idle(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        if self.session_closed:
+            # the peer closed meanwhile
+            return
+        self.closing_process = True
+        fin = Packet(seq=0, oper=FIN)
+        for attempt in range(FIN_ATTEMPTS):
+            self._send_packet(fin)
+            try:
+                await asyncio.wait_for(asyncio.shield(self.__closed), min(self.rtt.timeout(attempt), FIN_TIMEOUT))
+                return
+            except asyncio.TimeoutError:
+                continue
+        self.close_session()
+        self.__set_closed()
+        raise Exception('Connection close error: timeout error, peer did not respond')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
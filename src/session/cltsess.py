@@ -1,68 +1,122 @@
-import threading
+import threading, time
 from .session import Session
-from ..models.packet import Packet
-from ..models.constants import ACK, FIN, FIN_ACK, FIN_ATTEMPTS
+from ..models.constants import ACK, FIN, FIN_ACK, TIME_WAIT, DRAIN_TIMEOUT
+from ..sockets.reactor import default_reactor
 
 class ClientSession(Session):
     """
     Client's side session with server
     """
-    def __init__(self, address, client_seq, server_seq, socket_wrapper):
+    def __init__(self, address, client_seq, server_seq, socket_wrapper, reactor=None):
         """
         :param address: server's address
         :param client_seq: client's initial sequence number
         :param server_seq: server's initial sequence number
         :param socket_wrapper: socket wrapper
+        :param reactor: event loop reading the socket and firing session's timers (process-wide one by default)
         """
-        super().__init__(address, client_seq, server_seq)
-        self.run = False
+        self.reactor = reactor if reactor else default_reactor()
+        super().__init__(address, client_seq, server_seq, self.reactor.wheel)
+        self.run = True
         self.closing_process = False
+        # set once server acknowledged our FIN, and once the session stopped
+        self.fin_acked = threading.Event()
+        self.closed = threading.Event()
+        self.close_started = None
         self.__network = socket_wrapper
-        self.__network.select()
-        t = threading.Thread(target=self.__listen_for_packets, args=())
-        t.start()
+        self.pmtu_discovery = self.pmtu_discovery and socket_wrapper.pmtu_discovery
+        self.reactor.register(self.__network, self.__readable)
 
-    def __listen_for_packets(self):
+    def __readable(self):
         """
-        listen for income packets
+        Handles income packets, called by the reactor whenever the socket is readable
         """
-        self.run = True
-        while self.run:
-            self.__network.select()
-            if self.__network.is_readable():
-                packet, address = self.__network.read_packet()
-                if packet.operation == FIN:
+        if not self.run:
+            return
+        try:
+            packets = self.__network.read_packets()
+        except OSError:
+            return
+        for packet, address in packets:
+            if not packet.verify_checksum():
+                self.metrics.checksum_errors += 1
+                continue
+            if packet.operation == FIN:
+                self._send_packet(packet.ack())
+                if not self.closing_process:
                     self.closing_process = True
-                    self._send_packet(packet.ack())
-                elif packet.operation == ACK and self.closing_process:
-                    self.close_session()
-                    break
-                else:
-                    self._Session__income_packet(packet)
+                    # the server's final ACK may be lost
+                    self.scheduler.schedule(TIME_WAIT, self.__linger_expired)
+            elif packet.operation == FIN_ACK and self.close_started is not None:
+                self._fin_answered()
+                self._send_packet(packet.ack())
+                if not self.fin_acked.is_set():
+                    self.fin_acked.set()
+                    self.metrics.closed(time.monotonic() - self.close_started)
+                    print('Connection closed')
+                self.close_session()
+                self.__stop()
+                break
+            elif packet.operation == ACK and self.closing_process:
+                self.close_session()
+                self.__stop()
+                break
+            else:
+                self._Session__income_packet(packet)
 
-    def _send_packet(self, data):
-        self.__network.send(self.address, data)
+    def __stop(self):
+        if self.run:
+            self.run = False
+            self.reactor.unregister(self.__network)
+        self.closed.set()
 
-    def close(self):
+    def __linger_expired(self):
         """
-        closes session
+        Stops a session the server closed, its final ACK never came
         """
         self.close_session()
-        self.run = False
+        self.__stop()
 
-        fin = Packet(oper=FIN, seq=0)
-        self.__network.send(self.address, fin)
-        self.__network.set_timeout(3)
-        attempts = 0
-        while attempts < FIN_ATTEMPTS:
-            try:
-                attempts += 1
-                packet, address = self.__network.read_packet()
-                if packet.operation == FIN_ACK:
-                    self.__network.send(self.address, packet.ack())
-                    self.__network.set_timeout(None)
-                    print('Connection closed')
-                    break
-            except Exception as e:
-                if attempts >= FIN_ATTEMPTS:
-                    raise Exception('Connection close error: timeout error, server did not respond')
+    def __drained(self):
+        """
+        Sends FIN once the queued data was acked, or gave up on it
+        """
+        if self.closing_process or not self.active:
+            # the server closed meanwhile
+            self.__stop()
+            return
+        self._send_fin(self.__fin_expired)
+
+    def __fin_expired(self):
+        """
+        Stops the session once the server left our FINs unanswered
+        """
+        self.close_session()
+        self.__stop()
+
+    def _send_packet(self, data):
+        self.__network.send(self.address, data)
+
+    def _send_fragmentable(self, packet):
+        self.__network.send_fragmentable(self.address, packet)
+
+    def _send_packets(self, packets):
+        self.__network.send_batch(self.address, packets)
+
+    def _route_mtu(self):
+        return self.__network.path_mtu(self.address)
+
+    def close(self, wait=True, timeout=DRAIN_TIMEOUT):
+        """
+        closes session, FIN is sent once the queued data was acked and resent by the session's timers until the
+        server answers
+        :param wait: block until the server answered, False to return at once
+        :param timeout: seconds the queued data may take to be acked, None to wait until all of it is
+        """
+        if self.run and not self.closing_process and self.close_started is None:
+            self.close_started = time.monotonic()
+            self._drain(self.__drained, timeout)
+        if wait:
+            self.closed.wait()
+            if not self.fin_acked.is_set() and self.close_started is not None:
+                raise Exception('Connection close error: timeout error, server did not respond')
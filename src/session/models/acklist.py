@@ -1,83 +1,220 @@
-import time, threading
+import threading, time
 from ...models.event import EventEmitter
-from ...models.constants import RESEND_ATTEMPTS, ACK_TIMEOUT
+from ...models.sequence import seq_add, seq_diff
+from ...models.constants import RESEND_ATTEMPTS
+from .timer import default_wheel
+from .rtt import RttEstimator
 
 class AckList:
     """
-    Stores packets awaiting for acknowledgment
+    Sliding window of sent packets awaiting for acknowledgment, ordered by sequence number
     """
-    def __init__(self):
-        self.packets = {}
+    def __init__(self, initial_seq, scheduler=None, rtt=None):
+        """
+        :param initial_seq: sequence number of the first packet to be sent
+        :param scheduler: timer wheel running the retransmission timers (process-wide wheel by default)
+        :param rtt: session's RTT estimator providing the retransmission timeout
+        """
+        # window[i] holds [packet, timer, send time, transmissions, deadline, size] for sequence number base + i,
+        # or None once released
+        self.base = initial_seq
+        self.window = []
+        self.in_flight = 0
+        # data bytes of the packets in flight, counted against the receiver's window
+        self.bytes_in_flight = 0
         self.lost_packets = 0
         self.resend_emitter = EventEmitter()
+        self.drop_emitter = EventEmitter()
+        self.abandon_emitter = EventEmitter()
+        self.scheduler = scheduler if scheduler else default_wheel()
+        self.rtt = rtt if rtt else RttEstimator()
         self.locker = threading.Lock()
         self.active = True
 
-    def new_packet(self, packet):
+    def new_packet(self, packet, deadline=None, size=None):
         """
         adds new sent packet to ack list
-        :param packet: new sent packet
+        :param packet: new sent packet, its sequence number follows the previous packet's
+        :param deadline: time.monotonic() after which the packet isn't resent anymore, None to resend it until
+        all attempts are made
+        :param size: data bytes the packet delivers, its payload size by default
         :return:
         """
+        size = packet.payload_size if size is None else size
+        with self.locker:
+            if not self.window:
+                self.base = packet.seq_number
+            timer = self.scheduler.schedule(self.rtt.timeout(), self.run_timeout, packet.seq_number, 0)
+            self.window.append([packet, timer, time.monotonic(), 1, deadline, size])
+            self.in_flight += 1
+            self.bytes_in_flight += size
+
+    def __index(self, seq_number):
+        """
+        Returns packet's index in the window, or None if it is out of the window
+        """
+        index = seq_diff(seq_number, self.base)
+        if 0 <= index < len(self.window):
+            return index
+        return None
+
+    def __release(self, index):
+        """
+        Releases a window entry and cancels its timer. Must be called while holding the lock
+        """
+        entry = self.window[index]
+        if entry:
+            entry[1].cancel()
+            self.window[index] = None
+            self.in_flight -= 1
+            self.bytes_in_flight -= entry[5]
+
+    def __trim(self, count=0):
+        """
+        Slides the window past the first count entries and any released entries that follow
+        """
+        while count < len(self.window) and self.window[count] is None:
+            count += 1
+        if count:
+            del self.window[:count]
+            self.base = seq_add(self.base, count)
+
+    def span(self, seq_number):
+        """
+        Returns how far a sequence number is past the oldest packet awaiting ack, 0 if none is
+        :param seq_number: sequence number, typically the next one to be sent
+        """
         with self.locker:
-            self.packets[packet.ack_number] = packet
-        t = threading.Thread(target=self.run_timeout, args=(packet.ack_number, RESEND_ATTEMPTS, ACK_TIMEOUT,))
-        t.start()
+            return seq_diff(seq_number, self.base) if self.window else 0
 
-    def resend_packet(self, ack_number):
+    def released(self, seq_number):
+        """
+        Returns whether every packet up to a sequence number was acked or given up
+        :param seq_number: sequence number of a sent packet
+        """
+        with self.locker:
+            return not self.window or seq_diff(self.base, seq_number) > 0
+
+    def resend_packet(self, seq_number):
         """
         Resend a packet
-        :param ack_number: packet's ack number
+        :param seq_number: packet's sequence number
         """
         with self.locker:
-            self.resend_emitter.emit(pkt=self.packets[ack_number])
+            index = self.__index(seq_number)
+            entry = self.window[index] if index is not None else None
+            if entry:
+                entry[2] = time.monotonic()
+                entry[3] += 1
+        if entry:
+            self.resend_emitter.emit(pkt=entry[0])
 
-    def drop_packet(self, ack_number):
+    def drop_packet(self, seq_number):
         """
         Drops a packet if ack hasn't been received within timeout
-        :param ack_number: packet's ack number
+        :param seq_number: packet's sequence number
         """
         with self.locker:
-            del self.packets[ack_number]
-        self.lost_packets += 1
+            index = self.__index(seq_number)
+            if index is None or not self.window[index]:
+                return
+            packet = self.window[index][0]
+            self.__release(index)
+            self.lost_packets += 1
+            self.__trim()
+        self.drop_emitter.emit(seq=seq_number, pkt=packet)
 
-    def confirm_ack(self, ack_number):
+    def confirm_ack(self, seq_number):
         """
-        Confirms packet delivery
-        :param ack_number: packet's ack number
+        Confirms a single packet delivery
+        :param seq_number: packet's sequence number
         :return:
         """
         with self.locker:
-            if ack_number in self.packets:
-                del self.packets[ack_number]
+            index = self.__index(seq_number)
+            if index is not None:
+                self.__release(index)
+                self.__trim()
 
-    def run_timeout(self, ack_number, total_attempts, timeout):
+    def confirm_range(self, cumulative, blocks=()):
+        """
+        Confirms delivery of every packet before the cumulative ack and of every selectively acked block
+        :param cumulative: next sequence number expected by the receiver
+        :param blocks: list of (start, end) sequence ranges received out of order, end exclusive
+        :return: (tuple) number of newly acknowledged packets, their data bytes and an RTT sample or None
         """
-        Runs packet's ack timeout
-        :param ack_number: packet's ack number
-        :param total_attempts: max resending attempts to
-        :param timeout: max time to wait
+        with self.locker:
+            in_flight = self.in_flight
+            bytes_in_flight = self.bytes_in_flight
+            sample = None
+            count = min(max(seq_diff(cumulative, self.base), 0), len(self.window))
+            ranges = [(0, count)]
+            for start, end in blocks:
+                ranges.append((max(seq_diff(start, self.base), 0), min(seq_diff(end, self.base), len(self.window))))
+            for first, last in ranges:
+                for index in range(first, last):
+                    entry = self.window[index]
+                    if entry:
+                        # samples of resent packets are ambiguous and ignored (Karn's algorithm)
+                        if entry[3] == 1 and (sample is None or entry[2] > sample):
+                            sample = entry[2]
+                        self.__release(index)
+            self.__trim(count)
+            acked = in_flight - self.in_flight
+            size = bytes_in_flight - self.bytes_in_flight
+            if sample is not None:
+                sample = time.monotonic() - sample
+                self.rtt.sample(sample)
+        return acked, size, sample
+
+    def run_timeout(self, seq_number, attempts):
+        """
+        Fired by the scheduler when packet's ack timeout expires
+        :param seq_number: packet's sequence number
+        :param attempts: resending attempts made so far
         :return:
         """
-        seconds = 0
-        attempts = 0
-        while self.active:
-            with self.locker:
-                if ack_number not in self.packets:
-                    break
-            if seconds < timeout:
-                time.sleep(1)
-                seconds += 1
-            elif attempts < total_attempts:
-                self.resend_packet(ack_number)
-                seconds = 0
-                attempts += 1
+        packet = abandoned = dropped = None
+        timeouts = attempts + 1
+        with self.locker:
+            index = self.__index(seq_number)
+            if not self.active or index is None or not self.window[index]:
+                return
+            entry = self.window[index]
+            if entry[4] is not None and time.monotonic() >= entry[4]:
+                # expired data isn't worth resending
+                abandoned = entry[0]
+                self.__release(index)
+                self.__trim()
+            elif attempts < RESEND_ATTEMPTS:
+                packet = entry[0]
+                entry[1] = self.scheduler.schedule(self.rtt.timeout(attempts + 1), self.run_timeout,
+                                                   seq_number, attempts + 1)
+                entry[2] = time.monotonic()
+                entry[3] += 1
             else:
-                self.drop_packet(ack_number)
-                break
+                dropped = entry[0]
+                self.__release(index)
+                self.lost_packets += 1
+                self.__trim()
+
+        # resend outside the lock so the network write never blocks acks
+        if packet:
+            self.resend_emitter.emit(pkt=packet, timeouts=timeouts)
+        elif abandoned:
+            self.abandon_emitter.emit(pkt=abandoned)
+        else:
+            self.drop_emitter.emit(seq=seq_number, pkt=dropped)
 
     def close(self):
-        self.active = False
+        with self.locker:
+            self.active = False
+            for entry in self.window:
+                if entry:
+                    entry[1].cancel()
+            self.window = []
+            self.in_flight = 0
+            self.bytes_in_flight = 0
 
     def get_lost_packets(self):
-        return self.lost_packets
\ No newline at end of file
+        return self.lost_packets
@@ -0,0 +1,57 @@
+import zlib
+from ...models.constants import COMPRESSION_MIN_SIZE, COMPRESSION_MIN_SAVING, COMPRESSION_BACKOFF, \
+    COMPRESSION_MAX_BACKOFF
+
+
+class Compressor:
+    """
+    Per segment zlib compression. Segments that don't compress are sent as they are, and make the compressor
+    skip the following ones for a while, so already compressed data doesn't waste CPU
+    """
+    def __init__(self, level):
+        """
+        :param level: zlib compression level, 1 (fastest) to 9 (smallest)
+        """
+        self.level = level
+        # segments left to send uncompressed, and the next backoff
+        self.skip = 0
+        self.backoff = COMPRESSION_BACKOFF
+        self.saved = 0
+
+    def compress(self, payload):
+        """
+        Compresses a segment if it's worth it
+        :param payload: bytes-like segment
+        :return: (tuple) payload to send and whether it's compressed
+        """
+        size = len(payload)
+        if size < COMPRESSION_MIN_SIZE:
+            return payload, False
+        if self.skip > 0:
+            self.skip -= 1
+            return payload, False
+        compressed = zlib.compress(payload, self.level)
+        if len(compressed) > size * (1 - COMPRESSION_MIN_SAVING):
+            self.skip = self.backoff
+            self.backoff = min(self.backoff * 2, COMPRESSION_MAX_BACKOFF)
+            return payload, False
+        self.backoff = COMPRESSION_BACKOFF
+        self.saved += size - len(compressed)
+        return compressed, True
+
+
+def decompress(payload, limit):
+    """
+    Decompresses a segment
+    :param payload: compressed segment
+    :param limit: max segment size, larger output is rejected
+    :return: (bytes) segment, None if it's invalid
+    """
+    decompressor = zlib.decompressobj()
+    try:
+        data = decompressor.decompress(payload, limit)
+    except zlib.error:
+        return None
+    if not decompressor.eof or decompressor.unconsumed_tail or decompressor.unused_data:
+        return None
+    return data
@@ -0,0 +1,148 @@
+import time
+from ...models.constants import INITIAL_CWND, MIN_CWND, MAX_CWND, PACING_GAIN, ACK_TIMEOUT
+
+
+class CongestionControl:
+    """
+    Abstract congestion control algorithm. The congestion window is counted in packets
+    """
+    name = None
+
+    def __init__(self):
+        self.cwnd = float(INITIAL_CWND)
+        self.ssthresh = float(MAX_CWND)
+        self.recovery_start = 0.0
+        self.srtt = None
+
+    def window(self):
+        """
+        Returns the number of packets allowed in flight
+        """
+        return max(MIN_CWND, min(int(self.cwnd), MAX_CWND))
+
+    def pacing_rate(self):
+        """
+        Returns the pacing rate in packets per second, spreading a window over one RTT
+        """
+        rtt = self.srtt if self.srtt else ACK_TIMEOUT
+        if not rtt:
+            return None
+        return PACING_GAIN * max(self.cwnd, MIN_CWND) / rtt
+
+    def on_ack(self, acked, srtt=None):
+        """
+        Called when new packets are acknowledged
+        :param acked: number of newly acknowledged packets
+        :param srtt: session's smoothed round trip time, if measured
+        """
+        if srtt is not None:
+            self.srtt = srtt
+        if self.cwnd < self.ssthresh:
+            self.cwnd = min(self.cwnd + acked, MAX_CWND)
+        else:
+            self._increase(acked)
+
+    def on_loss(self):
+        """
+        Called when a packet is resent. The window is reduced at most once per RTT
+        """
+        now = time.monotonic()
+        if now - self.recovery_start < (self.srtt or ACK_TIMEOUT):
+            return
+        self.recovery_start = now
+        self._decrease()
+
+    def on_timeout(self):
+        """
+        Called when a packet is dropped after all resend attempts
+        """
+        self.ssthresh = max(self.cwnd / 2, MIN_CWND)
+        self.cwnd = float(MIN_CWND)
+        self.recovery_start = time.monotonic()
+
+    def _increase(self, acked): pass
+
+    def _decrease(self): pass
+
+
+class NewReno(CongestionControl):
+    """
+    NewReno style additive increase, multiplicative decrease
+    """
+    name = 'newreno'
+
+    def _increase(self, acked):
+        self.cwnd = min(self.cwnd + acked / self.cwnd, MAX_CWND)
+
+    def _decrease(self):
+        self.ssthresh = max(self.cwnd / 2, MIN_CWND)
+        self.cwnd = self.ssthresh
+
+
+class Cubic(CongestionControl):
+    """
+    CUBIC window growth (RFC 8312), independent of RTT
+    """
+    name = 'cubic'
+    C = 0.4
+    BETA = 0.7
+
+    def __init__(self):
+        super().__init__()
+        self.w_max = 0.0
+        self.k = 0.0
+        self.epoch_start = None
+        self.w_est = 0.0
+
+    def _increase(self, acked):
+        now = time.monotonic()
+        if self.epoch_start is None:
+            self.epoch_start = now
+            if self.cwnd < self.w_max:
+                self.k = ((self.w_max - self.cwnd) / self.C) ** (1 / 3)
+            else:
+                self.k = 0.0
+                self.w_max = self.cwnd
+            self.w_est = self.cwnd
+        elapsed = now - self.epoch_start + (self.srtt or 0)
+        target = self.C * (elapsed - self.k) ** 3 + self.w_max
+        # TCP friendly region
+        self.w_est += 3 * (1 - self.BETA) / (1 + self.BETA) * acked / self.cwnd
+        target = max(target, self.w_est)
+        if target > self.cwnd:
+            self.cwnd = min(self.cwnd + (target - self.cwnd) / self.cwnd * acked, MAX_CWND)
+        else:
+            self.cwnd = min(self.cwnd + 0.01 * acked / self.cwnd, MAX_CWND)
+
+    def _decrease(self):
+        self.epoch_start = None
+        # fast convergence
+        if self.cwnd < self.w_max:
+            self.w_max = self.cwnd * (1 + self.BETA) / 2
+        else:
+            self.w_max = self.cwnd
+        self.ssthresh = max(self.cwnd * self.BETA, MIN_CWND)
+        self.cwnd = self.ssthresh
+
+    def on_timeout(self):
+        self.epoch_start = None
+        self.w_max = self.cwnd
+        super().on_timeout()
+
+
+CONGESTION_CONTROLS = {
+    NewReno.name: NewReno,
+    Cubic.name: Cubic,
+}
+
+
+def create_congestion_control(algorithm):
+    """
+    Creates a congestion control instance
+    :param algorithm: algorithm's name or a CongestionControl subclass
+    """
+    if isinstance(algorithm, str):
+        if algorithm not in CONGESTION_CONTROLS:
+            raise Exception('Congestion control error: unknown algorithm {}'.format(algorithm))
+        algorithm = CONGESTION_CONTROLS[algorithm]
+    return algorithm()
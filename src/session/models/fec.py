@@ -0,0 +1,270 @@
+import collections, struct
+from ...models.packet import Packet
+from ...models.sequence import seq_add, seq_diff
+from ...models.constants import PAYLOAD, PARITY, FLAG_ACK, FEC_MAX_GROUP, FEC_MAX_PARITY, FEC_LOSS_GAIN, \
+    FEC_LOSS_MARGIN
+
+# a source symbol is a payload packet's stream id, stream sequence number, flags and payload size, followed by
+# its payload. Parity payloads start with the group size, the number of parity packets and their index
+_SYMBOL = struct.Struct("!H I B H")
+_PARITY = struct.Struct("!B B B")
+# payload bytes a parity packet takes beyond the largest payload of its group
+FEC_OVERHEAD = _SYMBOL.size + _PARITY.size
+
+# GF(256) arithmetic over the 0x11d polynomial, a multiplication by a constant is a bytes.translate() table
+_EXP = [0] * 512
+_LOG = [0] * 256
+_value = 1
+for _power in range(255):
+    _EXP[_power] = _value
+    _LOG[_value] = _power
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11d
+for _power in range(255, 512):
+    _EXP[_power] = _EXP[_power - 255]
+
+
+def _mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+
+def _inv(a):
+    return _EXP[255 - _LOG[a]]
+
+
+_MUL = [bytes(_mul(factor, value) for value in range(256)) for factor in range(256)]
+
+
+def _coefficient(row, column):
+    """
+    Returns the coefficient of a source in a parity. The matrix is a Cauchy matrix, 1 / (x_row + y_column) with
+    x_row = 255 - row and y_column = column, whose columns are scaled so the first parity is a plain XOR of the
+    sources. Any square submatrix stays invertible, so any group sources missing up to the number of parity
+    packets received are rebuilt
+    """
+    return _mul(255 ^ column, _inv((255 - row) ^ column))
+
+
+def _scaled(symbol, factor):
+    """
+    Returns a symbol multiplied by a GF(256) constant, as a little endian integer so symbols are added with ^.
+    Shorter symbols are implicitly padded with zeros
+    """
+    if factor != 1:
+        symbol = symbol.translate(_MUL[factor])
+    return int.from_bytes(symbol, 'little')
+
+
+def _invert(matrix):
+    """
+    Inverts a square GF(256) matrix by Gauss-Jordan elimination
+    :param matrix: list of rows
+    :return: list of rows of the inverse, None if the matrix is singular
+    """
+    size = len(matrix)
+    rows = [list(row) + [int(index == column) for column in range(size)] for index, row in enumerate(matrix)]
+    for column in range(size):
+        pivot = next((index for index in range(column, size) if rows[index][column]), None)
+        if pivot is None:
+            return None
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        factor = _inv(rows[column][column])
+        rows[column] = [_mul(factor, value) for value in rows[column]]
+        for index in range(size):
+            if index != column and rows[index][column]:
+                factor = rows[index][column]
+                rows[index] = [value ^ _mul(factor, pivot_value)
+                               for value, pivot_value in zip(rows[index], rows[column])]
+    return [row[size:] for row in rows]
+
+
+def _symbol(packet):
+    return _SYMBOL.pack(packet.stream_id, packet.stream_seq, packet.flags & ~FLAG_ACK, packet.payload_size) + \
+        bytes(packet.payload)
+
+
+class FecEncoder:
+    """
+    Forward error correction of outgoing payloads. Every group of consecutive payload packets is followed by
+    parity packets, Reed-Solomon coded over GF(256); a single parity packet is the XOR of the group. Parity
+    packets are neither acked nor resent
+    """
+    def __init__(self, group, parity=None):
+        """
+        :param group: payload packets per group
+        :param parity: parity packets per group, None to adapt them to the loss rate
+        """
+        if not 0 < group <= FEC_MAX_GROUP:
+            raise Exception('FEC error: groups are limited to {} packets'.format(FEC_MAX_GROUP))
+        if parity is not None and not 0 < parity <= FEC_MAX_PARITY:
+            raise Exception('FEC error: groups are limited to {} parity packets'.format(FEC_MAX_PARITY))
+        self.group = group
+        self.parity = parity
+        self.first = None
+        self.symbols = []
+        # retransmissions during the current group, and their average rate per payload packet
+        self.losses = 0
+        self.loss_rate = 0.0
+
+    def add(self, packet):
+        """
+        Adds a sent payload packet to the current group
+        :param packet: payload packet, as sent
+        :return: (list) parity packets to send, once the group is complete
+        """
+        parity = []
+        if self.symbols and packet.seq_number != seq_add(self.first, len(self.symbols)):
+            parity = self.flush()
+        if not self.symbols:
+            self.first = packet.seq_number
+        self.symbols.append(_symbol(packet))
+        if len(self.symbols) >= self.group:
+            parity += self.flush()
+        return parity
+
+    def flush(self):
+        """
+        Closes the current group, complete or not
+        :return: (list) parity packets of the group
+        """
+        if not self.symbols:
+            return []
+        count = self.parities()
+        size = max(len(symbol) for symbol in self.symbols)
+        parity = []
+        for row in range(count):
+            value = 0
+            for column, symbol in enumerate(self.symbols):
+                value ^= _scaled(symbol, _coefficient(row, column))
+            parity.append(Packet(seq=self.first, oper=PARITY, ack=0,
+                                 payload=_PARITY.pack(len(self.symbols), count, row) +
+                                 value.to_bytes(size, 'little')))
+        self.loss_rate += (self.losses / len(self.symbols) - self.loss_rate) * FEC_LOSS_GAIN
+        self.losses = 0
+        self.symbols = []
+        return parity
+
+    def parities(self):
+        """
+        Returns the number of parity packets of the current group
+        """
+        if self.parity is not None:
+            return self.parity
+        needed = int(self.group * self.loss_rate * FEC_LOSS_MARGIN + 0.999)
+        return max(1, min(needed, FEC_MAX_PARITY))
+
+    def on_loss(self):
+        """
+        Counts a retransmission, a loss parity packets didn't make up for
+        """
+        self.losses += 1
+
+
+class FecDecoder:
+    """
+    Rebuilds lost payload packets from the received packets of their group and its parity packets
+    """
+    def __init__(self):
+        # recently received source symbols by sequence number, in arrival order
+        self.symbols = {}
+        self.arrivals = collections.deque()
+        # groups waiting for more packets, by their first sequence number: [size, {parity index: parity}]
+        self.groups = {}
+        self.recovered = 0
+
+    def add_source(self, packet, base):
+        """
+        Keeps a received payload packet for the groups it belongs to
+        :param packet: verified payload packet, as received
+        :param base: next sequence number the session expects
+        :return: (list) payload packets the packet let rebuild
+        """
+        if packet.seq_number in self.symbols:
+            return []
+        self.symbols[packet.seq_number] = _symbol(packet)
+        self.arrivals.append(packet.seq_number)
+        self.__prune(base)
+        for first, group in list(self.groups.items()):
+            if 0 <= seq_diff(packet.seq_number, first) < group[0]:
+                return self.__decode(first)
+        return []
+
+    def add_parity(self, packet, base):
+        """
+        Adds a received parity packet to its group
+        :param packet: verified parity packet
+        :param base: next sequence number the session expects
+        :return: (list) payload packets rebuilt
+        """
+        if packet.payload_size <= _PARITY.size:
+            return []
+        size, count, row = _PARITY.unpack_from(packet.payload)
+        first = packet.seq_number
+        if not size or size > FEC_MAX_GROUP or count > FEC_MAX_PARITY or row >= count:
+            # no encoder sends such a group, a rogue parity packet could make the matrix singular
+            return []
+        if seq_diff(seq_add(first, size), base) <= 0:
+            # every packet of the group was received or given up on
+            return []
+        self.__prune(base)
+        group = self.groups.setdefault(first, [size, {}])
+        group[1][row] = bytes(packet.payload[_PARITY.size:])
+        return self.__decode(first)
+
+    def __decode(self, first):
+        """
+        Rebuilds the missing packets of a group once it has as many parity packets
+        """
+        size, parity = self.groups[first]
+        missing = [column for column in range(size) if seq_add(first, column) not in self.symbols]
+        if not missing:
+            del self.groups[first]
+            return []
+        if len(missing) > len(parity):
+            return []
+        del self.groups[first]
+        rows = sorted(parity)[:len(missing)]
+        length = max(len(parity[row]) for row in rows)
+        # parity minus the received sources leaves a linear combination of the missing ones
+        remainders = []
+        for row in rows:
+            value = int.from_bytes(parity[row], 'little')
+            for column in range(size):
+                symbol = self.symbols.get(seq_add(first, column))
+                if symbol is not None:
+                    value ^= _scaled(symbol, _coefficient(row, column))
+            remainders.append(value.to_bytes(length, 'little'))
+        inverse = _invert([[_coefficient(row, column) for column in missing] for row in rows])
+        if inverse is None:
+            # parity packets of inconsistent groups, the group is given up on
+            return []
+        packets = []
+        for index, column in enumerate(missing):
+            value = 0
+            for remainder, factor in zip(remainders, inverse[index]):
+                if factor:
+                    value ^= _scaled(remainder, factor)
+            symbol = value.to_bytes(length, 'little')
+            stream_id, stream_seq, flags, payload_size = _SYMBOL.unpack_from(symbol)
+            if payload_size > length - _SYMBOL.size:
+                continue
+            seq_number = seq_add(first, column)
+            self.symbols[seq_number] = symbol[:_SYMBOL.size + payload_size]
+            self.arrivals.append(seq_number)
+            packets.append(Packet(seq=seq_number, oper=PAYLOAD, ack=0, flags=flags, stream=stream_id,
+                                  stream_seq=stream_seq, payload=symbol[_SYMBOL.size:_SYMBOL.size + payload_size]))
+        self.recovered += len(packets)
+        return packets
+
+    def __prune(self, base):
+        """
+        Forgets sources too old to belong to a group still waiting, and groups that are complete
+        """
+        while self.arrivals and seq_diff(self.arrivals[0], base) < -FEC_MAX_GROUP:
+            self.symbols.pop(self.arrivals.popleft(), None)
+        for first, group in list(self.groups.items()):
+            if seq_diff(seq_add(first, group[0]), base) <= 0:
+                del self.groups[first]
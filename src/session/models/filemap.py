@@ -0,0 +1,163 @@
+import mmap, os, threading
+
+
+def open_file(file, mode):
+    """
+    Returns a file object and whether it was opened here
+    :param file: file path, or binary file object
+    :param mode: mode a path is opened with
+    """
+    if isinstance(file, (str, bytes, os.PathLike)):
+        return open(file, mode), True
+    return file, False
+
+
+class FileSource:
+    """
+    Read only memory map of a file range. Slices of the view are payloads sent without being copied,
+    the file is paged in by the kernel as they are sent and never held in memory as a whole
+    """
+    def __init__(self, file, offset=0, count=None):
+        """
+        :param file: file path, or binary file object opened for reading
+        :param offset: position of the first byte to send
+        :param count: number of bytes to send, None up to the end of the file
+        """
+        self.file, self.owned = open_file(file, 'rb')
+        try:
+            size = os.fstat(self.file.fileno()).st_size
+            if offset < 0 or offset > size:
+                raise Exception('Send file error: offset {} is out of the file'.format(offset))
+            self.length = size - offset if count is None else min(count, size - offset)
+            self.map = None
+            self.view = memoryview(b'')
+            if self.length > 0:
+                # a map starts at a multiple of the allocation granularity
+                start = offset - offset % mmap.ALLOCATIONGRANULARITY
+                self.map = mmap.mmap(self.file.fileno(), offset - start + self.length, access=mmap.ACCESS_READ,
+                                     offset=start)
+                if hasattr(self.map, 'madvise'):
+                    self.map.madvise(mmap.MADV_SEQUENTIAL)
+                self.view = memoryview(self.map)[offset - start:]
+        except BaseException:
+            if self.owned:
+                self.file.close()
+            raise
+
+    def close(self):
+        self.view.release()
+        if self.map:
+            try:
+                self.map.close()
+            except BufferError:
+                # packets of a closed session may still refer to the map, it's unmapped once they are gone
+                pass
+        if self.owned:
+            self.file.close()
+
+
+class FileSink:
+    """
+    Destination of a stream's in order data. Payloads are copied straight into a memory map of the file,
+    or written to it when it can't be mapped (write only files, pipes)
+    """
+    def __init__(self, file, length):
+        """
+        :param file: file path, or binary file object the data is written to from its current position
+        :param length: number of bytes to receive
+        """
+        self.file, self.owned = open_file(file, 'w+b')
+        self.length = length
+        self.written = 0
+        self.interrupted = False
+        self.lock = threading.Lock()
+        self.done = threading.Condition(self.lock)
+        self.map = None
+        self.view = None
+        self.offset = None
+        self.size = None
+        if length > 0:
+            try:
+                self.__map()
+            except (OSError, ValueError):
+                self.map = self.view = None
+
+    def __map(self):
+        self.file.flush()
+        self.offset = self.file.tell()
+        fd = self.file.fileno()
+        end = self.offset + self.length
+        self.size = os.fstat(fd).st_size
+        if self.size < end:
+            os.ftruncate(fd, end)
+        start = self.offset - self.offset % mmap.ALLOCATIONGRANULARITY
+        self.map = mmap.mmap(fd, end - start, access=mmap.ACCESS_WRITE, offset=start)
+        self.view = memoryview(self.map)[self.offset - start:]
+
+    def write(self, data):
+        """
+        Writes a payload
+        :param data: bytes-like payload
+        :return: (int) number of bytes taken, less than the payload's length once the sink is full
+        """
+        with self.lock:
+            length = min(len(data), self.length - self.written)
+            if length:
+                with memoryview(data) as payload:
+                    if self.view is not None:
+                        self.view[self.written:self.written + length] = payload[:length]
+                    else:
+                        self.file.write(payload[:length])
+                self.written += length
+                if self.written == self.length:
+                    self.done.notify_all()
+            return length
+
+    def fill(self, stream):
+        """
+        Moves data received before the sink was attached
+        :param stream: (ByteStream) stream's buffer
+        """
+        if self.view is not None:
+            with self.lock, self.view[self.written:self.length] as target:
+                self.written += stream.fetch_into(target, 0)
+        else:
+            self.write(stream.fetch(self.length - self.written, 0))
+
+    def complete(self):
+        return self.written == self.length
+
+    def wait(self, timeout=None):
+        """
+        Waits until all the data is written, or the sink is interrupted
+        :param timeout: seconds to wait, None blocks until done
+        :return: (int) number of bytes written
+        """
+        with self.lock:
+            self.done.wait_for(lambda: self.interrupted or self.written == self.length, timeout)
+            return self.written
+
+    def interrupt(self):
+        """
+        Wakes up the waiting receiver, the session is closed
+        """
+        with self.lock:
+            self.interrupted = True
+            self.done.notify_all()
+
+    def close(self):
+        """
+        Flushes written data and releases the file, a file object is left positioned after it
+        """
+        if self.map:
+            self.view.release()
+            self.map.flush()
+            self.map.close()
+            if self.written < self.length:
+                # drops the unwritten part the file was extended by
+                os.ftruncate(self.file.fileno(), max(self.size, self.offset + self.written))
+            self.file.seek(self.offset + self.written)
+        else:
+            self.file.flush()
+        if self.owned:
+            self.file.close()
@@ -0,0 +1,33 @@
+import time
+from ...models.constants import PACING_BURST
+
+
+class Pacer:
+    """
+    Spreads packet sends over time at the congestion controller's rate
+    """
+    def __init__(self, burst=PACING_BURST):
+        """
+        :param burst: packets allowed back to back after an idle period
+        """
+        self.burst = burst
+        self.next_send = 0.0
+
+    def delay(self, now=None):
+        """
+        Returns seconds to wait before the next packet may be sent
+        """
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.next_send - now)
+
+    def on_send(self, rate, now=None):
+        """
+        Accounts a sent packet
+        :param rate: pacing rate in packets per second, None disables pacing
+        """
+        if not rate:
+            return
+        now = time.monotonic() if now is None else now
+        interval = 1.0 / rate
+        # credit gathered while idle never exceeds a burst, this packet included
+        self.next_send = max(self.next_send, now - (self.burst - 1) * interval) + interval
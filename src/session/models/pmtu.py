@@ -0,0 +1,121 @@
+from ...models.packet import Packet, generate_id
+from ...models.event import EventEmitter
+from ...models.constants import PROBE, BASE_PLPMTU, MAX_PLPMTU, PMTU_PROBE_ATTEMPTS, PMTU_SEARCH_GRANULARITY, \
+    IP_UDP_OVERHEAD, PACKET_HEADER_SIZE, PMTU_BLACK_HOLE_TIMEOUTS
+
+
+class PathMtu:
+    """
+    Packetization layer path MTU discovery (RFC 8899). Padded PROBE packets search for the largest
+    datagram the path delivers unfragmented; confirmed sizes are announced by update_emitter. Once the search
+    is over, repeated timeouts of full sized packets start it over from BASE_PLPMTU
+    """
+    def __init__(self, send, scheduler, rtt):
+        """
+        :param send: method sending a packet to the peer
+        :param scheduler: timer scheduler of probe timeouts
+        :param rtt: session's RTT estimator
+        """
+        self.send = send
+        self.scheduler = scheduler
+        self.rtt = rtt
+        self.low = BASE_PLPMTU
+        self.high = MAX_PLPMTU
+        self.route_mtu = None
+        self.probe_size = None
+        self.probe_id = None
+        self.attempts = 0
+        self.timer = None
+        self.active = False
+        self.update_emitter = EventEmitter()
+
+    def start(self, current, route_mtu=None):
+        """
+        Starts searching
+        :param current: IP packet size already in use
+        :param route_mtu: MTU of the local route to the peer, when known
+        """
+        self.route_mtu = route_mtu
+        self.high = min(route_mtu, MAX_PLPMTU) if route_mtu else MAX_PLPMTU
+        self.low = min(max(current, BASE_PLPMTU), self.high)
+        if self.low != current:
+            self.update_emitter.emit(mtu=self.low)
+        self.active = True
+        self.__probe()
+
+    def stop(self):
+        self.active = False
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+    def __probe(self):
+        """
+        Sends a probe halfway between the confirmed and the failed sizes
+        """
+        if not self.active:
+            return
+        if self.high - self.low < PMTU_SEARCH_GRANULARITY:
+            # searched, losses of full sized packets are watched from now on
+            self.probe_id = None
+            return
+        if self.attempts == 0:
+            self.probe_size = (self.low + self.high + 1) // 2
+        self.probe_id = generate_id()
+        padding = bytes(self.probe_size - IP_UDP_OVERHEAD - PACKET_HEADER_SIZE)
+        try:
+            self.send(Packet(seq=self.probe_size, oper=PROBE, ack=self.probe_id, payload=padding))
+        except OSError:
+            # larger than the local interface allows
+            self.__failed()
+            return
+        self.attempts += 1
+        self.timer = self.scheduler.schedule(self.rtt.timeout(), self.__probe_timeout, self.probe_id)
+
+    def __probe_timeout(self, probe_id):
+        if not self.active or probe_id != self.probe_id:
+            return
+        self.timer = None
+        if self.attempts >= PMTU_PROBE_ATTEMPTS:
+            self.__failed()
+        else:
+            self.__probe()
+
+    def __failed(self):
+        self.high = self.probe_size - 1
+        self.attempts = 0
+        self.__probe()
+
+    def on_probe_ack(self, packet):
+        """
+        Handles an acknowledged probe
+        :param packet: PROBE_ACK packet
+        """
+        if not self.active or packet.ack_number != self.probe_id:
+            return
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        self.low = self.probe_size
+        self.attempts = 0
+        self.update_emitter.emit(mtu=self.low)
+        self.__probe()
+
+    def on_timeout(self, size, timeouts):
+        """
+        Detects a black hole (RFC 8899 section 4.3): a packet as large as the confirmed size timing out
+        PMTU_BLACK_HOLE_TIMEOUTS times in a row means the path doesn't deliver that size anymore. Packets are sized
+        BASE_PLPMTU again and the search starts over below the lost size
+        :param size: IP packet size of the packet resent on timeout
+        :param timeouts: timeouts of the packet so far
+        """
+        if not self.active or self.probe_id is not None or timeouts < PMTU_BLACK_HOLE_TIMEOUTS:
+            return
+        if not BASE_PLPMTU < size <= self.low:
+            # smaller packets get through black holes, and larger ones were sent before the size dropped
+            return
+        self.low = BASE_PLPMTU
+        self.high = size - 1
+        self.attempts = 0
+        self.update_emitter.emit(mtu=self.low)
+        self.__probe()
@@ -0,0 +1,104 @@
+from ...models.sequence import seq_add, seq_diff
+from ...models.constants import RECEIVE_WINDOW
+
+
+class ReorderBuffer:
+    """
+    Receive window holding out of order packets, indexed by their offset from the next expected sequence number
+    """
+    def __init__(self, base, capacity=RECEIVE_WINDOW):
+        """
+        :param base: next expected sequence number
+        :param capacity: receive window size in packets
+        """
+        self.base = base
+        self.slots = [None] * capacity
+        self.head = 0
+        # number of buffered packets and offset past the furthest one
+        self.count = 0
+        self.end = 1
+
+    def insert(self, seq_number, payload):
+        """
+        Inserts a received payload
+        :param seq_number: packet's sequence number
+        :param payload: packet's payload
+        :return: (list) payloads now deliverable in order, or None if the packet is a duplicate or out of the window
+        """
+        offset = seq_diff(seq_number, self.base)
+        if offset == 0:
+            if self.count == 0:
+                # in order fast path
+                self.base = seq_add(self.base)
+                return [payload]
+            return [payload] + self.__advance()
+        if offset < 0 or offset >= len(self.slots):
+            return None
+        index = (self.head + offset) % len(self.slots)
+        if self.slots[index] is not None:
+            return None
+        self.slots[index] = payload
+        self.count += 1
+        self.end = max(self.end, offset + 1)
+        return []
+
+    def contains(self, seq_number):
+        """
+        Returns whether a packet was already received
+        """
+        offset = seq_diff(seq_number, self.base)
+        if offset < 0:
+            return True
+        return offset < len(self.slots) and self.slots[(self.head + offset) % len(self.slots)] is not None
+
+    def skip(self):
+        """
+        Gives up on the next expected packet
+        :return: (list) payloads now deliverable in order
+        """
+        return self.__advance()
+
+    def __advance(self):
+        """
+        Moves past the next expected sequence number and collects the in order payloads following it
+        """
+        capacity = len(self.slots)
+        self.head = (self.head + 1) % capacity
+        self.base = seq_add(self.base)
+        self.end = max(self.end - 1, 1)
+        delivered = []
+        while self.count and self.slots[self.head] is not None:
+            delivered.append(self.slots[self.head])
+            self.slots[self.head] = None
+            self.count -= 1
+            self.head = (self.head + 1) % capacity
+            self.base = seq_add(self.base)
+            self.end = max(self.end - 1, 1)
+        if self.count == 0:
+            self.end = 1
+        return delivered
+
+    def sack_blocks(self, limit):
+        """
+        Returns the ranges of buffered packets
+        :param limit: max number of ranges
+        :return: list of (start, end) sequence ranges, end exclusive
+        """
+        blocks = []
+        if not self.count:
+            return blocks
+        capacity = len(self.slots)
+        start = None
+        for offset in range(1, self.end + 1):
+            received = offset < self.end and self.slots[(self.head + offset) % capacity] is not None
+            if received and start is None:
+                start = offset
+            elif not received and start is not None:
+                blocks.append((seq_add(self.base, start), seq_add(self.base, offset)))
+                start = None
+                if len(blocks) >= limit:
+                    break
+        return blocks
+
+    def __len__(self):
+        return self.count
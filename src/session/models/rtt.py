@@ -0,0 +1,48 @@
+from ...models.constants import ACK_TIMEOUT, MIN_RTO, MAX_RTO, TIMER_TICK
+
+_ALPHA = 1 / 8
+_BETA = 1 / 4
+_K = 4
+
+
+class RttEstimator:
+    """
+    Round trip time estimation and retransmission timeout as computed by RFC 6298, plus the time the peer may
+    hold an ack back (max_ack_delay, as in RFC 9002)
+    """
+    def __init__(self, initial_rto=ACK_TIMEOUT, max_ack_delay=0):
+        """
+        :param initial_rto: timeout used until the first RTT sample is taken
+        :param max_ack_delay: seconds the peer may delay its acks
+        """
+        self.max_ack_delay = max_ack_delay
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+        self.latest = None
+
+    def sample(self, rtt):
+        """
+        Updates the estimation with a new RTT sample. Samples of resent packets must not be given (Karn's algorithm)
+        :param rtt: measured round trip time in seconds
+        """
+        self.latest = rtt
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - _BETA) * self.rttvar + _BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - _ALPHA) * self.srtt + _ALPHA * rtt
+        # an ack that was only delayed must not look lost
+        self.rto = self.__clamp(self.srtt + max(TIMER_TICK, _K * self.rttvar) + self.max_ack_delay)
+
+    def timeout(self, attempts=0):
+        """
+        Returns the retransmission timeout, doubled for every expired attempt
+        :param attempts: resending attempts already made for the packet
+        """
+        return self.__clamp(self.rto * (2 ** attempts))
+
+    @staticmethod
+    def __clamp(rto):
+        return min(max(rto, MIN_RTO), MAX_RTO)
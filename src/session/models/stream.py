@@ -1,30 +1,145 @@
-import threading, io
+import threading
+from ...models.event import EventEmitter
 
 _STREAM_LEN_LIMIT = 50000000
+_INITIAL_CAPACITY = 65536
 
 class ByteStream:
-    def __init__(self):
-        self.buffer = io.BytesIO()
+    """
+    Ring buffer of received bytes. Consumed space is reused, the buffer only grows to hold unread data
+    """
+    def __init__(self, limit=_STREAM_LEN_LIMIT):
+        """
+        :param limit: max unread bytes the stream holds
+        """
+        self.buffer = bytearray(_INITIAL_CAPACITY)
         self.buffer_lock = threading.Lock()
-        self.available_space = _STREAM_LEN_LIMIT
-        self.stream_pointer = 0
+        self.data_ready = threading.Condition(self.buffer_lock)
+        self.space_ready = threading.Condition(self.buffer_lock)
+        self.limit = limit
+        self.available_space = limit
+        # read position and number of unread bytes
+        self.head = 0
+        self.size = 0
+        self.closed = False
+        # notified with the number of bytes read, once the lock is released
+        self.read_emitter = EventEmitter()
 
-    def append(self, new_bytes):
+    def append(self, new_bytes, timeout=0):
+        """
+        Appends data to the stream
+        :param new_bytes: bytes-like data
+        :param timeout: seconds to wait for reads to make room under the limit, None waits until they do or the
+        stream is closed
+        """
+        length = len(new_bytes)
+        if not length:
+            return
         with self.buffer_lock:
-            self.buffer.seek(len(self.buffer.getbuffer()))
-            self.buffer.write(new_bytes)
+            if self.size + length > self.limit and timeout != 0 and length <= self.limit:
+                self.space_ready.wait_for(lambda: self.closed or self.size + length <= self.limit, timeout)
+            if self.size + length > self.limit:
+                raise Exception('Stream error: {} bytes would exceed the limit of {} unread bytes'.format(
+                    length, self.limit))
+            if self.size + length > len(self.buffer):
+                self.__resize(max(len(self.buffer) * 2, self.size + length))
+            capacity = len(self.buffer)
+            tail = (self.head + self.size) % capacity
+            first = min(length, capacity - tail)
+            with memoryview(new_bytes) as data:
+                self.buffer[tail:tail + first] = data[:first]
+                if first < length:
+                    self.buffer[:length - first] = data[first:]
+            self.size += length
+            self.available_space = self.limit - self.size
+            self.data_ready.notify_all()
 
-    def fetch(self, length):
-        data = b''
+    def __resize(self, capacity):
+        """
+        Moves unread data to a new buffer of given capacity. Must be called while holding the lock
+        """
+        buffer = bytearray(capacity)
+        self.__copy_out(memoryview(buffer), self.size)
+        self.buffer = buffer
+        self.head = 0
+
+    def __copy_out(self, target, length):
+        """
+        Copies unread data into target without consuming it. Must be called while holding the lock
+        """
+        first = min(length, len(self.buffer) - self.head)
+        with memoryview(self.buffer) as view:
+            target[:first] = view[self.head:self.head + first]
+            if first < length:
+                target[first:length] = view[:length - first]
+
+    def __consume(self, length):
+        """
+        Marks data as read, reclaiming the space of a large emptied buffer
+        """
+        self.size -= length
+        self.head = (self.head + length) % len(self.buffer)
+        if self.size == 0:
+            self.head = 0
+            if len(self.buffer) > _INITIAL_CAPACITY * 4:
+                self.buffer = bytearray(_INITIAL_CAPACITY)
+        self.available_space = self.limit - self.size
+        if length:
+            self.space_ready.notify_all()
+
+    def __wait(self, timeout):
+        """
+        Waits for unread data. Must be called while holding the lock
+        """
+        if timeout != 0:
+            self.data_ready.wait_for(lambda: self.closed or self.size > 0, timeout)
+
+    def fetch(self, length, timeout=0):
+        """
+        Reads data from the stream
+        :param length: max data length
+        :param timeout: seconds to wait for data, None waits until data arrives or the stream is closed
+        :return: (bytes) data, empty if no data arrived in time
+        """
         with self.buffer_lock:
-            buffer_len = len(self.buffer.getbuffer())
-            self.buffer.seek(self.stream_pointer)
-            if buffer_len >= self.stream_pointer + length:
-                data = self.buffer.read(length)
-                self.stream_pointer += length
-            elif self.stream_pointer + length > buffer_len:
-                data = self.buffer.read()
-                self.stream_pointer = buffer_len
+            self.__wait(timeout)
+            length = min(length, self.size)
+            end = self.head + length
+            with memoryview(self.buffer) as view:
+                if end <= len(self.buffer):
+                    data = bytes(view[self.head:end])
+                else:
+                    data = bytes(view[self.head:]) + bytes(view[:end - len(self.buffer)])
+            self.__consume(length)
+        if length:
+            self.read_emitter.emit(length=length)
+        return data
+
+    def fetch_into(self, buffer, timeout=0):
+        """
+        Reads data from the stream straight into a caller's buffer
+        :param buffer: writable bytes-like object (bytearray, memoryview)
+        :param timeout: seconds to wait for data, None waits until data arrives or the stream is closed
+        :return: (int) number of bytes written
+        """
+        with memoryview(buffer) as target, target.cast('B') as target:
+            with self.buffer_lock:
+                self.__wait(timeout)
+                length = min(len(target), self.size)
+                self.__copy_out(target, length)
+                self.__consume(length)
+        if length:
+            self.read_emitter.emit(length=length)
+        return length
 
+    def __len__(self):
+        return self.size
 
-            return data
+    def close(self):
+        """
+        Closes the stream, waking up waiting readers and writers
+        """
+        with self.buffer_lock:
+            self.closed = True
+            self.data_ready.notify_all()
+            self.space_ready.notify_all()
@@ -0,0 +1,174 @@
+import threading, time, traceback
+from ...models.constants import TIMER_TICK, TIMER_WHEEL_SLOTS
+
+_default_wheel = None
+_default_lock = threading.Lock()
+
+
+class Timer:
+    """
+    Handle of a scheduled callback
+    """
+    __slots__ = ('callback', 'args', 'rounds', 'cancelled')
+
+    def __init__(self, callback, args, rounds):
+        self.callback = callback
+        self.args = args
+        self.rounds = rounds
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Cancels the timer. The entry is discarded lazily when its slot is reached
+        """
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel. Arming and cancelling a timer are O(1); expired timers are fired by a
+    single driver, either the wheel's own thread or an external loop calling advance()
+    """
+    def __init__(self, tick=TIMER_TICK, slots=TIMER_WHEEL_SLOTS, notify=None):
+        """
+        :param tick: wheel resolution in seconds
+        :param slots: number of wheel slots
+        :param notify: method called when the first timer is armed, waking up an external driver
+        """
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.cursor = 0
+        self.pending = 0
+        self.last_tick = time.monotonic()
+        self.locker = threading.Lock()
+        self.wakeup = threading.Condition(self.locker)
+        self.notify = notify
+        self.active = False
+
+    def schedule(self, delay, callback, *args):
+        """
+        Schedules a callback
+        :param delay: seconds to wait before firing
+        :param callback: method to call
+        :return: (Timer) timer handle
+        """
+        ticks = max(1, int(delay / self.tick + 0.999999))
+        with self.locker:
+            # slot cursor + offset is reached after offset ticks (1 to slots), then after every rotation
+            rounds, offset = divmod(ticks - 1, len(self.slots))
+            offset += 1
+            timer = Timer(callback, args, rounds)
+            self.slots[(self.cursor + offset) % len(self.slots)].append(timer)
+            first = self.pending == 0
+            if first:
+                self.last_tick = time.monotonic()
+            self.pending += 1
+            self.wakeup.notify()
+        if first and self.notify:
+            self.notify()
+        return timer
+
+    def advance(self, now=None):
+        """
+        Moves the wheel up to the current time and fires expired timers
+        :param now: current monotonic time
+        :return: (int) number of fired timers
+        """
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self.locker:
+            while now - self.last_tick >= self.tick:
+                self.last_tick += self.tick
+                self.cursor = (self.cursor + 1) % len(self.slots)
+                slot = self.slots[self.cursor]
+                if not slot:
+                    continue
+                waiting = []
+                for timer in slot:
+                    if timer.cancelled:
+                        self.pending -= 1
+                    elif timer.rounds > 0:
+                        timer.rounds -= 1
+                        waiting.append(timer)
+                    else:
+                        self.pending -= 1
+                        expired.append(timer)
+                self.slots[self.cursor] = waiting
+            if self.pending == 0:
+                self.last_tick = now
+
+        for timer in expired:
+            if not timer.cancelled:
+                try:
+                    timer.callback(*timer.args)
+                except Exception:
+                    # a failing timer must not stop the driver
+                    traceback.print_exc()
+        return len(expired)
+
+    def next_timeout(self):
+        """
+        Returns the time until the next tick, or None if no timer is armed
+        """
+        with self.locker:
+            if self.pending == 0:
+                return None
+            return max(0.0, self.last_tick + self.tick - time.monotonic())
+
+    def start(self):
+        """
+        Starts the wheel's driver thread
+        """
+        with self.locker:
+            if self.active:
+                return
+            self.active = True
+        threading.Thread(target=self.__run, args=(), daemon=True).start()
+
+    def __run(self):
+        """
+        Drives the wheel, sleeping while no timer is armed
+        """
+        while self.active:
+            with self.locker:
+                while self.active and self.pending == 0:
+                    self.wakeup.wait()
+            time.sleep(self.tick)
+            self.advance()
+
+    def stop(self):
+        with self.locker:
+            self.active = False
+            self.wakeup.notify()
+
+
+class LoopScheduler:
+    """
+    Runs timers on an asyncio event loop, offering the timer wheel's scheduling interface
+    """
+    def __init__(self, loop):
+        """
+        :param loop: asyncio event loop
+        """
+        self.loop = loop
+
+    def schedule(self, delay, callback, *args):
+        """
+        Schedules a callback on the loop
+        :param delay: seconds to wait before firing
+        :param callback: method to call
+        :return: (asyncio.TimerHandle) timer handle
+        """
+        return self.loop.call_later(delay, callback, *args)
+
+
+def default_wheel():
+    """
+    Returns the process-wide timer wheel, starting its driver thread on first use
+    """
+    global _default_wheel
+    with _default_lock:
+        if _default_wheel is None:
+            _default_wheel = TimerWheel()
+            _default_wheel.start()
+        return _default_wheel
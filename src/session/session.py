@@ -1,138 +1,1134 @@
-import heapq, threading, time
-from ..models.packet import Packet, generate_id
+import threading, time, collections, queue
+from ..models.packet import Packet, generate_id, encode_ack, decode_ack
+from ..models.event import EventEmitter
+from ..models.metrics import SessionMetrics
+from ..models.sequence import seq_add, seq_diff
 from .models.acklist import AckList
-from ..models.constants import MTU, SEQ_LIMIT, ACK, PAYLOAD, RESEND_ATTEMPTS, ACK_TIMEOUT, PACKET_HEADER_SIZE
-from .models.stream import ByteStream
+from .models.congestion import create_congestion_control
+from .models.pacer import Pacer
+from .models.rtt import RttEstimator
+from .models.timer import default_wheel
+from .models.reorder import ReorderBuffer
+from .models.pmtu import PathMtu
+from .models.filemap import FileSource, FileSink
+from .models.compressor import Compressor, decompress
+from .models.fec import FecEncoder, FecDecoder, FEC_OVERHEAD
+from ..models.constants import MTU, SEQ_LIMIT, ACK, PAYLOAD, RESEND_ATTEMPTS, PACKET_HEADER_SIZE, SEND_WINDOW, \
+    SACK_BLOCKS_LIMIT, CONGESTION_CONTROL, DELAYED_ACKS, ACK_FREQUENCY, DELAYED_ACK_TIMEOUT, FLAG_ACK, PROBE, \
+    PROBE_ACK, IP_UDP_OVERHEAD, PMTU_DISCOVERY, FORWARD, FLAG_UNORDERED, FILE_CHUNK_SIZE, \
+    FLAG_COMPRESSED, MAX_PLPMTU, FLOW_WINDOW, FLOW_WINDOW_UPDATE, PARITY, FIN, FIN_ATTEMPTS, FIN_TIMEOUT, \
+    RECEIVE_WINDOW, MAX_STREAMS, FLAG_FIN, SYN_ACK
+from .stream import Stream
 
 class Session:
     """
     Abstract session class
     """
-    def __init__(self, address, server_seq, client_seq):
+    def __init__(self, address, server_seq, client_seq, scheduler=None):
+        """
+        :param address: peer's address
+        :param server_seq: local initial sequence number
+        :param client_seq: peer's initial sequence number
+        :param scheduler: timer scheduler of session's timers (process-wide timer wheel by default)
+        """
         self.address = address
         self.id = generate_id()
         self.timestamp = time.time()
 
-        # income packets
-        self.__packets = []
-        self.stream = ByteStream()
-        # income packets seq
-        self.packet_counter = client_seq
+        # streams by id, the default stream 0 carries session's own send and receive
+        self.streams = {}
+        self.incoming_streams = queue.Queue()
+        # ids of locally opened streams, of the other parity than the peer's ones, and the ids of closed ones to
+        # reuse. Ids are reused before new ones are taken, so they stay far below the header's 16 bits
+        self.next_stream_id = 2 if server_seq % SEQ_LIMIT < client_seq % SEQ_LIMIT else 1
+        self.free_stream_ids = collections.deque()
+        # streams opened by this side until their ids are reused, streams opened by the peer until released, and
+        # the streams either side closed, released once both did
+        self.local_streams = 0
+        self.peer_streams = 0
+        self.closing_streams = []
+        self.default_stream = self._new_stream(0)
+        self.streams[0] = self.default_stream
+        # income data of the default stream
+        self.stream = self.default_stream.buffer
+        # income packets seq, tracked for acks regardless of their streams
+        self.packet_counter = client_seq % SEQ_LIMIT
+        self.reorder = ReorderBuffer(self.packet_counter)
+        self.gap_timer = None
+        self.gap_seq = None
+        # reentrant, reading a stream under it may announce the opened window
+        self.receive_lock = threading.RLock()
+        # flow control: bytes held in streams' reorder buffers, the window the peer knows of and payload bytes
+        # received since the last ack
+        self.held = 0
+        self.advertised = FLOW_WINDOW
+        self.unacked_bytes = 0
+        # in order packets received since the last ack
+        self.delayed_acks = DELAYED_ACKS
+        self.unacked = 0
+        self.ack_timer = None
+        self.ack_pending = None
         # local send packets seq
-        self.next_sent_seq = server_seq
+        self.next_sent_seq = server_seq % SEQ_LIMIT
         self.lost_packets = 0
+        # rebuilds lost packets once the peer sends parity packets
+        self.fec_decoder = None
+        # client's handshake ACK, sent again while the server answers with SYN_ACK for it never got it
+        self.handshake_ack = None
 
-        self.awaiting_ack = AckList()
+        self.scheduler = scheduler if scheduler else default_wheel()
+        # the peer delays its acks as this session does
+        self.rtt = RttEstimator(max_ack_delay=DELAYED_ACK_TIMEOUT if DELAYED_ACKS else 0)
+        self.awaiting_ack = AckList(self.next_sent_seq, self.scheduler, self.rtt)
         self.awaiting_ack.resend_emitter.subscribe(self.__emitted_resend)
+        self.awaiting_ack.drop_emitter.subscribe(self.__emitted_drop)
+        self.awaiting_ack.abandon_emitter.subscribe(self.__emitted_abandon)
+
+        # IP packet size of the path and the payload size of full segments
+        self.mtu = MTU
+        self.max_payload = MTU - IP_UDP_OVERHEAD - PACKET_HEADER_SIZE
+        # sessions whose datagrams may be fragmented on the way can't probe
+        self.pmtu_discovery = PMTU_DISCOVERY
+        self.path_mtu = PathMtu(self.__send_probe, self.scheduler, self.rtt)
+        self.path_mtu.update_emitter.subscribe(self.__mtu_updated)
+
+        # streams with outgoing payloads waiting for congestion window and pacing, served in turn
+        self.__ready = collections.deque()
+        self.congestion = create_congestion_control(CONGESTION_CONTROL)
+        self.pacer = Pacer()
+        self.pacing_timer = None
+        # FORWARD packets of abandoned packets by sequence number, until the peer acks past them:
+        # [forward, send time, resends], and the timer resending the unacked ones
+        self.forwards = {}
+        self.forward_timer = None
+        # payload compressor, once both sides agreed on compression
+        self.compressor = None
+        # parity packets encoder, while forward error correction is on
+        self.fec = None
+        # peer's receive window, queued payload bytes, and the persist timer probing a closed window
+        self.peer_window = FLOW_WINDOW
+        self.outbox_bytes = 0
+        self.window_timer = None
+        self.window_probes = 0
+        self.window_probe = False
+        self.blocking = True
+        # FIN awaiting its answer, and the timer resending it
+        self.fin_pending = False
+        self.fin_timer = None
+        # called once queued data was acked before closing, and the timer giving up on it
+        self.drain_callback = None
+        self.drain_timer = None
+        self.send_lock = threading.RLock()
+        self.send_cond = threading.Condition(self.send_lock)
+        self.active = True
 
-        self.stream_lock = threading.Lock()
-        self.heap_lock = threading.Lock()
+        self.metrics = SessionMetrics()
 
-        self.run_heap = False
-        threading.Thread(target=self.__run_heap, args=()).start()
+        # notified when payloads are delivered to the stream and when the outbox is drained
+        self.data_emitter = EventEmitter()
+        self.drain_emitter = EventEmitter()
+        self.drain_emitter.subscribe(self.__check_drained)
 
-    def __next_seq(self, seq_type):
+    def __next_seq(self):
         """
-        Moves to next sequence number
-        :param seq_type: sequence type- local or income
+        Moves to next local sequence number
         """
-        if seq_type == 0:
-            self.packet_counter += 1
-            if self.packet_counter == SEQ_LIMIT:
-                self.packet_counter = 1
-        elif seq_type == 1:
-            self.next_sent_seq += 1
-            if self.next_sent_seq == SEQ_LIMIT:
-                self.next_sent_seq = 1
+        self.next_sent_seq = seq_add(self.next_sent_seq)
 
     def __income_packet(self, packet):
         """
         Handles income packet
         :param packet: income packet
         """
+        if not packet.verify_checksum():
+            # a corrupted ack number would release packets never received
+            self.metrics.checksum_errors += 1
+            return
+        if packet.operation == SYN_ACK:
+            if self.handshake_ack:
+                self._send_packet(self.handshake_ack)
+            return
+        # anything else comes from the server's session, the handshake is over
+        self.handshake_ack = None
         if packet.operation == ACK:
-           self.awaiting_ack.confirm_ack(packet.ack_number)
-        elif packet.operation == PAYLOAD:
-            if packet.verify_checksum():
-                if packet.seq_number >= self.packet_counter:
-                    ack = packet.ack()
-                    self._send_packet(bytes(ack))
-                    heap_element = (packet.seq_number, packet)
-                    with self.heap_lock:
-                        heapq.heappush(self.__packets, heap_element)
-
-    def __run_heap(self):
-        """
-        Runs income packets heap
-        """
-        self.run_heap = True
-        attempts = 0
-        while self.run_heap:
-            seq_number = self.__pop_packet_seq()
-            if not seq_number:
-                continue
-            if seq_number == self.packet_counter:
-                with self.heap_lock:
-                    seq_number, packet = heapq.heappop(self.__packets)
-                    self.stream.append(packet.payload)
-                    self.__next_seq(0)
+            self.metrics.acks_received += 1
+            window, blocks = decode_ack(packet.payload)
+            self.__acknowledged(packet.ack_number, blocks, window)
+        elif packet.operation == PAYLOAD or packet.operation == FORWARD:
+            rebuilt = self.fec_decoder.add_source(packet, self.reorder.base) \
+                if self.fec_decoder and packet.operation == PAYLOAD else ()
+            self.__payload_packet(packet)
+            self.__rebuilt_packets(rebuilt)
+        elif packet.operation == PARITY:
+            if not self.fec_decoder:
+                self.fec_decoder = FecDecoder()
+            self.__rebuilt_packets(self.fec_decoder.add_parity(packet, self.reorder.base))
+        elif packet.operation == PROBE:
+            self._send_packet(bytes(packet.ack()))
+        elif packet.operation == PROBE_ACK:
+            self.path_mtu.on_probe_ack(packet)
+
+    def __payload_packet(self, packet):
+        """
+        Handles a verified PAYLOAD or FORWARD packet
+        :param packet: income packet, or a packet rebuilt from parity
+        """
+        if packet.operation == PAYLOAD:
+            self.metrics.received(packet.payload_size)
+            if packet.flags & FLAG_COMPRESSED:
+                packet.payload = decompress(packet.payload, MAX_PLPMTU)
+                if packet.payload is None:
+                    self.metrics.checksum_errors += 1
+                    return
+        else:
+            self.metrics.forwarded += 1
+        if packet.flags & FLAG_ACK:
+            self.__acknowledged(packet.ack_number)
+        with self.receive_lock:
+            buffered = len(self.reorder)
+            received = self.reorder.insert(packet.seq_number, True)
+            if received is None:
+                self.metrics.duplicates += 1
             else:
-                if attempts < RESEND_ATTEMPTS:
-                    time.sleep(ACK_TIMEOUT)
+                self.packet_counter = self.reorder.base
+                self.unacked_bytes += len(packet.payload)
+                self.__stream_packet(packet)
+            self.__arm_gap_timer(self)
+            if self.closing_streams:
+                self.__release_streams()
+            ack = self.__ack_needed(received, buffered)
+        if ack:
+            self._send_packet(bytes(ack))
+
+    def __rebuilt_packets(self, packets):
+        """
+        Handles the payload packets parity rebuilt, as if they were received
+        """
+        for packet in packets:
+            self.metrics.fec_recovered += 1
+            self.__payload_packet(packet)
+
+    def __stream_packet(self, packet):
+        """
+        Delivers an income payload to its stream, opening the stream if it's a new one. A FORWARD packet
+        makes the stream skip the expired payload instead. Must be called while holding the receive lock
+        :param packet: PAYLOAD or FORWARD packet
+        """
+        stream = self.streams.get(packet.stream_id)
+        if not stream:
+            if not self.active or self.__local_stream(packet.stream_id):
+                # streams of this side's ids are only opened by this side
+                return
+            if self.peer_streams >= MAX_STREAMS:
+                self.metrics.streams_refused += 1
+                return
+            stream = self.streams[packet.stream_id] = self._new_stream(packet.stream_id)
+            self.peer_streams += 1
+            self._stream_opened(stream)
+        if packet.flags & FLAG_UNORDERED:
+            if packet.operation == PAYLOAD:
+                self.held += len(packet.payload)
+                self.__deliver(stream, [packet.payload])
+            return
+        if packet.flags & FLAG_FIN and stream.fin_received is None:
+            stream.fin_received = packet.seq_number
+            stream.fin_seq = packet.stream_seq
+            if stream not in self.closing_streams:
+                self.closing_streams.append(stream)
+        # an empty payload holds the place of skipped data
+        payload = packet.payload if packet.operation == PAYLOAD else b''
+        delivered = stream.reorder.insert(packet.stream_seq, payload)
+        if delivered is not None:
+            self.held += len(payload)
+        if delivered:
+            self.__deliver(stream, delivered)
+        self.__arm_gap_timer(stream)
+
+    def __local_stream(self, stream_id):
+        return stream_id != 0 and stream_id % 2 == self.next_stream_id % 2
+
+    def __release_streams(self):
+        """
+        Forgets the streams both sides closed, once the peer's packets up to its FIN arrived and the data was
+        read. The id of a stream this side opened is reused once the peer acked everything up to this side's
+        FIN, the peer forgot the stream by then. Must be called while holding the receive lock
+        """
+        for stream in list(self.closing_streams):
+            if stream.fin_received is not None and not stream.finished and \
+                    seq_diff(stream.reorder.base, stream.fin_seq) > 0:
+                # the end of the stream is read once the data before it is
+                stream.finished = True
+                stream.buffer.close()
+                if stream.sink:
+                    stream.sink.interrupt()
+            if stream.fin_sent is None or not stream.finished or len(stream.buffer) or \
+                    seq_diff(self.reorder.base, stream.fin_received) <= 0:
+                continue
+            if self.streams.get(stream.id) is stream:
+                del self.streams[stream.id]
+                if not self.__local_stream(stream.id):
+                    self.peer_streams -= 1
+                    self.closing_streams.remove(stream)
                     continue
-                else:
-                    self.lost_packets += 1
-                    attempts = 0
-                    self.__next_seq(0)
-                    self.packet_counter += 1
+            if self.awaiting_ack.released(stream.fin_sent) and \
+                    not any(seq_diff(stream.fin_sent, seq) >= 0 for seq in list(self.forwards)):
+                self.closing_streams.remove(stream)
+                self.free_stream_ids.append(stream.id)
+                self.local_streams -= 1
 
-    def __pop_packet_seq(self):
+    def __acknowledged(self, cumulative, blocks=(), window=None):
         """
-        Gets top packet from heap
+        Releases acknowledged packets and sends more if the window opened
+        :param cumulative: next sequence number expected by the peer
+        :param blocks: selectively acked ranges
+        :param window: peer's receive window, None if the ack doesn't carry it
         """
-        with self.heap_lock:
-            if len(self.__packets) > 0:
-                seq = self.__packets[0][0]
-                return seq
+        acked, size, rtt = self.awaiting_ack.confirm_range(cumulative, blocks)
+        if rtt is not None:
+            self.metrics.rtt(rtt)
+        forwards = len(self.forwards)
+        if forwards:
+            self.__resend_forwards(cumulative, blocks)
+        if self.closing_streams:
+            with self.receive_lock:
+                self.__release_streams()
+        with self.send_lock:
+            previous = self.peer_window
+            if window is None:
+                # acks piggybacked on payloads don't carry the window, acked data is assumed to be still buffered
+                self.peer_window = max(self.peer_window - size, 0)
             else:
+                self.peer_window = window
+            opened = self.peer_window > previous
+            if opened:
+                self.window_probes = 0
+        if acked:
+            self.congestion.on_ack(acked, self.rtt.srtt)
+        if acked or opened:
+            self._flush()
+        elif len(self.forwards) < forwards:
+            # closing sessions wait for FORWARD packets to be acked too
+            self.drain_emitter.emit()
+
+    def __ack_needed(self, delivered, buffered):
+        """
+        Decides whether an income payload is acked now or delayed. Must be called while holding the receive lock
+        :param delivered: packets now received in order, None for a duplicate
+        :param buffered: out of order packets buffered before the packet arrived
+        :return: ACK packet to send now, or None
+        """
+        # duplicates, gaps and gap fills are acked at once so the sender learns about them quickly
+        if not self.delayed_acks or not delivered or buffered or len(self.reorder):
+            return self.__build_ack()
+        if not self.unacked:
+            self.ack_pending = time.monotonic()
+        self.unacked += 1
+        if self.unacked >= ACK_FREQUENCY:
+            return self.__build_ack()
+        if not self.ack_timer:
+            self.ack_timer = self.scheduler.schedule(DELAYED_ACK_TIMEOUT, self.__delayed_ack)
+        return None
+
+    def __delayed_ack(self):
+        """
+        Sends the ack delayed for lack of a second packet or of reverse traffic
+        """
+        with self.receive_lock:
+            self.ack_timer = None
+            if not self.active or not self.unacked:
+                return
+            ack = self.__build_ack()
+        self._send_packet(bytes(ack))
+
+    def __piggyback_ack(self):
+        """
+        Takes the pending delayed ack to carry it in outgoing payload headers
+        :return: cumulative ack, or None if no ack is pending
+        """
+        with self.receive_lock:
+            if not self.unacked or len(self.reorder):
+                return None
+            # the peer takes the acked data as buffered, a window opened since is left to an ACK to tell
+            window = self.advertised - self.unacked_bytes
+            if self.__receive_window() - window >= FLOW_WINDOW_UPDATE:
                 return None
+            self.advertised = max(window, 0)
+            self.unacked_bytes = 0
+            self.__ack_latency()
+            self.__reset_delayed_ack()
+            return self.reorder.base
+
+    def __ack_latency(self):
+        """
+        Records how long the delayed ack was held back. Must be called while holding the receive lock
+        """
+        if self.ack_pending is not None:
+            self.metrics.ack_latency(time.monotonic() - self.ack_pending)
+            self.ack_pending = None
+
+    def __reset_delayed_ack(self):
+        self.unacked = 0
+        self.ack_pending = None
+        if self.ack_timer:
+            self.ack_timer.cancel()
+            self.ack_timer = None
+
+    def __deliver(self, stream, payloads):
+        """
+        Appends in order payloads to a stream. Must be called while holding the receive lock
+        """
+        for payload in payloads:
+            self.held -= len(payload)
+            if stream.sink:
+                taken = stream.sink.write(payload)
+                if taken < len(payload):
+                    # the file is complete, what follows is read as usual
+                    stream.buffer.append(memoryview(payload)[taken:])
+            else:
+                stream.buffer.append(payload)
+        self.data_emitter.emit(stream=stream.id)
+
+    def __build_ack(self):
+        """
+        Builds a cumulative ack for the income packets, with selective ack blocks for buffered
+        out of order packets. Must be called while holding the receive lock
+        :return: ACK packet
+        """
+        self.__ack_latency()
+        self.__reset_delayed_ack()
+        self.metrics.acks_sent += 1
+        blocks = self.reorder.sack_blocks(SACK_BLOCKS_LIMIT)
+        self.advertised = self.__receive_window()
+        self.unacked_bytes = 0
+        return Packet(seq=0, oper=ACK, ack=self.reorder.base, payload=encode_ack(self.advertised, blocks))
+
+    def __receive_window(self):
+        """
+        Returns the bytes the session can still buffer for the application, out of order data included. Must be
+        called while holding the receive lock
+        """
+        buffered = sum(len(stream.buffer) for stream in self.streams.values())
+        return max(FLOW_WINDOW - self.held - buffered, 0)
+
+    def _window_update(self, **args):
+        """
+        Tells the peer at once about the window opened by the application reading a stream, once it's worth an
+        ack. Subscribed method of streams' buffers
+        """
+        with self.receive_lock:
+            if self.closing_streams:
+                self.__release_streams()
+            if not self.active or self.__receive_window() - self.advertised < FLOW_WINDOW_UPDATE:
+                return
+            ack = self.__build_ack()
+        self._send_packet(bytes(ack))
+
+    def __arm_gap_timer(self, owner):
+        """
+        Arms the gap timer while packets wait behind a missing one. Must be called while holding the receive lock
+        :param owner: the session, for the packets sequence, or a stream
+        """
+        if len(owner.reorder) == 0:
+            if owner.gap_timer:
+                owner.gap_timer.cancel()
+                owner.gap_timer = None
+        elif not owner.gap_timer or owner.gap_seq != owner.reorder.base:
+            if owner.gap_timer:
+                owner.gap_timer.cancel()
+            owner.gap_seq = owner.reorder.base
+            owner.gap_timer = self.scheduler.schedule(self.__gap_timeout(), self.__gap_expired, owner,
+                                                      owner.gap_seq)
 
-    def receive(self, length):
-        return self.stream.fetch(length)
+    def __gap_expired(self, owner, seq_number):
+        """
+        Gives up on a missing packet the peer stopped resending
+        :param owner: the session, for the packets sequence, or a stream
+        :param seq_number: missing packet's sequence number
+        """
+        with self.receive_lock:
+            if not self.active or owner.reorder.base != seq_number:
+                return
+            owner.gap_timer = None
+            if owner is self:
+                # only acks move on, the missing payload's stream has a gap of its own
+                self.reorder.skip()
+                self.packet_counter = self.reorder.base
+            else:
+                self.lost_packets += 1
+                self.__deliver(owner, owner.reorder.skip())
+            self.__arm_gap_timer(owner)
+            if self.closing_streams:
+                self.__release_streams()
+
+    def __gap_timeout(self):
+        """
+        Returns how long a missing packet may still be resent by the peer
+        """
+        return sum(self.rtt.timeout(attempts) for attempts in range(RESEND_ATTEMPTS + 1))
+
+    def receive(self, length, timeout=None):
+        """
+        Returns received data
+        :param length: max data length
+        :param timeout: seconds to wait for data, None blocks until data arrives, 0 doesn't wait
+        """
+        return self.stream.fetch(length, timeout)
+
+    def receive_into(self, buffer, timeout=None):
+        """
+        Writes received data straight into a caller's buffer
+        :param buffer: writable bytes-like object (bytearray, memoryview)
+        :param timeout: seconds to wait for data, None blocks until data arrives, 0 doesn't wait
+        :return: (int) number of bytes written
+        """
+        return self.stream.fetch_into(buffer, timeout)
 
-    def send(self, data):
+    def receive_to_file(self, file, length, timeout=None):
+        """
+        Writes received data straight into a file, without going through the receive buffer
+        :param file: file path, or binary file object written from its current position
+        :param length: number of bytes to receive
+        :param timeout: seconds to wait for all the data, None blocks until it arrives
+        :return: (int) number of bytes written, less than length on timeout or if the session is closed
+        """
+        return self._receive_file_on(self.default_stream, file, length, timeout)
+
+    def _receive_file_on(self, stream, file, length, timeout=None):
+        """
+        Attaches a file sink to a stream until it received length bytes
+        """
+        sink = FileSink(file, length)
+        try:
+            with self.receive_lock:
+                sink.fill(stream.buffer)
+                if self.active:
+                    stream.sink = sink
+                else:
+                    sink.interrupt()
+            return sink.wait(timeout)
+        finally:
+            with self.receive_lock:
+                stream.sink = None
+            sink.close()
+
+    def send(self, data, ttl=None, ordered=True):
         """
         Sends data to target
         :param data: data to send
+        :param ttl: seconds the data is worth delivering, None to deliver it reliably
+        :param ordered: False to deliver the data as soon as it arrives, it must fit in a packet
+        """
+        self._send_on(self.default_stream, data, ttl, ordered)
+
+    def send_file(self, file, offset=0, count=None):
+        """
+        Sends a file. It's memory mapped and segmented without copies, a chunk at a time, so it's never held
+        in memory. The file must not change until the call returns, lost packets are resent from the map
+        :param file: file path, or binary file object opened for reading
+        :param offset: position of the first byte to send
+        :param count: number of bytes to send, None up to the end of the file
+        :return: (int) number of bytes sent, returned once the peer acked all of them
+        """
+        return self._send_file_on(self.default_stream, file, offset, count)
+
+    def _send_file_on(self, stream, file, offset=0, count=None):
         """
+        Sends a file on a stream, queuing a chunk whenever the previous one was released
+        """
+        source = FileSource(file, offset, count)
+        try:
+            for pointer in range(0, source.length, FILE_CHUNK_SIZE):
+                if not self.active:
+                    raise Exception('Data transfer failure: connection is closed')
+                # files are sent blocking, a chunk is larger than any window
+                self._enqueue(source.view[pointer:pointer + FILE_CHUNK_SIZE], stream)
+                self.__wait_sent(stream)
+            if source.length:
+                # lost packets are resent from the map, it's closed once none can be
+                with self.send_lock:
+                    last = seq_add(self.next_sent_seq, -1)
+                self.__wait_acked(last)
+        finally:
+            source.close()
+        return source.length
+
+    def _send_on(self, stream, data, ttl=None, ordered=True):
+        """
+        Sends data on a stream, waiting until congestion control and the peer's window released all of it.
+        Non-blocking sessions queue it and return at once, or raise BlockingIOError if the peer's window is full
+        """
+        self._enqueue(data, stream, ttl, ordered, self.blocking)
+        if self.blocking:
+            self.__wait_sent(stream)
+
+    def __wait_sent(self, stream):
+        with self.send_lock:
+            while self.active and stream.outbox:
+                self.send_cond.wait()
+
+    def __wait_acked(self, seq_number):
+        """
+        Waits until every packet up to a sequence number was acked or given up, or the session is closed
+        """
+        with self.send_lock:
+            while self.active and not self.awaiting_ack.released(seq_number):
+                # acks only wake up senders once every stream is drained, the timeout covers busy streams
+                self.send_cond.wait(self.rtt.timeout())
+
+    def set_blocking(self, blocking):
+        """
+        Sets whether sending waits for the data to be sent, or fails fast once the peer's receive window is full
+        :param blocking: False to raise BlockingIOError rather than queue data the peer has no room for
+        """
+        self.blocking = blocking
+
+    def _enqueue(self, data, stream=None, ttl=None, ordered=True, block=True):
+        """
+        Segments data into a stream's outbox and starts sending it, without waiting
+        :param data: data to send
+        :param stream: stream to send on, the default stream if None
+        :param ttl: seconds the data is worth delivering, None to deliver it reliably
+        :param ordered: False to deliver the data as soon as it arrives
+        :param block: False to raise BlockingIOError if the data exceeds the peer's receive window
+        """
+        if type(data) == str:
+            # encoded once, segments are sized in bytes
+            data = data.encode('utf-8')
+        if type(data) == bytes:
+            # segments are views of the data, not copies
+            data = memoryview(data)
         size = len(data)
         if size <= 0:
             raise Exception('Send data error: data length is 0')
+        stream = stream if stream else self.default_stream
+        deadline = time.monotonic() + ttl if ttl is not None else None
+        flags = 0 if ordered else FLAG_UNORDERED
         pointer = 0
-        while pointer <= size:
-            payload = data[pointer:pointer + (MTU-PACKET_HEADER_SIZE)]
-            pointer += MTU-PACKET_HEADER_SIZE
-            packet = Packet(seq=self.next_sent_seq, oper=PAYLOAD, ack=generate_id(), payload=payload)
-            self._send_packet(packet)
-            self.awaiting_ack.new_packet(packet)
-            self.__next_seq(1)
+        with self.send_lock:
+            if stream.closing:
+                raise Exception('Send data error: stream is closed')
+            # parity packets carry the size and stream of the group's payloads
+            segment = self.max_payload - FEC_OVERHEAD if self.fec else self.max_payload
+            if not ordered and size > segment:
+                raise Exception('Send data error: unordered data is limited to {} bytes'.format(segment))
+            if not block and self.awaiting_ack.bytes_in_flight + self.outbox_bytes + size > self.peer_window:
+                raise BlockingIOError("Send data error: peer's receive window is full")
+            self.outbox_bytes += size
+            if not stream.outbox:
+                self.__ready.append(stream)
+            while pointer < size:
+                stream.outbox.append((data[pointer:pointer + segment], deadline, flags))
+                pointer += segment
+        self._flush()
+
+    def _drained(self, stream=None):
+        """
+        Returns whether all data queued on a stream was sent
+        :param stream: the stream, the default stream if None
+        """
+        return not self.active or not (stream if stream else self.default_stream).outbox
+
+    def _idle(self):
+        """
+        Returns whether all queued data was sent and acked or given up, FORWARD packets of the given up data included
+        """
+        with self.send_lock:
+            return not self.outbox_bytes and not self.awaiting_ack.in_flight and not self.forwards
+
+    def open_stream(self):
+        """
+        Opens a new stream to the peer. The peer accepts it once data is sent on it
+        :return: (Stream) new stream
+        """
+        with self.receive_lock:
+            if self.local_streams >= MAX_STREAMS:
+                raise Exception('Stream error: {} streams are open, close some first'.format(MAX_STREAMS))
+            if self.free_stream_ids:
+                stream_id = self.free_stream_ids.popleft()
+            else:
+                stream_id = self.next_stream_id
+                self.next_stream_id += 2
+            stream = self.streams[stream_id] = self._new_stream(stream_id)
+            self.local_streams += 1
+        return stream
+
+    def _close_stream(self, stream):
+        """
+        Queues a stream's FIN after its data
+        """
+        if stream is self.default_stream:
+            raise Exception('Stream error: the default stream is closed with its session')
+        with self.send_lock:
+            if stream.closing or not self.active:
+                return
+            stream.closing = True
+            if not stream.outbox:
+                self.__ready.append(stream)
+            stream.outbox.append((memoryview(b''), None, FLAG_FIN))
+        with self.receive_lock:
+            if stream not in self.closing_streams:
+                self.closing_streams.append(stream)
+        self._flush()
+
+    def accept_stream(self, timeout=None):
+        """
+        Returns a stream opened by the peer
+        :param timeout: seconds to wait for a stream, None blocks until one is opened
+        :return: (Stream) peer's stream, or None on timeout or once the session is closed
+        """
+        try:
+            return self.incoming_streams.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _new_stream(self, stream_id):
+        """
+        Creates a stream of the session. Sessions with their own stream type override it
+        """
+        return Stream(self, stream_id)
+
+    def _stream_opened(self, stream):
+        """
+        Announces a stream opened by the peer, or None once the session is closed
+        """
+        self.incoming_streams.put(stream)
+
+    def configure_mtu(self, mtu=None):
+        """
+        Applies a fixed IP packet size, or starts path MTU discovery where supported
+        :param mtu: IP packet size, None to discover it
+        """
+        if mtu:
+            self.set_mtu(mtu)
+        elif self.pmtu_discovery:
+            self.discover_mtu()
+
+    def discover_mtu(self):
+        """
+        Starts probing for the largest IP packet the path to the peer delivers unfragmented
+        """
+        self.path_mtu.start(self.mtu, self._route_mtu())
+
+    def set_mtu(self, mtu):
+        """
+        Fixes session's IP packet size, stopping path MTU discovery
+        :param mtu: IP packet size, headers included
+        """
+        if mtu - IP_UDP_OVERHEAD - PACKET_HEADER_SIZE <= 0:
+            raise Exception('MTU error: {} bytes leave no room for payload'.format(mtu))
+        if mtu > MAX_PLPMTU:
+            # receivers size their buffers for MAX_PLPMTU
+            raise Exception('MTU error: packets are limited to {} bytes'.format(MAX_PLPMTU))
+        self.path_mtu.stop()
+        self.__resize(mtu)
+
+    def __resize(self, mtu):
+        with self.send_lock:
+            self.mtu = mtu
+            self.max_payload = mtu - IP_UDP_OVERHEAD - PACKET_HEADER_SIZE
+
+    def __mtu_updated(self, **args):
+        """
+        Resizes next segments to the discovered path MTU. Subscribed method of path MTU discovery
+        """
+        self.__resize(args['mtu'])
+
+    def __send_probe(self, packet):
+        self._send_packet(bytes(packet))
+
+    def _route_mtu(self):
+        """
+        Returns the MTU of the local route to the peer, None where unknown. Sessions owning a socket override it
+        """
+        return None
+
+    def snapshot(self):
+        """
+        Returns session's metrics along with its current sending and receiving state
+        :return: (dict) metrics
+        """
+        snapshot = self.metrics.snapshot()
+        snapshot.update({
+            'lost_packets': self.lost_packets,
+            'in_flight': self.awaiting_ack.in_flight,
+            'outbox': sum(len(stream.outbox) for stream in list(self.__ready)),
+            'cwnd': self.congestion.window(),
+            'srtt': self.rtt.srtt,
+            'rto': self.rtt.rto,
+            'mtu': self.mtu,
+            'reorder_depth': len(self.reorder),
+            'streams': len(self.streams),
+            'stream_occupancy': sum(len(stream.buffer) for stream in list(self.streams.values())),
+            'compression': self.compressor.level if self.compressor else None,
+            'compression_saved': self.compressor.saved if self.compressor else 0,
+            'fec_parity': self.fec.parities() if self.fec else None,
+            'peer_window': self.peer_window,
+            'receive_window': self.advertised,
+        })
+        return snapshot
+
+    def set_compression(self, level):
+        """
+        Compresses outgoing payloads. The peer must support it, as agreed on by the handshake
+        :param level: zlib compression level (1-9), None to stop compressing
+        """
+        with self.send_lock:
+            self.compressor = Compressor(level) if level else None
+
+    def set_fec(self, group, parity=None):
+        """
+        Sends parity packets after every group of payload packets, so the peer rebuilds lost ones without
+        waiting for their retransmission. Peers always decode them
+        :param group: payload packets per group, None to stop forward error correction
+        :param parity: parity packets per group, 1 for XOR parity, more for Reed-Solomon coding. None adapts
+        them to the loss rate
+        """
+        with self.send_lock:
+            if self.fec:
+                self.fec.flush()
+            self.fec = FecEncoder(group, parity) if group else None
+
+    def set_congestion_control(self, algorithm):
+        """
+        Replaces session's congestion control algorithm
+        :param algorithm: algorithm's name ('newreno', 'cubic') or a CongestionControl subclass
+        """
+        with self.send_lock:
+            self.congestion = create_congestion_control(algorithm)
+
+    def _flush(self):
+        """
+        Sends queued payloads while the congestion window, the peer's receive window and the pacer allow it,
+        a packet of each ready stream in turn
+        """
+        with self.send_lock:
+            packets = []
+            parity = []
+            drained = False
+            closed = False
+            segment = self.max_payload - FEC_OVERHEAD if self.fec else self.max_payload
+            cumulative = self.__piggyback_ack() if self.__ready else None
+            while self.active and self.__ready:
+                if self.awaiting_ack.in_flight >= min(self.congestion.window(), SEND_WINDOW) or \
+                        self.awaiting_ack.span(self.next_sent_seq) >= RECEIVE_WINDOW:
+                    # an ack or a drop will open the window. Selective acks release packets past a hole, but the
+                    # peer's reorder buffer only holds RECEIVE_WINDOW packets from the hole on
+                    break
+                delay = self.pacer.delay()
+                if delay > 0:
+                    if not self.pacing_timer:
+                        self.pacing_timer = self.scheduler.schedule(delay, self.__pacing_timeout)
+                    break
+                stream = self.__ready[0]
+                size = len(stream.outbox[0][0])
+                if size > segment:
+                    # queued before the path MTU dropped, the rest goes back to the head of the outbox
+                    payload, deadline, flags = stream.outbox[0]
+                    if not flags & FLAG_UNORDERED:
+                        stream.outbox[0] = (payload[:segment], deadline, flags)
+                        stream.outbox.insert(1, (payload[segment:], deadline, flags))
+                        size = segment
+                if self.awaiting_ack.bytes_in_flight + size > self.peer_window:
+                    if not self.window_probe:
+                        self.__arm_window_timer()
+                        break
+                    # a single segment probes the closed window, carrying what fits and a byte at least, so that
+                    # probing a reader that doesn't read barely grows its buffer
+                    self.window_probe = False
+                    payload, deadline, flags = stream.outbox[0]
+                    room = max(self.peer_window - self.awaiting_ack.bytes_in_flight, 1)
+                    if room < size and not flags & FLAG_UNORDERED:
+                        stream.outbox[0] = (payload[:room], deadline, flags)
+                        stream.outbox.insert(1, (payload[room:], deadline, flags))
+                        size = room
+                payload, deadline, flags = stream.outbox.popleft()
+                self.outbox_bytes -= size
+                if stream.outbox:
+                    self.__ready.rotate(-1)
+                else:
+                    self.__ready.popleft()
+                    drained = True
+                if deadline is not None and time.monotonic() >= deadline:
+                    # expired while queued, it never takes a sequence number
+                    self.metrics.abandoned += 1
+                    continue
+                if self.compressor:
+                    payload, compressed = self.compressor.compress(payload)
+                    if compressed:
+                        flags |= FLAG_COMPRESSED
+                packet = Packet(seq=self.next_sent_seq, oper=PAYLOAD, ack=0, flags=flags, payload=payload,
+                                stream=stream.id)
+                if not flags & FLAG_UNORDERED:
+                    packet.stream_seq = stream.next_seq
+                    stream.next_seq = seq_add(stream.next_seq)
+                if flags & FLAG_FIN:
+                    stream.fin_sent = packet.seq_number
+                    closed = True
+                if cumulative is not None:
+                    packet.flags |= FLAG_ACK
+                    packet.ack_number = cumulative
+                self.awaiting_ack.new_packet(packet, deadline, size)
+                packets.append(packet)
+                if self.fec and packet.payload_size + FEC_OVERHEAD <= self.max_payload:
+                    # segments queued before FEC was turned on are left unprotected
+                    parity += self.fec.add(packet)
+                self.pacer.on_send(self.congestion.pacing_rate())
+                self.__next_seq()
+            if self.fec and not self.__ready:
+                # nothing follows for now, the last group is protected as it is
+                parity += self.fec.flush()
+            if packets:
+                self._send_packets(packets)
+                self.metrics.sent(len(packets), sum(packet.payload_size for packet in packets))
+            elif cumulative is not None:
+                # nothing could be sent after all, the ack can't wait for the next flush
+                ack = Packet(seq=0, oper=ACK, ack=cumulative)
+                self.metrics.acks_sent += 1
+                self._send_packet(bytes(ack))
+            if parity:
+                self._send_packets(parity)
+                self.metrics.fec_sent += len(parity)
+            if drained or not self.__ready:
+                self.send_cond.notify_all()
+                self.drain_emitter.emit()
+        if closed:
+            with self.receive_lock:
+                self.__release_streams()
+
+    def __pacing_timeout(self):
+        with self.send_lock:
+            self.pacing_timer = None
+        self._flush()
+
+    def __arm_window_timer(self):
+        """
+        Arms the persist timer while nothing in flight will bring the ack opening the peer's window. Must be
+        called while holding the send lock
+        """
+        if not self.window_timer and not self.awaiting_ack.in_flight:
+            self.window_timer = self.scheduler.schedule(self.rtt.timeout(self.window_probes), self.__window_timeout)
+
+    def __window_timeout(self):
+        """
+        Lets a segment past the closed window, its ack tells whether the window opened meanwhile
+        """
+        with self.send_lock:
+            self.window_timer = None
+            if not self.active:
+                return
+            self.window_probe = True
+            self.window_probes = min(self.window_probes + 1, RESEND_ATTEMPTS)
+        self._flush()
 
     def __emitted_resend(self, **args):
         """
         Resend packets. Subscribed method awaiting ack list
         """
         packet = args['pkt']
-        self._send_packet(bytes(packet))
+        if 'timeouts' in args:
+            self.path_mtu.on_timeout(len(packet) + IP_UDP_OVERHEAD, args['timeouts'])
+        self.metrics.retransmit(packet.seq_number)
+        self.congestion.on_loss()
+        fec = self.fec
+        if fec:
+            fec.on_loss()
+        if len(packet) + IP_UDP_OVERHEAD > self.mtu:
+            # segmented before a black hole shrank the path MTU, it only gets through fragmented
+            self._send_fragmentable(packet)
+        else:
+            self._send_packet(bytes(packet))
+
+    def __emitted_drop(self, **args):
+        """
+        Handles packets dropped after all resend attempts, the peer is told to skip them rather than wait for
+        them. Subscribed method awaiting ack list
+        """
+        self.metrics.drop(args['seq'])
+        self.congestion.on_timeout()
+        self.__forward(args['pkt'])
+        self._flush()
+
+    def __emitted_abandon(self, **args):
+        """
+        Tells the peer to skip an expired packet that wasn't acked in time. Subscribed method awaiting ack list
+        """
+        self.metrics.abandoned += 1
+        self.congestion.on_loss()
+        self.__forward(args['pkt'])
+        self._flush()
+
+    def __forward(self, packet):
+        """
+        Sends a FORWARD packet standing for a packet that won't be resent, until the peer acks past it
+        :param packet: abandoned or dropped packet
+        """
+        forward = Packet(seq=packet.seq_number, oper=FORWARD, ack=0,
+                         flags=packet.flags & (FLAG_UNORDERED | FLAG_FIN), stream=packet.stream_id,
+                         stream_seq=packet.stream_seq)
+        with self.send_lock:
+            self.forwards[packet.seq_number] = [forward, time.monotonic(), 0]
+            if not self.forward_timer and self.active:
+                self.forward_timer = self.scheduler.schedule(self.rtt.timeout(), self.__forward_timeout)
+        self._send_packet(bytes(forward))
+
+    def __forward_timeout(self):
+        """
+        Resends the FORWARD packets still unacked, the peer may send no ack to resend them on
+        """
+        with self.send_lock:
+            self.forward_timer = None
+            resend = self.__due_forwards()
+            if self.forwards and self.active:
+                now = time.monotonic()
+                delay = min(entry[1] + self.rtt.timeout(entry[2]) - now for entry in self.forwards.values())
+                self.forward_timer = self.scheduler.schedule(max(delay, 0), self.__forward_timeout)
+        for forward in resend:
+            self._send_packet(bytes(forward))
+
+    def __due_forwards(self, backoff=True):
+        """
+        Returns the FORWARD packets whose retransmission timeout expired. They're resent until acked, the peer's
+        stream can't move past the skipped data without them. Must be called while holding the send lock
+        :param backoff: back off like payload retransmissions, False once an ack showed the path works again
+        """
+        now = time.monotonic()
+        resend = []
+        for entry in self.forwards.values():
+            if now - entry[1] >= self.rtt.timeout(entry[2] if backoff else 0):
+                entry[1] = now
+                entry[2] = min(entry[2] + 1, RESEND_ATTEMPTS) if backoff else 1
+                resend.append(entry[0])
+        return resend
+
+    def __resend_forwards(self, cumulative, blocks):
+        """
+        Forgets FORWARD packets the peer acked and resends the others, once per retransmission timeout
+        :param cumulative: next sequence number expected by the peer
+        :param blocks: selectively acked ranges
+        """
+        with self.send_lock:
+            for seq_number in list(self.forwards):
+                if seq_diff(seq_number, cumulative) < 0 or \
+                        any(seq_diff(seq_number, start) >= 0 > seq_diff(seq_number, end) for start, end in blocks):
+                    del self.forwards[seq_number]
+            resend = self.__due_forwards(False)
+            if not self.forwards and self.forward_timer:
+                self.forward_timer.cancel()
+                self.forward_timer = None
+        for forward in resend:
+            self._send_packet(bytes(forward))
 
     def _send_packet(self, packet): pass
 
+    def _send_fragmentable(self, packet):
+        """
+        Sends a packet the network may fragment. Sessions owning a socket override it
+        """
+        self._send_packet(bytes(packet))
+
+    def _send_packets(self, packets):
+        """
+        Sends a batch of packets to the peer. Sessions with a batching socket override it
+        """
+        for packet in packets:
+            self._send_packet(packet)
+
     # abstract
-    def close(self): pass
+    def close(self, wait=True): pass
+
+    def _send_fin(self, expired, attempts=0):
+        """
+        Sends FIN, resent by the session's timers every retransmission timeout until _fin_answered is called
+        :param expired: called once FIN_ATTEMPTS FINs went unanswered
+        :param attempts: FINs already sent
+        """
+        with self.send_lock:
+            if not attempts:
+                self.fin_pending = True
+            elif not self.fin_pending:
+                return
+            if attempts >= FIN_ATTEMPTS:
+                self.fin_pending = False
+                self.fin_timer = None
+            else:
+                self.fin_timer = self.scheduler.schedule(min(self.rtt.timeout(attempts), FIN_TIMEOUT),
+                                                         self._send_fin, expired, attempts + 1)
+        if attempts >= FIN_ATTEMPTS:
+            expired()
+        else:
+            self._send_packet(Packet(seq=0, oper=FIN))
+
+    def _drain(self, done, timeout=None):
+        """
+        Calls done once all queued data was acked or given up, so that FIN doesn't cut it short. Done is called
+        all the same once the timeout expires or the session is closed
+        :param done: method called without arguments, from the thread of the last ack or timer
+        :param timeout: seconds to wait at most, None until the peer acked everything
+        """
+        with self.send_lock:
+            if self.active and not self._idle():
+                self.drain_callback = done
+                if timeout is not None:
+                    self.drain_timer = self.scheduler.schedule(timeout, self.__drain_done)
+                return
+        done()
+
+    def __check_drained(self, **args):
+        """
+        Ends draining once the last queued data was acked. Subscribed method of drain emitter
+        """
+        if self.drain_callback and (not self.active or self._idle()):
+            self.__drain_done()
+
+    def __drain_done(self):
+        with self.send_lock:
+            done = self.drain_callback
+            self.drain_callback = None
+            if self.drain_timer:
+                self.drain_timer.cancel()
+                self.drain_timer = None
+        if done:
+            done()
+
+    def _fin_answered(self):
+        """
+        Stops resending FIN once the peer answered it
+        """
+        with self.send_lock:
+            self.fin_pending = False
+            if self.fin_timer:
+                self.fin_timer.cancel()
+                self.fin_timer = None
 
     def close_session(self):
         """
         closes local session
         """
         self.awaiting_ack.close()
-        self.run_heap = False
-        self.stream = bytes()
\ No newline at end of file
+        self.path_mtu.stop()
+        with self.send_lock:
+            self.active = False
+            self.forwards.clear()
+            if self.forward_timer:
+                self.forward_timer.cancel()
+                self.forward_timer = None
+            if self.pacing_timer:
+                self.pacing_timer.cancel()
+            if self.window_timer:
+                self.window_timer.cancel()
+                self.window_timer = None
+            self.send_cond.notify_all()
+            self.drain_emitter.emit()
+        with self.receive_lock:
+            for owner in [self] + list(self.streams.values()):
+                if owner.gap_timer:
+                    owner.gap_timer.cancel()
+                    owner.gap_timer = None
+            self.__reset_delayed_ack()
+            for stream in self.streams.values():
+                if stream.sink:
+                    stream.sink.interrupt()
+        for stream in list(self.streams.values()):
+            stream.buffer.close()
+        # wakes up accept_stream callers
+        self._stream_opened(None)
\ No newline at end of file
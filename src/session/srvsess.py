@@ -1,74 +1,167 @@
-import time
+import threading, time
 from .session import Session
-from ..models.packet import Packet
-from ..models.constants import ACK, FIN, FIN_ACK, FIN_ATTEMPTS, FIN_TIMEOUT
-from ..sockets.sock import Socket
+from ..models.constants import ACK, FIN, FIN_ACK, TIME_WAIT, EGRESS_DEFAULT_CLASS, DRAIN_TIMEOUT
+from ..models.event import EventEmitter
 
 class ClientConnection(Session):
     """
     Handling session with a client on server's side
     """
-    def __init__(self, address, server_seq, client_seq, new_pkt_emitter):
-        super().__init__(address, server_seq, client_seq)
-        self.income_pkt_emitter = new_pkt_emitter
-        self.income_pkt_emitter.subscribe(self.__new_packet_emitter)
-        self.send_socket = Socket()
+    def __init__(self, address, server_seq, client_seq, socket_wrapper, scheduler=None, egress=None):
+        """
+        :param address: client's address
+        :param server_seq: server's initial sequence number
+        :param client_seq: client's initial sequence number
+        :param socket_wrapper: server's socket, shared by all sessions
+        :param scheduler: timer scheduler of session's timers
+        :param egress: server's egress scheduler queuing session's datagrams, None to write them straight to the
+        socket
+        """
+        super().__init__(address, server_seq, client_seq, scheduler)
+        self.socket = socket_wrapper
+        self.egress = egress
+        self.pmtu_discovery = self.pmtu_discovery and socket_wrapper.pmtu_discovery
+        self.close_emitter = EventEmitter()
 
         self.closing_process = False
         self.session_closed = False
+        self.close_started = None
+        # set once the session is closed, and whether the client never answered our FIN
+        self.closed = threading.Event()
+        self.close_failed = False
+        self.linger_timer = None
 
-    def __new_packet_emitter(self, **args):
+    def handle_packet(self, packet):
         """
-        Handles new income packets
+        Handles an income packet the server routed to this session
+        :param packet: income packet
         """
-        if args['address'] == self.address[1]:
-            packet = args['pkt']
-            if packet.operation == FIN:
-                self.__send_packet(bytes(packet.ack()))
+        if not packet.verify_checksum():
+            self.metrics.checksum_errors += 1
+            return
+        if packet.operation == FIN:
+            self._send_packet(bytes(packet.ack()))
+            if not self.closing_process:
+                if self.close_started is None:
+                    self.close_started = time.monotonic()
                 self.closing_process = True
-            elif self.closing_process:
-                if packet.operation == ACK:
-                    self.close_session()
-                    self.session_closed = True
-                    # print('Connection closed')
-                elif packet.operation == FIN_ACK:
-                    self.__send_packet(bytes(packet.ack()))
-                    self.session_closed = True
-                    # print('Connection closed')
-
-            else:
-                self._Session__income_packet(packet)
-
-    def receive(self, buffer):
+                # the client's final ACK may be lost
+                self.linger_timer = self.scheduler.schedule(TIME_WAIT, self.__linger_expired)
+        elif self.closing_process:
+            if packet.operation == ACK and self.linger_timer:
+                # the client's final ACK, data acks may still arrive after our FIN
+                self.close_session()
+                self.__set_closed()
+                # print('Connection closed')
+            elif packet.operation == FIN_ACK:
+                self._fin_answered()
+                self._send_packet(bytes(packet.ack()))
+                self.close_session()
+                self.__set_closed()
+                # print('Connection closed')
+
+        else:
+            self._Session__income_packet(packet)
+
+    def __set_closed(self):
+        if not self.session_closed:
+            self.session_closed = True
+            self._fin_answered()
+            if self.linger_timer:
+                self.linger_timer.cancel()
+            if self.close_started is not None and not self.close_failed:
+                self.metrics.closed(time.monotonic() - self.close_started)
+            self.close_emitter.emit(session=self)
+            self.closed.set()
+
+    def __linger_expired(self):
+        """
+        Closes a session the client closed, its final ACK never came
+        """
+        self.close_session()
+        self.__set_closed()
+
+    def __fin_expired(self):
+        """
+        Closes the session once the client left our FINs unanswered
+        """
+        if not self.session_closed:
+            self.close_failed = True
+            self.close_session()
+            self.__set_closed()
+
+    def __drained(self):
+        """
+        Sends FIN once the queued data was acked, or gave up on it
+        """
+        if self.closing_process:
+            # the client closed meanwhile, its FIN is answered
+            return
+        if not self.active:
+            # closed by the server meanwhile
+            self.close_failed = True
+            self.__set_closed()
+            return
+        self.closing_process = True
+        self._send_fin(self.__fin_expired)
+
+    def receive(self, buffer, timeout=None):
         if self.session_closed:
             raise Exception("Data transfer failure: connection is closed")
-        return Session.receive(self, buffer)
+        return Session.receive(self, buffer, timeout)
 
-    def send(self, packet):
+    def receive_into(self, buffer, timeout=None):
         if self.session_closed:
             raise Exception("Data transfer failure: connection is closed")
-        Session.send(self, packet)
+        return Session.receive_into(self, buffer, timeout)
+
+    def send(self, data, ttl=None, ordered=True):
+        if self.session_closed:
+            raise Exception("Data transfer failure: connection is closed")
+        Session.send(self, data, ttl, ordered)
+
+    def _send_packet(self, data):
+        if self.egress:
+            self.egress.send(self, data)
+        else:
+            self.socket.send(self.address, data)
 
-    def __send_packet(self, data):
-        self.send_socket.send(self.address, data)
+    def _send_fragmentable(self, packet):
+        # rare enough to bypass the egress scheduler
+        self.socket.send_fragmentable(self.address, packet)
 
-    def close(self):
+    def _send_packets(self, packets):
+        if self.egress:
+            self.egress.send_batch(self, packets)
+        else:
+            self.socket.send_batch(self.address, packets)
+
+    def set_egress(self, rate=None, burst=None, weight=1, priority=EGRESS_DEFAULT_CLASS):
         """
-        Closes session
+        Sets session's share of the server's bandwidth, the server must schedule its egress
+        :param rate: bandwidth cap in bytes per second, None for no cap
+        :param burst: bytes of the cap sent back to back
+        :param weight: share relative to the other sessions of its class
+        :param priority: class, 0 is served first
         """
-        self.close_session()
-        self.closing_process = True
-        fin = Packet(seq=0, oper=FIN)
-        self.__send_packet(fin)
-        attempts = 0
-        time.sleep(FIN_TIMEOUT)
-        while attempts < FIN_ATTEMPTS:
-            if self.session_closed:
-                break
-            else:
-                time.sleep(FIN_TIMEOUT)
-                self.__send_packet(fin)
-                attempts += 1
+        if not self.egress:
+            raise Exception("Egress error: the server doesn't schedule its egress")
+        self.egress.configure(self, rate, burst, weight, priority)
 
-        if not self.session_closed:
-            raise Exception('Connection close error: timeout error, server did not respond')
+    def _route_mtu(self):
+        return self.socket.path_mtu(self.address)
+
+    def close(self, wait=True, timeout=DRAIN_TIMEOUT):
+        """
+        Closes session. FIN is sent once the queued data was acked, and resent by the session's timers until the
+        client answers
+        :param wait: block until the client answered, False to return at once
+        :param timeout: seconds the queued data may take to be acked, None to wait until all of it is
+        """
+        if not self.closing_process and self.close_started is None:
+            self.close_started = time.monotonic()
+            self._drain(self.__drained, timeout)
+        if wait:
+            self.closed.wait()
+            if self.close_failed:
+                raise Exception('Connection close error: timeout error, client did not respond')
@@ -0,0 +1,93 @@
+import collections
+from .models.stream import ByteStream
+from .models.reorder import ReorderBuffer
+
+
+class Stream:
+    """
+    Ordered byte stream multiplexed in a session. Streams share the session's acks and congestion control, but
+    each one is ordered on its own, so a lost packet only holds back the data of its stream
+    """
+    def __init__(self, session, stream_id):
+        """
+        :param session: session carrying the stream
+        :param stream_id: stream's id, 0 is the session's default stream
+        """
+        self.session = session
+        self.id = stream_id
+        # income payloads, ordered by stream sequence number
+        self.buffer = ByteStream()
+        # reading frees receive window the peer may be waiting for
+        self.buffer.read_emitter.subscribe(session._window_update)
+        # file the in order data is written to instead of the buffer, while receive_to_file runs
+        self.sink = None
+        self.reorder = ReorderBuffer(0)
+        self.gap_timer = None
+        self.gap_seq = None
+        # outgoing (payload, deadline, flags) waiting for their turn and the next stream sequence number
+        self.outbox = collections.deque()
+        self.next_seq = 0
+        # closing: whether this side closed the stream, the session sequence numbers of its FIN and of the peer's
+        # FIN, the stream sequence number of the peer's FIN, and whether all the peer's data up to it arrived
+        self.closing = False
+        self.fin_sent = None
+        self.fin_received = None
+        self.fin_seq = None
+        self.finished = False
+
+    def send(self, data, ttl=None, ordered=True):
+        """
+        Sends data on the stream
+        :param data: data to send
+        :param ttl: seconds the data is worth delivering, None to deliver it reliably
+        :param ordered: False to deliver the data as soon as it arrives, it must fit in a packet
+        """
+        self.session._send_on(self, data, ttl, ordered)
+
+    def send_file(self, file, offset=0, count=None):
+        """
+        Sends a file on the stream, memory mapped and segmented without copies
+        :param file: file path, or binary file object opened for reading
+        :param offset: position of the first byte to send
+        :param count: number of bytes to send, None up to the end of the file
+        :return: (int) number of bytes sent, returned once the peer acked all of them
+        """
+        return self.session._send_file_on(self, file, offset, count)
+
+    def close(self):
+        """
+        Closes the stream's sending side, the peer reads the end of the stream once the queued data arrived.
+        The stream is released once both sides closed it and its data was read
+        """
+        self.session._close_stream(self)
+
+    def receive(self, length, timeout=None):
+        """
+        Returns data received on the stream
+        :param length: max data length
+        :param timeout: seconds to wait for data, None blocks until data arrives, 0 doesn't wait
+        :return: (bytes) data, empty on timeout or once the peer closed the stream and its data was read
+        """
+        return self.buffer.fetch(length, timeout)
+
+    def receive_into(self, buffer, timeout=None):
+        """
+        Writes data received on the stream straight into a caller's buffer
+        :param buffer: writable bytes-like object (bytearray, memoryview)
+        :param timeout: seconds to wait for data, None blocks until data arrives, 0 doesn't wait
+        :return: (int) number of bytes written
+        """
+        return self.buffer.fetch_into(buffer, timeout)
+
+    def receive_to_file(self, file, length, timeout=None):
+        """
+        Writes data received on the stream straight into a file
+        :param file: file path, or binary file object written from its current position
+        :param length: number of bytes to receive
+        :param timeout: seconds to wait for all the data, None blocks until it arrives
+        :return: (int) number of bytes written
+        """
+        return self.session._receive_file_on(self, file, length, timeout)
+
+    def __repr__(self):
+        return 'Stream {} of session {}'.format(self.id, self.session.id)
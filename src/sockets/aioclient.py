@@ -0,0 +1,156 @@
+import asyncio
+from ..models.packet import Packet, generate_id, parse_packet
+from ..session.aiosess import AsyncSession
+from .sock import set_buffer_size
+from ..models.constants import SYN, SYN_ACK, ACK, SYN_TIMEOUT, SYN_ATTEMPTS, FLAG_COMPRESSED, \
+    SOCKET_BUFFER_SIZE, MAX_PLPMTU, DRAIN_TIMEOUT
+
+
+class _ClientProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, address):
+        self.client._datagram_received(parse_packet(data), address)
+
+
+class AsyncReliableSocket:
+    """
+    Client side reliable UDP socket running on an asyncio event loop
+    """
+    def __init__(self, ip, port, mtu=None, compression=None):
+        """
+        :param ip: Host's IP address
+        :param port: Host's port number
+        :param mtu: fixed IP packet size, None to discover the path MTU
+        :param compression: zlib level (1-9) of payload compression if the server supports it, None to turn it off
+        """
+        self.address = (ip, port)
+        if mtu and mtu > MAX_PLPMTU:
+            raise Exception('MTU error: packets are limited to {} bytes'.format(MAX_PLPMTU))
+        self.mtu = mtu
+        self.compression = compression
+        self.syn_attempts = SYN_ATTEMPTS
+        self.syn_timeout = SYN_TIMEOUT
+        self.transport = None
+        self.session = None
+        self.__syn_ack = None
+
+    async def connect(self):
+        """
+        Connect to server
+        """
+        if self.session:
+            raise Exception('Connection Error: session is already established')
+
+        loop = asyncio.get_running_loop()
+        self.transport, protocol = await loop.create_datagram_endpoint(
+            lambda: _ClientProtocol(self), local_addr=('0.0.0.0', 0))
+        set_buffer_size(self.transport.get_extra_info('socket'), SOCKET_BUFFER_SIZE)
+        # client's initial sequence number
+        initial_seq_number = generate_id()
+        syn_packet = Packet(seq=initial_seq_number, oper=SYN, flags=FLAG_COMPRESSED if self.compression else 0)
+        self.__syn_ack = loop.create_future()
+        started = loop.time()
+        for attempt in range(self.syn_attempts):
+            self.transport.sendto(bytes(syn_packet), self.address)
+            try:
+                packet = await asyncio.wait_for(asyncio.shield(self.__syn_ack), self.syn_timeout)
+                break
+            except asyncio.TimeoutError:
+                continue
+        else:
+            self.transport.close()
+            self.transport = None
+            raise Exception('Connection failure: timeout error')
+
+        compressed = bool(self.compression and packet.flags & FLAG_COMPRESSED)
+        # acks server's initial sequence number, a SYN cookie if the server kept no state
+        ack = Packet(seq=initial_seq_number, oper=ACK, ack=packet.seq_number, flags=FLAG_COMPRESSED if compressed else 0)
+        self.transport.sendto(bytes(ack), self.address)
+        self.session = AsyncSession(self.address, initial_seq_number, packet.seq_number, self.transport, loop)
+        self.session.handshake_ack = ack
+        self.session.metrics.handshake(loop.time() - started)
+        self.session.configure_mtu(self.mtu)
+        if compressed:
+            self.session.set_compression(self.compression)
+
+    def _datagram_received(self, packet, address):
+        if self.session:
+            self.session.handle_packet(packet)
+        elif packet.operation == SYN_ACK and packet.verify_checksum() and self.__syn_ack and not self.__syn_ack.done():
+            self.__syn_ack.set_result(packet)
+
+    async def close(self, timeout=DRAIN_TIMEOUT):
+        """
+        Closes session once the data sent was acked
+        :param timeout: seconds the data sent may take to be acked, None to wait until all of it is
+        """
+        if not self.session:
+            raise Exception('Close connection failure: no session is established')
+        try:
+            await self.session.close(timeout)
+        finally:
+            self.session = None
+            self.transport.close()
+            self.transport = None
+
+    async def receive(self, buffer):
+        """
+        Returns data from server
+        :param buffer: Data's length
+        """
+        if not self.session:
+            raise Exception("Data transfer failure: connection is closed or not established")
+        return await self.session.receive(buffer)
+
+    async def receive_into(self, buffer):
+        """
+        Writes data from server straight into a caller's buffer
+        :param buffer: writable bytes-like object (bytearray, memoryview)
+        """
+        if not self.session:
+            raise Exception("Data transfer failure: connection is closed or not established")
+        return await self.session.receive_into(buffer)
+
+    async def send(self, data, ttl=None, ordered=True):
+        """
+        Sends data to server
+        :param data: (str or bytes) data to send
+        :param ttl: seconds the data is worth delivering, None to deliver it reliably
+        :param ordered: False to deliver the data as soon as it arrives, it must fit in a packet
+        """
+        if not self.session:
+            raise Exception("Data transfer failure: connection is closed or not established")
+        await self.session.send(data, ttl, ordered)
+
+    async def send_file(self, file, offset=0, count=None):
+        """
+        Sends a file to server, memory mapped and segmented without copies
+        :param file: file path, or binary file object opened for reading
+        :param offset: position of the first byte to send
+        :param count: number of bytes to send, None up to the end of the file
+        :return: (int) number of bytes sent, returned once the peer acked all of them
+        """
+        if not self.session:
+            raise Exception("Data transfer failure: connection is closed or not established")
+        return await self.session.send_file(file, offset, count)
+
+    async def receive_to_file(self, file, length):
+        """
+        Writes data from server straight into a file
+        :param file: file path, or binary file object written from its current position
+        :param length: number of bytes to receive
+        :return: (int) number of bytes written
+        """
+        if not self.session:
+            raise Exception("Data transfer failure: connection is closed or not established")
+        return await self.session.receive_to_file(file, length)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.session:
+            await self.close()
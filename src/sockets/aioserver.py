@@ -0,0 +1,223 @@
+import asyncio, time
+from ..models.packet import Packet, generate_id, parse_packet
+from ..models.sequence import seq_diff
+from ..session.aiosess import AsyncSession
+from ..models.metrics import ServerMetrics
+from .cookies import SynCookies
+from .sock import set_buffer_size
+from ..models.constants import SYN, SYN_ACK, ACK, PAYLOAD, FLAG_COMPRESSED, SEQ_LIMIT, SYN_BACKLOG, SYN_ATTEMPTS, \
+    SYN_TIMEOUT, SOCKET_BUFFER_SIZE, MAX_PLPMTU, RECEIVE_WINDOW
+
+
+class _ServerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, address):
+        self.server._datagram_received(parse_packet(data), address)
+
+
+class AsyncReliableServer:
+    """
+    Reliable UDP server running on an asyncio event loop
+    """
+    def __init__(self, ip, port, mtu=None, compression=None, syn_cookies=None):
+        """
+        :param ip: Host's IP address
+        :param port: Host's port number
+        :param mtu: fixed IP packet size of sessions, None to discover each path MTU
+        :param compression: zlib level (1-9) of payload compression with clients supporting it, None to turn it off
+        :param syn_cookies: True to answer every SYN statelessly with a cookie, False never to, None once
+        SYN_BACKLOG handshakes are pending
+        """
+        self.address = (ip, port)
+        if mtu and mtu > MAX_PLPMTU:
+            raise Exception('MTU error: packets are limited to {} bytes'.format(MAX_PLPMTU))
+        self.mtu = mtu
+        self.compression = compression
+        self.transport = None
+        self.loop = None
+        # sessions keyed by client's (ip, port) address
+        self.sessions = {}
+        # sessions of pending handshakes, by client's address
+        self.awaiting_connections = {}
+        self.syn_cookies = syn_cookies
+        self.cookies = SynCookies() if syn_cookies is not False else None
+        self.metrics = ServerMetrics()
+        self.available_sessions = asyncio.Queue()
+        self.acceptors = 0
+
+    async def listen(self):
+        """
+        Binds the server's endpoint and starts handling clients
+        """
+        if self.transport:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.transport, protocol = await self.loop.create_datagram_endpoint(
+            lambda: _ServerProtocol(self), local_addr=self.address)
+        set_buffer_size(self.transport.get_extra_info('socket'), SOCKET_BUFFER_SIZE)
+
+    def _datagram_received(self, packet, address):
+        """
+        Routes an income packet to its session
+        """
+        self.metrics.datagrams_received += 1
+        session = self.sessions.get(address)
+        if session:
+            session.handle_packet(packet)
+        elif not packet.verify_checksum():
+            self.metrics.checksum_errors += 1
+        elif packet.operation == SYN:
+            self.__handle_syn(address, packet)
+        elif packet.operation == ACK:
+            self.__handle_ack(address, packet)
+        elif packet.operation == PAYLOAD:
+            self.__handle_payload(address, packet)
+        else:
+            self.metrics.unknown_packets += 1
+
+    def __handle_syn(self, address, packet):
+        """
+        Handles SYN request
+        :param address: Client's address
+        :param packet: SYN packet
+        """
+        self.metrics.syn_received += 1
+        if self.acceptors <= 0:
+            return
+        # both sides must support compression
+        compressed = bool(self.compression and packet.flags & FLAG_COMPRESSED)
+
+        if address in self.awaiting_connections:
+            # SYN_ACK was lost, answer with the same initial sequence number
+            initial_seq_number = self.awaiting_connections[address].next_sent_seq
+        elif self.cookies and (self.syn_cookies or len(self.awaiting_connections) >= SYN_BACKLOG):
+            # nothing is kept until the client's ACK returns the cookie
+            initial_seq_number = self.cookies.make(address, packet.seq_number)
+            self.metrics.syn_cookies += 1
+        else:
+            # Session's initial sequence number
+            initial_seq_number = generate_id()
+            session = AsyncSession(address, initial_seq_number, packet.seq_number, self.transport, self.loop)
+            if compressed:
+                session.set_compression(self.compression)
+            self.awaiting_connections[address] = session
+            self.loop.call_later(SYN_ATTEMPTS * SYN_TIMEOUT, self.__handshake_expired, address, session)
+        syn_ack = packet.ack(initial_seq_number)
+        if compressed:
+            syn_ack.flags |= FLAG_COMPRESSED
+        self.transport.sendto(bytes(syn_ack), address)
+
+    def __handle_ack(self, address, packet):
+        """
+        Handles ACK request
+        :param address: Client's address
+        :param packet: ACK packet
+        """
+        session = self.awaiting_connections.get(address)
+        if session:
+            if packet.ack_number % SEQ_LIMIT != session.next_sent_seq:
+                return
+            del self.awaiting_connections[address]
+            session.metrics.handshake(time.time() - session.timestamp)
+        elif self.cookies:
+            # the client's ACK carries its initial sequence number and acks the cookie
+            if not self.cookies.check(address, packet.seq_number, packet.ack_number):
+                self.metrics.invalid_cookies += 1
+                return
+            session = AsyncSession(address, packet.ack_number, packet.seq_number, self.transport, self.loop)
+            if self.compression and packet.flags & FLAG_COMPRESSED:
+                session.set_compression(self.compression)
+        else:
+            return
+        self.__established(address, session)
+
+    def __handle_payload(self, address, packet):
+        """
+        Handles a payload of a client without a session, whose handshake ACK was lost. A payload within the
+        receive window of a pending handshake completes it, as data carrying an ACK does in TCP. Otherwise the
+        client is answered with SYN_ACK so it sends its ACK again
+        :param address: Client's address
+        :param packet: PAYLOAD packet
+        """
+        session = self.awaiting_connections.get(address)
+        if session and 0 <= seq_diff(packet.seq_number, session.reorder.base) < RECEIVE_WINDOW:
+            del self.awaiting_connections[address]
+            session.metrics.handshake(time.time() - session.timestamp)
+            self.__established(address, session)
+            session.handle_packet(packet)
+            return
+        if session:
+            syn_ack = Packet(seq=session.next_sent_seq, oper=SYN_ACK, ack=0)
+        elif self.cookies and self.acceptors > 0:
+            # no state was kept, the client's ACK carries the cookie
+            syn_ack = Packet(seq=0, oper=SYN_ACK, ack=0)
+        else:
+            self.metrics.unknown_packets += 1
+            return
+        self.metrics.handshake_acks_requested += 1
+        self.transport.sendto(bytes(syn_ack), address)
+
+    def __established(self, address, session):
+        """
+        Moves a session whose handshake completed to the sessions table, and hands it to accept()
+        """
+        self.sessions[address] = session
+        session.close_emitter.subscribe(self.__session_closed)
+        session.configure_mtu(self.mtu)
+        self.metrics.accepted(session)
+        self.available_sessions.put_nowait(session)
+
+    def __handshake_expired(self, address, session):
+        """
+        Forgets a pending handshake whose ACK never came
+        """
+        if self.awaiting_connections.get(address) is session:
+            del self.awaiting_connections[address]
+            self.metrics.handshakes_expired += 1
+
+    def __session_closed(self, **args):
+        """
+        Removes a closed session from the sessions table
+        """
+        session = args['session']
+        if self.sessions.get(session.address) is session:
+            del self.sessions[session.address]
+            self.metrics.closed(session)
+
+    def snapshot(self, sessions=False):
+        """
+        Returns server's metrics
+        :param sessions: include the snapshot of every active session
+        :return: (dict) metrics
+        """
+        return self.metrics.snapshot(self.sessions if sessions else None)
+
+    async def accept(self):
+        """
+        Accepts new clients
+        :return: (AsyncSession) new session with client
+        """
+        self.acceptors += 1
+        try:
+            return await self.available_sessions.get()
+        finally:
+            self.acceptors -= 1
+
+    async def shutdown(self):
+        """
+        Closes all sessions and the server's endpoint
+        """
+        sessions = list(self.sessions.values())
+        await asyncio.gather(*(session.close() for session in sessions), return_exceptions=True)
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+
+    async def __aenter__(self):
+        await self.listen()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.shutdown()
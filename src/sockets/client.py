@@ -1,20 +1,27 @@
-import socket
+import socket, time
 from .sock import Socket
 from ..models.packet import Packet, generate_id
 from ..session.cltsess import ClientSession
-from ..models.constants import SYN, SYN_ACK, SYN_TIMEOUT, SYN_ATTEMPTS
+from ..models.constants import SYN, SYN_ACK, ACK, SYN_TIMEOUT, SYN_ATTEMPTS, FLAG_COMPRESSED, MAX_PLPMTU, \
+    DRAIN_TIMEOUT
 
 class ReliableSocket:
     """
     Client side reliable UDP socket
     """
-    def __init__(self, ip, port):
+    def __init__(self, ip, port, mtu=None, compression=None):
         """
         :param ip: Host's IP address
         :param port: Host's port number
+        :param mtu: fixed IP packet size, None to discover the path MTU
+        :param compression: zlib level (1-9) of payload compression if the server supports it, None to turn it off
         """
         self.socket = Socket()
         self.address = (ip, port)
+        if mtu and mtu > MAX_PLPMTU:
+            raise Exception('MTU error: packets are limited to {} bytes'.format(MAX_PLPMTU))
+        self.mtu = mtu
+        self.compression = compression
         self.syn_attempts = SYN_ATTEMPTS
         self.syn_timeout = SYN_TIMEOUT
         self.session = None
@@ -28,7 +35,8 @@ class ReliableSocket:
 
         # client's initial sequence number
         initial_seq_number = generate_id()
-        syn_packet = Packet(seq=initial_seq_number, oper=SYN)
+        syn_packet = Packet(seq=initial_seq_number, oper=SYN, flags=FLAG_COMPRESSED if self.compression else 0)
+        started = time.monotonic()
         self.socket.send(self.address, bytes(syn_packet))
         self.socket.set_timeout(self.syn_timeout)
         attempts = 0
@@ -36,40 +44,99 @@ class ReliableSocket:
             try:
                 attempts += 1
                 packet, address = self.socket.read_packet()
-                if packet.operation == SYN_ACK:
-                    self.socket.send(self.address, bytes(packet.ack()))
+                if packet.operation == SYN_ACK and packet.verify_checksum():
+                    compressed = bool(self.compression and packet.flags & FLAG_COMPRESSED)
+                    # acks server's initial sequence number, a SYN cookie if the server kept no state
+                    ack = Packet(seq=initial_seq_number, oper=ACK, ack=packet.seq_number,
+                                 flags=FLAG_COMPRESSED if compressed else 0)
+                    self.socket.send(self.address, bytes(ack))
                     self.socket.set_timeout(None)
                     self.session = ClientSession(self.address, initial_seq_number, packet.seq_number, self.socket)
+                    self.session.handshake_ack = ack
+                    self.session.metrics.handshake(time.monotonic() - started)
+                    self.session.configure_mtu(self.mtu)
+                    if compressed:
+                        self.session.set_compression(self.compression)
                     print ('Connection established')
                     break
             except socket.timeout as e:
                 if attempts >= self.syn_attempts:
                     raise Exception('Connection failure: timeout error')
+                # SYN or SYN_ACK was lost, the server answers a repeated SYN with the same SYN_ACK
+                self.socket.send(self.address, bytes(syn_packet))
 
-    def close(self):
+    def close(self, wait=True, timeout=DRAIN_TIMEOUT):
         """
-        Closes session
+        Closes session once the data sent was acked
+        :param wait: block until the server answered, False to return at once
+        :param timeout: seconds the data sent may take to be acked, None to wait until all of it is
         """
         if not self.session:
             raise Exception('Close connection failure: no session is established')
-        self.session.close()
+        self.session.close(wait, timeout)
         self.session = None
 
-    def receive(self, buffer):
+    def receive(self, buffer, timeout=None):
         """
         Returns data from server
         :param buffer: Data's length
+        :param timeout: seconds to wait for data, None blocks until data arrives, 0 doesn't wait
         """
         if not self.session:
             raise Exception("Data transfer failure: connection is closed or not established")
-        return self.session.receive(buffer)
+        return self.session.receive(buffer, timeout)
 
-    def send(self, data):
+    def receive_into(self, buffer, timeout=None):
+        """
+        Writes data from server straight into a caller's buffer
+        :param buffer: writable bytes-like object (bytearray, memoryview)
+        :param timeout: seconds to wait for data, None blocks until data arrives, 0 doesn't wait
+        :return: number of bytes written
+        """
+        if not self.session:
+            raise Exception("Data transfer failure: connection is closed or not established")
+        return self.session.receive_into(buffer, timeout)
+
+    def send(self, data, ttl=None, ordered=True):
         """
         Sends data to server
         :param data: (str or bytes) data to send
+        :param ttl: seconds the data is worth delivering, None to deliver it reliably
+        :param ordered: False to deliver the data as soon as it arrives, it must fit in a packet
+        """
+        if not self.session:
+            raise Exception("Data transfer failure: connection is closed or not established")
+        self.session.send(data, ttl, ordered)
+
+    def set_blocking(self, blocking):
+        """
+        Sets whether send waits for the data to be sent, or raises BlockingIOError once server's window is full
+        :param blocking: False to send without waiting
         """
         if not self.session:
             raise Exception("Data transfer failure: connection is closed or not established")
-        self.session.send(data)
+        self.session.set_blocking(blocking)
 
+    def send_file(self, file, offset=0, count=None):
+        """
+        Sends a file to server, memory mapped and segmented without copies
+        :param file: file path, or binary file object opened for reading
+        :param offset: position of the first byte to send
+        :param count: number of bytes to send, None up to the end of the file
+        :return: (int) number of bytes sent, returned once the peer acked all of them
+        """
+        if not self.session:
+            raise Exception("Data transfer failure: connection is closed or not established")
+        return self.session.send_file(file, offset, count)
+
+    def receive_to_file(self, file, length, timeout=None):
+        """
+        Writes data from server straight into a file
+        :param file: file path, or binary file object written from its current position
+        :param length: number of bytes to receive
+        :param timeout: seconds to wait for all the data, None blocks until it arrives
+        :return: (int) number of bytes written
+        """
+        if not self.session:
+            raise Exception("Data transfer failure: connection is closed or not established")
+        return self.session.receive_to_file(file, length, timeout)
@@ -0,0 +1,176 @@
+import multiprocessing, os, queue, threading, time
+from .server import ReliableServer
+from ..models.constants import CLUSTER_STATS_INTERVAL, CLUSTER_START_TIMEOUT, FIN_TIMEOUT
+
+# seconds between the liveness checks of workers that didn't listen yet
+_START_POLL = 0.1
+
+
+def _worker(ip, port, index, handler, mtu, compression, events, stop, interval):
+    """
+    Worker process: serves the clients the kernel hashed to its socket, each session by a handler thread
+    """
+    try:
+        server = ReliableServer(ip, port, mtu, reuse_port=True, compression=compression)
+        server.listen()
+    except Exception as error:
+        # the parent fails to start rather than waiting for the worker
+        events.put(('error', index, '{}: {}'.format(type(error).__name__, error)))
+        events.close()
+        events.join_thread()
+        raise
+
+    def accept():
+        while True:
+            session = server.accept()
+            events.put(('accept', index, session.address))
+            threading.Thread(target=handler, args=(session,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    events.put(('ready', index, None))
+    while not stop.wait(interval):
+        events.put(('stats', index, server.snapshot()))
+    events.put(('stats', index, server.snapshot()))
+    events.close()
+    events.join_thread()
+    # sessions say goodbye within the parent's join timeout
+    server.shutdown(timeout=FIN_TIMEOUT)
+    # session threads never return
+    os._exit(0)
+
+
+class ReliableCluster:
+    """
+    Reliable UDP server sharded over worker processes. Every worker binds the same port with SO_REUSEPORT,
+    the kernel spreads clients among them by flow hash and each worker runs its sessions end to end, so the
+    server scales with the number of cores
+    """
+    def __init__(self, ip, port, handler, workers=None, mtu=None, stats_interval=CLUSTER_STATS_INTERVAL,
+                 compression=None):
+        """
+        :param ip: Host's IP address
+        :param port: Host's port number
+        :param handler: function called with every accepted session, in a thread of its worker. It runs in
+        another process, so it must be picklable (a module level function)
+        :param workers: number of worker processes, the number of cores by default
+        :param mtu: fixed IP packet size of sessions, None to discover each path MTU
+        :param stats_interval: seconds between workers' stats reports
+        :param compression: zlib level (1-9) of payload compression with clients supporting it, None to turn it off
+        """
+        self.address = (ip, port)
+        self.handler = handler
+        self.workers = workers if workers else os.cpu_count()
+        self.mtu = mtu
+        self.compression = compression
+        self.stats_interval = stats_interval
+        self.context = multiprocessing.get_context('spawn')
+        self.events = self.context.Queue()
+        self.stop = self.context.Event()
+        self.processes = []
+        # accepted (worker, client's address) hand-offs and the latest stats of every worker
+        self.accepted = queue.Queue()
+        self.stats = {}
+        # released once per listening worker, and the errors of workers that failed to start by index
+        self.ready = threading.Semaphore(0)
+        self.listening = set()
+        self.errors = {}
+        self.run = False
+
+    def start(self, timeout=CLUSTER_START_TIMEOUT):
+        """
+        Starts the workers and returns once all of them listen. Raises, with every worker stopped, if one of
+        them fails to start or exits, or if they don't all listen in time
+        :param timeout: seconds to wait for the workers to listen
+        """
+        if self.run:
+            return
+        self.run = True
+        for index in range(self.workers):
+            process = self.context.Process(target=_worker, args=(self.address[0], self.address[1], index,
+                                                                 self.handler, self.mtu, self.compression,
+                                                                 self.events, self.stop, self.stats_interval))
+            process.start()
+            self.processes.append(process)
+        threading.Thread(target=self.__collect, daemon=True).start()
+        deadline = time.monotonic() + timeout
+        listening = 0
+        while listening < self.workers:
+            if self.ready.acquire(timeout=_START_POLL):
+                listening += 1
+                continue
+            failure = self.__startup_failure()
+            if not failure and time.monotonic() >= deadline:
+                failure = '{} of {} workers listen after {} seconds'.format(listening, self.workers, timeout)
+            if failure:
+                self.shutdown()
+                raise Exception('Cluster error: {}'.format(failure))
+
+    def __startup_failure(self):
+        """
+        Returns why a worker that didn't listen yet won't, None while all of them may still do
+        """
+        for index, process in enumerate(self.processes):
+            if index in self.errors:
+                return 'worker {} failed to start, {}'.format(index, self.errors[index])
+            if index not in self.listening and not process.is_alive():
+                return 'worker {} exited with code {}'.format(index, process.exitcode)
+        return None
+
+    def __collect(self):
+        """
+        Collects workers' events
+        """
+        while True:
+            try:
+                event, index, value = self.events.get()
+            except (EOFError, OSError):
+                return
+            if event == 'accept':
+                self.accepted.put((index, value))
+            elif event == 'stats':
+                self.stats[index] = value
+            elif event == 'ready':
+                self.listening.add(index)
+                self.ready.release()
+            elif event == 'error':
+                self.errors[index] = value
+
+    def accept(self, timeout=None):
+        """
+        Returns the next client accepted by a worker. The session itself stays in the worker, served by the handler
+        :param timeout: seconds to wait, None blocks until a client is accepted
+        :return: (tuple) worker's index and client's address, or None on timeout
+        """
+        try:
+            return self.accepted.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def snapshot(self):
+        """
+        Returns workers' server metrics summed up, along with every worker's latest report
+        :return: (dict) metrics
+        """
+        stats = dict(self.stats)
+        snapshot = {}
+        for worker in stats.values():
+            for key, value in worker.items():
+                if isinstance(value, int):
+                    snapshot[key] = snapshot.get(key, 0) + value
+        snapshot['workers'] = stats
+        return snapshot
+
+    def shutdown(self, timeout=5):
+        """
+        Stops the workers, their sessions end with them
+        :param timeout: seconds to wait for every worker before killing it
+        """
+        if not self.run:
+            return
+        self.run = False
+        self.stop.set()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+        self.processes = []
@@ -0,0 +1,54 @@
+import hmac, os, time
+from ..models.constants import SYN_COOKIE_PERIOD, SYN_COOKIE_PERIODS
+
+_COUNTER_BITS = 8
+_MAC_BITS = 32 - _COUNTER_BITS
+
+
+class SynCookies:
+    """
+    Stateless handshakes. The server's initial sequence number is a cookie: a keyed MAC of the client's address
+    and initial sequence number, stamped with a coarse clock. The client's handshake ACK echoes it, so the
+    server keeps nothing for a client until its ACK proves it received the SYN_ACK
+    """
+    def __init__(self, secret=None, period=SYN_COOKIE_PERIOD, periods=SYN_COOKIE_PERIODS):
+        """
+        :param secret: MAC key, random by default. Servers sharing a port must share it
+        :param period: seconds the clock stamp stays the same
+        :param periods: number of periods a cookie is valid
+        """
+        self.secret = secret if secret else os.urandom(16)
+        self.period = period
+        self.periods = periods
+
+    def __mac(self, address, client_seq, counter):
+        message = '{}:{}:{}:{}'.format(address[0], address[1], client_seq, counter).encode()
+        return int.from_bytes(hmac.digest(self.secret, message, 'sha256')[:4], 'big') >> (32 - _MAC_BITS)
+
+    def __counter(self, now):
+        now = time.monotonic() if now is None else now
+        return int(now / self.period) % (1 << _COUNTER_BITS)
+
+    def make(self, address, client_seq, now=None):
+        """
+        Returns the cookie of a handshake
+        :param address: client's address
+        :param client_seq: client's initial sequence number
+        :return: (int) server's initial sequence number
+        """
+        counter = self.__counter(now)
+        return counter << _MAC_BITS | self.__mac(address, client_seq, counter)
+
+    def check(self, address, client_seq, cookie, now=None):
+        """
+        Verifies the cookie echoed by a handshake ACK
+        :param address: client's address
+        :param client_seq: client's initial sequence number
+        :param cookie: server's initial sequence number acked by the client
+        :return: (bool) whether the cookie is valid and fresh
+        """
+        counter = cookie >> _MAC_BITS
+        if (self.__counter(now) - counter) % (1 << _COUNTER_BITS) >= self.periods:
+            return False
+        return hmac.compare_digest(self.__mac(address, client_seq, counter).to_bytes(4, 'big'),
+                                   (cookie & ((1 << _MAC_BITS) - 1)).to_bytes(4, 'big'))
@@ -0,0 +1,304 @@
+import collections, threading, time
+from ..models.packet import Packet
+from ..models.constants import EGRESS_QUANTUM, EGRESS_BATCH, EGRESS_QUEUE_LIMIT, EGRESS_CLASSES, \
+    EGRESS_DEFAULT_CLASS, EGRESS_BURST, TIMER_TICK
+
+
+class TokenBucket:
+    """
+    Bandwidth cap: tokens are bytes, refilled at the rate up to the burst size
+    """
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: bytes per second
+        :param burst: bytes sent back to back after an idle period, enough to last a timer tick by default
+        """
+        self.rate = rate
+        self.burst = burst if burst else max(EGRESS_BURST, int(rate * TIMER_TICK * 2))
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+
+    def delay(self, size, now):
+        """
+        Returns seconds to wait until size bytes may be sent, 0 if they may be sent now
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        # a packet larger than the burst waits for a full bucket
+        missing = min(size, self.burst) - self.tokens
+        return missing / self.rate if missing > 0 else 0
+
+    def consume(self, size):
+        self.tokens -= size
+
+
+class _Flow:
+    """
+    Egress queue of a session
+    """
+    def __init__(self, session):
+        self.session = session
+        self.address = session.address
+        # (datagram, size), datagrams are packets or encoded bytes
+        self.queue = collections.deque()
+        # bytes the flow may still send in its turn, and whether its next turn started
+        self.deficit = 0
+        self.turn = True
+        self.quantum = EGRESS_QUANTUM
+        self.priority = EGRESS_DEFAULT_CLASS
+        self.bucket = None
+        # listed among its class' active flows, and waiting for its bucket
+        self.active = False
+        self.throttled = False
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+
+
+class EgressScheduler:
+    """
+    Server-wide egress scheduler. Sessions' datagrams are queued per session and sent in turns: priority
+    classes are served strictly in order, and the sessions of a class by deficit round robin, each getting its
+    weight's share of bytes. Token buckets cap a session's and the server's bandwidth. A session whose queue is
+    full loses its datagrams, as on a congested link, so its congestion control slows it down
+    """
+    def __init__(self, rate=None, burst=None):
+        """
+        :param rate: server's bandwidth cap in bytes per second, None for no cap
+        :param burst: bytes of the server's cap sent back to back
+        """
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.flows = {}
+        self.classes = [collections.deque() for _ in range(EGRESS_CLASSES)]
+        self.lock = threading.Lock()
+        self.socket = None
+        self.reactor = None
+        # a thread is serving the queues, and the server's bucket is refilling
+        self.serving = False
+        self.waiting = False
+        self.queued = 0
+        self.sent = [0] * EGRESS_CLASSES
+        self.dropped = 0
+
+    def start(self, socket_wrapper, reactor):
+        """
+        Binds the scheduler to the server's socket and reactor
+        :param socket_wrapper: server's socket
+        :param reactor: reactor sending the queued datagrams
+        """
+        self.socket = socket_wrapper
+        self.reactor = reactor
+
+    def configure(self, session, rate=None, burst=None, weight=1, priority=EGRESS_DEFAULT_CLASS):
+        """
+        Sets a session's share of the server's bandwidth
+        :param session: server's session
+        :param rate: session's bandwidth cap in bytes per second, None for no cap
+        :param burst: bytes of the session's cap sent back to back
+        :param weight: session's share relative to the other sessions of its class
+        :param priority: session's class, 0 is served first
+        """
+        if not 0 <= priority < EGRESS_CLASSES:
+            raise Exception('Egress error: priority classes are 0 to {}'.format(EGRESS_CLASSES - 1))
+        if weight <= 0:
+            raise Exception('Egress error: weight must be positive')
+        with self.lock:
+            flow = self.__flow(session)
+            if flow.active:
+                self.classes[flow.priority].remove(flow)
+                flow.active = False
+            # a flow's turn must let at least a byte out, or serving it never ends
+            flow.quantum = max(1, int(EGRESS_QUANTUM * weight))
+            flow.priority = priority
+            flow.bucket = TokenBucket(rate, burst) if rate else None
+            flow.throttled = False
+            self.__activate(flow)
+
+    def __flow(self, session):
+        """
+        Returns a session's flow, created on first use. Must be called while holding the lock
+        """
+        flow = self.flows.get(session)
+        if not flow:
+            flow = self.flows[session] = _Flow(session)
+        return flow
+
+    def send(self, session, datagram):
+        """
+        Queues a datagram of a session
+        :param session: server's session
+        :param datagram: packet or encoded bytes
+        """
+        self.send_batch(session, [datagram])
+
+    def send_batch(self, session, datagrams):
+        """
+        Queues datagrams of a session, dropping those its full queue has no room for
+        :param session: server's session
+        :param datagrams: packets or encoded bytes
+        """
+        with self.lock:
+            flow = self.__flow(session)
+            for datagram in datagrams:
+                if len(flow.queue) >= EGRESS_QUEUE_LIMIT:
+                    flow.dropped += 1
+                    self.dropped += 1
+                    continue
+                flow.queue.append((datagram, len(datagram)))
+                self.queued += 1
+            self.__activate(flow)
+            if self.serving or not self.reactor:
+                return
+            self.serving = True
+        self.__serve()
+
+    def close(self, session):
+        """
+        Forgets a closed session once its last datagrams are sent
+        """
+        with self.lock:
+            flow = self.flows.get(session)
+            if flow:
+                flow.closed = True
+                if not flow.queue:
+                    self.__remove(flow)
+
+    def __activate(self, flow):
+        """
+        Lists a flow with datagrams among its class' active flows. Must be called while holding the lock
+        """
+        if flow.queue and not flow.active and not flow.throttled:
+            flow.active = True
+            flow.deficit = 0
+            flow.turn = True
+            self.classes[flow.priority].append(flow)
+
+    def __remove(self, flow):
+        if self.flows.get(flow.session) is flow:
+            del self.flows[flow.session]
+
+    def __timeout(self):
+        """
+        Resumes serving once the server's bucket refilled
+        """
+        with self.lock:
+            self.waiting = False
+            if self.serving:
+                return
+            self.serving = True
+        self.__serve()
+
+    def __unthrottle(self, flow):
+        """
+        Lists a flow again once its bucket refilled
+        """
+        with self.lock:
+            flow.throttled = False
+            self.__activate(flow)
+            if self.serving or not flow.active:
+                return
+            self.serving = True
+        self.__serve()
+
+    def __serve(self):
+        """
+        Sends queued datagrams. A single thread serves at a time: the thread that queued datagrams while nobody
+        served, or the reactor once that thread sent a batch of them
+        """
+        budget = EGRESS_BATCH
+        while True:
+            with self.lock:
+                batches = self.__dequeue(budget)
+                if not batches:
+                    self.serving = False
+                    return
+            for flow, batch in batches:
+                self.__send(flow, batch)
+                budget -= len(batch)
+            if budget <= 0:
+                self.reactor.call_soon(self.__serve)
+                return
+
+    def __dequeue(self, budget):
+        """
+        Takes up to budget datagrams in the order they're sent. Must be called while holding the lock
+        :return: list of (flow, datagrams)
+        """
+        batches = []
+        now = time.monotonic()
+        for priority, flows in enumerate(self.classes):
+            while flows and budget:
+                flow = flows[0]
+                if flow.turn:
+                    flow.deficit += flow.quantum
+                    flow.turn = False
+                batch = []
+                while flow.queue and budget:
+                    datagram, size = flow.queue[0]
+                    if size > flow.deficit:
+                        break
+                    delay = self.bucket.delay(size, now) if self.bucket else 0
+                    if delay:
+                        if not self.waiting:
+                            self.waiting = True
+                            self.reactor.wheel.schedule(delay, self.__timeout)
+                        budget = 0
+                        break
+                    if flow.bucket:
+                        delay = flow.bucket.delay(size, now)
+                        if delay:
+                            flow.throttled = True
+                            self.reactor.wheel.schedule(delay, self.__unthrottle, flow)
+                            break
+                        flow.bucket.consume(size)
+                    if self.bucket:
+                        self.bucket.consume(size)
+                    flow.queue.popleft()
+                    flow.deficit -= size
+                    batch.append(datagram)
+                    budget -= 1
+                if batch:
+                    batches.append((flow, batch))
+                    self.queued -= len(batch)
+                    self.sent[priority] += len(batch)
+                if not flow.queue or flow.throttled:
+                    flows.popleft()
+                    flow.active = False
+                    if not flow.queue and flow.closed:
+                        self.__remove(flow)
+                elif flow.queue[0][1] > flow.deficit:
+                    # the flow spent its deficit, the next one's turn
+                    flows.rotate(-1)
+                    flow.turn = True
+            if flows:
+                # the budget is spent, lower classes wait for the next round
+                break
+        return batches
+
+    def __send(self, flow, batch):
+        """
+        Writes a flow's datagrams to the socket
+        """
+        flow.sent += len(batch)
+        try:
+            if all(isinstance(datagram, Packet) for datagram in batch):
+                self.socket.send_batch(flow.address, batch)
+            else:
+                for datagram in batch:
+                    self.socket.send(flow.address, datagram)
+        except OSError:
+            # the socket is closed or its buffer is full, datagrams are lost as on the wire
+            pass
+
+    def snapshot(self):
+        """
+        Returns scheduler's counters
+        :return: (dict) datagrams sent by class, dropped and queued, and the number of sessions with queues
+        """
+        return {
+            'sent': list(self.sent),
+            'dropped': self.dropped,
+            'queued': self.queued,
+            'flows': len(self.flows),
+            'throttled': sum(1 for flow in list(self.flows.values()) if flow.throttled),
+        }
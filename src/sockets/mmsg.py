@@ -0,0 +1,119 @@
+import ctypes, socket, struct, sys
+
+# Linux batched datagram syscalls, called through ctypes since the socket module doesn't expose them
+_MSG_DONTWAIT = 0x40
+_SOCKADDR_IN_LEN = 16
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(_IoVec)), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr), ('msg_len', ctypes.c_uint)]
+
+
+def _load():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+        libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int,
+                                  ctypes.c_void_p]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _load()
+
+
+def available():
+    """
+    Returns whether sendmmsg/recvmmsg can be used on this platform
+    """
+    return _libc is not None
+
+
+def _pack_address(address):
+    return struct.pack('=H', socket.AF_INET) + struct.pack('!H', address[1]) + socket.inet_aton(address[0]) + bytes(8)
+
+
+def _unpack_address(raw):
+    return socket.inet_ntoa(raw[4:8]), struct.unpack('!H', raw[2:4])[0]
+
+
+class MMsgReceiver:
+    """
+    Receives up to a batch of datagrams with a single recvmmsg call, into preallocated buffers
+    """
+    def __init__(self, batch, buffer_size):
+        """
+        :param batch: max datagrams per call
+        :param buffer_size: max datagram size
+        """
+        self.batch = batch
+        self.buffers = [ctypes.create_string_buffer(buffer_size) for _ in range(batch)]
+        self.names = [ctypes.create_string_buffer(_SOCKADDR_IN_LEN) for _ in range(batch)]
+        self.iovecs = (_IoVec * batch)()
+        self.messages = (_MMsgHdr * batch)()
+        for i in range(batch):
+            self.iovecs[i].iov_base = ctypes.cast(self.buffers[i], ctypes.c_void_p)
+            self.iovecs[i].iov_len = buffer_size
+            header = self.messages[i].msg_hdr
+            header.msg_name = ctypes.cast(self.names[i], ctypes.c_void_p)
+            header.msg_iov = ctypes.pointer(self.iovecs[i])
+            header.msg_iovlen = 1
+
+    def receive(self, fd):
+        """
+        Reads pending datagrams without blocking
+        :param fd: socket's file descriptor
+        :return: list of (datagram, address)
+        """
+        for i in range(self.batch):
+            self.messages[i].msg_hdr.msg_namelen = _SOCKADDR_IN_LEN
+        count = _libc.recvmmsg(fd, self.messages, self.batch, _MSG_DONTWAIT, None)
+        if count < 0:
+            errno = ctypes.get_errno()
+            if errno in (11, 4):
+                # EAGAIN, EINTR
+                return []
+            raise OSError(errno, 'recvmmsg failed')
+        return [(self.buffers[i].raw[:self.messages[i].msg_len], _unpack_address(self.names[i].raw))
+                for i in range(count)]
+
+
+def send_mmsg(fd, address, datagrams):
+    """
+    Sends datagrams to one address with a single sendmmsg call
+    :param fd: socket's file descriptor
+    :param address: target (ip, port) address
+    :param datagrams: list of bytes
+    :return: (int) number of datagrams sent
+    """
+    count = len(datagrams)
+    name = ctypes.create_string_buffer(_pack_address(address), _SOCKADDR_IN_LEN)
+    buffers = [ctypes.create_string_buffer(datagram, len(datagram)) for datagram in datagrams]
+    iovecs = (_IoVec * count)()
+    messages = (_MMsgHdr * count)()
+    for i, buffer in enumerate(buffers):
+        iovecs[i].iov_base = ctypes.cast(buffer, ctypes.c_void_p)
+        iovecs[i].iov_len = len(datagrams[i])
+        header = messages[i].msg_hdr
+        header.msg_name = ctypes.cast(name, ctypes.c_void_p)
+        header.msg_namelen = _SOCKADDR_IN_LEN
+        header.msg_iov = ctypes.pointer(iovecs[i])
+        header.msg_iovlen = 1
+    sent = _libc.sendmmsg(fd, messages, count, 0)
+    if sent < 0:
+        raise OSError(ctypes.get_errno(), 'sendmmsg failed')
+    return sent
@@ -0,0 +1,116 @@
+import collections, selectors, socket, threading, traceback
+from ..session.models.timer import TimerWheel
+
+_default_reactor = None
+_default_lock = threading.Lock()
+
+
+class Reactor:
+    """
+    Event loop of the process: a single thread waits on every registered socket with the selectors module
+    (epoll on Linux) and drives the timer wheel of all sessions, so the thread count doesn't grow with the
+    number of sessions and an idle process doesn't wake up
+    """
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.wheel = TimerWheel(notify=self.wake)
+        # callbacks posted by other threads, run by the loop
+        self.calls = collections.deque()
+        self.__waker, self.__waker_write = socket.socketpair()
+        self.__waker.setblocking(False)
+        self.__waker_write.setblocking(False)
+        self.selector.register(self.__waker, selectors.EVENT_READ, self.__drain_waker)
+        self.thread = None
+        self.active = False
+
+    def start(self):
+        """
+        Starts the loop's thread
+        """
+        if self.active:
+            return
+        self.active = True
+        self.thread = threading.Thread(target=self.__run, args=(), daemon=True)
+        self.thread.start()
+
+    def __run(self):
+        while self.active:
+            timeout = 0 if self.calls else self.wheel.next_timeout()
+            for key, events in self.selector.select(timeout):
+                self.__call(key.data)
+            while self.calls:
+                callback, args = self.calls.popleft()
+                self.__call(callback, *args)
+            self.wheel.advance()
+
+    @staticmethod
+    def __call(callback, *args):
+        """
+        Runs a callback, an exception must not stop the loop
+        """
+        try:
+            callback(*args)
+        except Exception:
+            traceback.print_exc()
+
+    def call_soon(self, callback, *args):
+        """
+        Runs a callback in the loop's thread. Safe to call from any thread
+        """
+        self.calls.append((callback, args))
+        self.wake()
+
+    def wake(self):
+        """
+        Interrupts the loop's wait
+        """
+        if threading.current_thread() is self.thread:
+            return
+        try:
+            self.__waker_write.send(b'\0')
+        except (BlockingIOError, OSError):
+            # a wake up is pending already
+            pass
+
+    def __drain_waker(self):
+        try:
+            while self.__waker.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def register(self, sock, callback):
+        """
+        Calls back whenever a socket is readable
+        :param sock: socket, or any object with a fileno() method
+        :param callback: method called in the loop's thread, it must read the socket without blocking
+        """
+        self.call_soon(self.selector.register, sock, selectors.EVENT_READ, callback)
+
+    def unregister(self, sock):
+        """
+        Stops watching a socket
+        """
+        self.call_soon(self.__unregister, sock)
+
+    def __unregister(self, sock):
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def stop(self):
+        self.active = False
+        self.wake()
+
+
+def default_reactor():
+    """
+    Returns the process-wide reactor, starting its thread on first use
+    """
+    global _default_reactor
+    with _default_lock:
+        if _default_reactor is None:
+            _default_reactor = Reactor()
+            _default_reactor.start()
+        return _default_reactor
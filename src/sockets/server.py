@@ -1,51 +1,89 @@
-import queue, threading
-from ..models.packet import generate_id
+import collections, queue, time
+from ..models.packet import Packet, generate_id
+from ..models.sequence import seq_diff
 from .sock import Socket
-from ..models.event import EventEmitter
+from .reactor import default_reactor
+from .cookies import SynCookies
 from ..session.srvsess import ClientConnection
-from ..models.constants import PAYLOAD, FIN, FIN_ACK, SYN, ACK
+from ..models.metrics import ServerMetrics
+from ..models.constants import SYN, SYN_ACK, ACK, FIN, FIN_ACK, PAYLOAD, FLAG_COMPRESSED, SEQ_LIMIT, SYN_BACKLOG, \
+    SYN_ATTEMPTS, SYN_TIMEOUT, TIME_WAIT, TIME_WAIT_LIMIT, MAX_PLPMTU, RECEIVE_WINDOW, DRAIN_TIMEOUT
 
 class ReliableServer:
     """
     Reliable UDP server
     """
-    def __init__(self, ip, port):
+    def __init__(self, ip, port, mtu=None, reuse_port=False, reactor=None, compression=None, syn_cookies=None,
+                 egress=None):
         """
         :param ip: Host's IP address
         :param port: Host's port number
+        :param mtu: fixed IP packet size of sessions, None to discover each path MTU
+        :param reuse_port: share the port with other servers, as cluster workers do
+        :param reactor: event loop reading the socket and firing sessions' timers (process-wide one by default)
+        :param compression: zlib level (1-9) of payload compression with clients supporting it, None to turn it off
+        :param syn_cookies: True to answer every SYN statelessly with a cookie, False never to, None once
+        SYN_BACKLOG handshakes are pending
+        :param egress: (EgressScheduler) queues sessions' datagrams and sends them fairly and within bandwidth
+        caps, None to write them straight to the socket
         """
         self.socket = Socket()
-        self.socket.bind(ip, port)
+        self.socket.bind(ip, port, reuse_port)
+        if mtu and mtu > MAX_PLPMTU:
+            raise Exception('MTU error: packets are limited to {} bytes'.format(MAX_PLPMTU))
+        self.mtu = mtu
+        self.compression = compression
+        self.reactor = reactor if reactor else default_reactor()
+        self.egress = egress
+        if egress:
+            egress.start(self.socket, self.reactor)
+        # sessions keyed by client's (ip, port) address
+        self.sessions = {}
+        # sessions of pending handshakes, by client's address
         self.awaiting_connections = {}
+        # addresses of closed sessions lingering in TIME_WAIT, oldest first: expiry time by client's address
+        self.time_wait = collections.OrderedDict()
+        self.syn_cookies = syn_cookies
+        self.cookies = SynCookies() if syn_cookies is not False else None
+        self.metrics = ServerMetrics()
         self.available_sessions = queue.Queue()
-        self.income_packet_emitter = EventEmitter()
         self.acceptors = 0
 
         self.run = False
 
     def listen(self):
         """
-        Starts a thread for listening
+        Starts listening, the reactor reads the socket from now on
         """
         if not self.run:
-            t = threading.Thread(target=self.__listen, args=())
-            t.start()
+            self.run = True
+            self.reactor.register(self.socket, self.__readable)
 
-    def __listen(self):
+    def __readable(self):
         """
-        Listen to income clients
+        Routes income packets to their sessions, called by the reactor whenever the socket is readable
         """
-        self.run = True
-        while self.run:
-            self.socket.select()
-            if self.socket.is_readable():
-                packet, address = self.socket.read_packet()
-                if packet.operation == PAYLOAD or packet.operation == FIN or packet.operation == FIN_ACK:
-                    self.income_packet_emitter.emit(address=address[1], pkt=packet)
-                elif packet.operation == SYN:
-                    self.__handle_syn(address, packet)
-                elif packet.operation == ACK:
-                    self.__handle_ack(address, packet)
+        try:
+            packets = self.socket.read_packets()
+        except OSError:
+            return
+        self.metrics.datagrams_received += len(packets)
+        for packet, address in packets:
+            session = self.sessions.get(address)
+            if session:
+                session.handle_packet(packet)
+            elif not packet.verify_checksum():
+                self.metrics.checksum_errors += 1
+            elif address in self.time_wait and self.__time_wait(address, packet):
+                continue
+            elif packet.operation == SYN:
+                self.__handle_syn(address, packet)
+            elif packet.operation == ACK:
+                self.__handle_ack(address, packet)
+            elif packet.operation == PAYLOAD:
+                self.__handle_payload(address, packet)
+            else:
+                self.metrics.unknown_packets += 1
 
     def __handle_syn(self, address, packet):
         """
@@ -53,28 +91,148 @@ class ReliableServer:
         :param address: Client's address
         :param packet: SYN packet
         """
+        self.metrics.syn_received += 1
         if self.acceptors <= 0:
             return
 
-        # Session's initial sequence number
-        initial_seq_number = generate_id()
-        new_session = ClientConnection(address, initial_seq_number, packet.seq_number, self.income_packet_emitter)
-        self.awaiting_connections[address[1]] = new_session
+        if address in self.awaiting_connections:
+            # SYN_ACK was lost, answer with the same initial sequence number
+            initial_seq_number = self.awaiting_connections[address].next_sent_seq
+        elif self.cookies and (self.syn_cookies or len(self.awaiting_connections) >= SYN_BACKLOG):
+            # nothing is kept until the client's ACK returns the cookie
+            initial_seq_number = self.cookies.make(address, packet.seq_number)
+            self.metrics.syn_cookies += 1
+        else:
+            # Session's initial sequence number
+            initial_seq_number = generate_id()
+            new_session = ClientConnection(address, initial_seq_number, packet.seq_number, self.socket,
+                                           self.reactor.wheel, self.egress)
+            if self.__compressed(packet):
+                new_session.set_compression(self.compression)
+            self.awaiting_connections[address] = new_session
+            self.reactor.wheel.schedule(SYN_ATTEMPTS * SYN_TIMEOUT, self.__handshake_expired, address, new_session)
         syn_ack = packet.ack(initial_seq_number)
+        if self.__compressed(packet):
+            syn_ack.flags |= FLAG_COMPRESSED
         self.socket.send(address, syn_ack)
 
+    def __compressed(self, syn):
+        """
+        Returns whether a client's session is compressed, both sides must support it
+        """
+        return bool(self.compression and syn.flags & FLAG_COMPRESSED)
+
     def __handle_ack(self, address, packet):
         """
         Handles ACK request
         :param address: Client's address
         :param packet: ACK packet
         """
-        if address[1] in self.awaiting_connections:
-            session = self.awaiting_connections[address[1]]
-            del self.awaiting_connections[address[1]]
-            self.available_sessions.put(session)
+        session = self.awaiting_connections.get(address)
+        if session:
+            if packet.ack_number % SEQ_LIMIT != session.next_sent_seq:
+                return
+            del self.awaiting_connections[address]
+            session.metrics.handshake(time.time() - session.timestamp)
+        elif self.cookies:
+            # the client's ACK carries its initial sequence number and acks the cookie
+            if not self.cookies.check(address, packet.seq_number, packet.ack_number):
+                self.metrics.invalid_cookies += 1
+                return
+            session = ClientConnection(address, packet.ack_number, packet.seq_number, self.socket,
+                                       self.reactor.wheel, self.egress)
+            if self.compression and packet.flags & FLAG_COMPRESSED:
+                session.set_compression(self.compression)
         else:
-            self.income_packet_emitter.emit(address=address[1], pkt=packet)
+            return
+        self.__established(address, session)
+
+    def __handle_payload(self, address, packet):
+        """
+        Handles a payload of a client without a session, whose handshake ACK was lost. A payload within the
+        receive window of a pending handshake completes it, as data carrying an ACK does in TCP. Otherwise the
+        client is answered with SYN_ACK so it sends its ACK again
+        :param address: Client's address
+        :param packet: PAYLOAD packet
+        """
+        session = self.awaiting_connections.get(address)
+        if session and 0 <= seq_diff(packet.seq_number, session.reorder.base) < RECEIVE_WINDOW:
+            del self.awaiting_connections[address]
+            session.metrics.handshake(time.time() - session.timestamp)
+            self.__established(address, session)
+            session.handle_packet(packet)
+            return
+        if session:
+            syn_ack = Packet(seq=session.next_sent_seq, oper=SYN_ACK, ack=0)
+        elif self.cookies and self.acceptors > 0:
+            # no state was kept, the client's ACK carries the cookie
+            syn_ack = Packet(seq=0, oper=SYN_ACK, ack=0)
+        else:
+            self.metrics.unknown_packets += 1
+            return
+        self.metrics.handshake_acks_requested += 1
+        self.socket.send(address, syn_ack)
+
+    def __established(self, address, session):
+        """
+        Moves a session whose handshake completed to the sessions table, and hands it to accept()
+        """
+        self.sessions[address] = session
+        session.close_emitter.subscribe(self.__session_closed)
+        session.configure_mtu(self.mtu)
+        self.metrics.accepted(session)
+        self.available_sessions.put(session)
+
+    def __time_wait(self, address, packet):
+        """
+        Answers a packet of a closed session still lingering
+        :return: (bool) whether the packet was handled, a SYN opens a new session instead
+        """
+        if time.monotonic() >= self.time_wait[address] or packet.operation == SYN:
+            del self.time_wait[address]
+            return False
+        self.metrics.time_wait_packets += 1
+        if packet.operation == FIN or packet.operation == FIN_ACK:
+            # the client missed our FIN_ACK or ACK
+            self.socket.send(address, packet.ack())
+        return True
+
+    def __handshake_expired(self, address, session):
+        """
+        Forgets a pending handshake whose ACK never came
+        """
+        if self.awaiting_connections.get(address) is session:
+            del self.awaiting_connections[address]
+            self.metrics.handshakes_expired += 1
+
+    def __session_closed(self, **args):
+        """
+        Removes a closed session from the sessions table
+        """
+        session = args['session']
+        if self.sessions.get(session.address) is session:
+            del self.sessions[session.address]
+            self.metrics.closed(session)
+            now = time.monotonic()
+            while self.time_wait and (len(self.time_wait) >= TIME_WAIT_LIMIT or
+                                      next(iter(self.time_wait.values())) <= now):
+                self.time_wait.popitem(last=False)
+            self.time_wait.pop(session.address, None)
+            self.time_wait[session.address] = now + TIME_WAIT
+        if self.egress:
+            self.egress.close(session)
+
+    def snapshot(self, sessions=False):
+        """
+        Returns server's metrics
+        :param sessions: include the snapshot of every active session
+        :return: (dict) metrics
+        """
+        snapshot = self.metrics.snapshot(self.sessions if sessions else None)
+        snapshot['time_wait'] = len(self.time_wait)
+        if self.egress:
+            snapshot['egress'] = self.egress.snapshot()
+        return snapshot
 
     def __send(self, address, packet):
         self.socket.send(address, packet)
@@ -91,10 +249,24 @@ class ReliableServer:
 
         return session
 
-    def shutdown(self):
+    def shutdown(self, graceful=True, timeout=None):
         """
-        Shuts down the server
+        Shuts down the server, its sessions can't send without the socket and stop
+        :param graceful: close every session first, all of them at once, so clients know the server left. Sessions
+        send FIN once their queued data was acked
+        :param timeout: seconds to wait for the data to be acked and the clients to answer, None until every
+        session's data and FINs are acked or given up
         """
         self.run = False
-        self.socket.close()
-
+        if graceful:
+            sessions = list(self.sessions.values())
+            for session in sessions:
+                session.close(wait=False, timeout=DRAIN_TIMEOUT if timeout is None else timeout)
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            for session in sessions:
+                if not session.closed.wait(max(deadline - time.monotonic(), 0) if deadline else None):
+                    break
+        for session in list(self.sessions.values()) + list(self.awaiting_connections.values()):
+            session.close_session()
+        self.reactor.unregister(self.socket)
+        self.reactor.call_soon(self.socket.close)
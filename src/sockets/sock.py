@@ -1,20 +1,64 @@
-import socket, select
-from ..models.constants import PACKET_HEADER_SIZE
-from ..models.packet import Packet
+import errno, socket, select, struct, sys, threading
+from ..models.packet import Packet, parse_packet
+from ..models.constants import IO_BATCH, GSO_MAX_SEGMENTS, GSO_MAX_BYTES, MAX_PLPMTU, RECV_BUFFER_SIZE, \
+    SOCKET_BUFFER_SIZE
+from . import mmsg
+
+_SOL_UDP = getattr(socket, 'SOL_UDP', 17)
+_UDP_SEGMENT = getattr(socket, 'UDP_SEGMENT', 103)
+# UDP_SEGMENT's control message holds the segment size as a native u16
+_SEGMENT_SIZE = struct.Struct('=H')
+# Linux path MTU socket options, missing from the socket module
+_IP_MTU_DISCOVER = getattr(socket, 'IP_MTU_DISCOVER', 10)
+_IP_PMTUDISC_DONT = getattr(socket, 'IP_PMTUDISC_DONT', 0)
+_IP_PMTUDISC_DO = getattr(socket, 'IP_PMTUDISC_DO', 2)
+_IP_PMTUDISC_PROBE = getattr(socket, 'IP_PMTUDISC_PROBE', 3)
+_IP_MTU = getattr(socket, 'IP_MTU', 14)
+_SENDMSG = hasattr(socket.socket, 'sendmsg')
+# Linux options sizing buffers beyond net.core.rmem_max / wmem_max, for privileged processes
+_SO_RCVBUFFORCE = getattr(socket, 'SO_RCVBUFFORCE', 33)
+_SO_SNDBUFFORCE = getattr(socket, 'SO_SNDBUFFORCE', 32)
+# errors of a batched call the kernel or the device doesn't support, others are transient (ENOBUFS, EAGAIN...)
+_UNSUPPORTED = (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP)
 
 class Socket:
     def __init__(self):
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.__is_selecting = False
         self.__readable = self.__writeable = self.__exceptional = None
+        # never fragment, datagrams are sized by path MTU discovery
+        self.pmtu_discovery = set_dont_fragment(self.socket)
+        # a full send window of one session must fit in the kernel's buffers, or they drop it
+        set_buffer_size(self.socket, SOCKET_BUFFER_SIZE)
+        # batched I/O, disabled on the first unsupported call
+        self.__receiver = None
+        self.use_mmsg = mmsg.available()
+        self.use_gso = mmsg.available()
+        self.__gso_buffer = bytearray(GSO_MAX_BYTES)
+        # sessions sharing the socket send from their own threads
+        self.__gso_lock = threading.Lock()
+        self.__fragment_lock = threading.Lock()
+        self.syscalls = 0
 
-    def bind(self, ip, port):
+    def bind(self, ip, port, reuse_port=False):
+        """
+        :param reuse_port: share the port with other sockets setting it (SO_REUSEPORT), the kernel spreads
+        incoming flows among them
+        """
+        if reuse_port:
+            if not hasattr(socket, 'SO_REUSEPORT'):
+                raise Exception('Socket error: SO_REUSEPORT is not supported on this platform')
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.socket.bind((ip, port))
 
-    def select(self):
+    def fileno(self):
+        return self.socket.fileno()
+
+    def select(self, timeout=0):
         inputs = [self.socket]
         self.__is_selecting = True
-        self.__readable, self.__writeable, self.__exceptional = select.select(inputs, [self.socket], inputs, 0)
+        self.syscalls += 1
+        self.__readable, self.__writeable, self.__exceptional = select.select(inputs, [self.socket], inputs, timeout)
 
     def quit_select(self):
         self.__is_selecting = False
@@ -32,17 +76,195 @@ class Socket:
         return self.__is_selecting
 
     def read_packet(self):
-        packet_bytes, address = self.socket.recvfrom(1500)
-        packet = Packet(header=packet_bytes[:PACKET_HEADER_SIZE])
-        if packet.payload_size > 0:
-            packet.payload = packet_bytes[PACKET_HEADER_SIZE:]
-        return packet, address
+        self.syscalls += 1
+        packet_bytes, address = self.socket.recvfrom(RECV_BUFFER_SIZE)
+        return parse_packet(packet_bytes), address
+
+    def read_packets(self):
+        """
+        Drains pending datagrams without blocking, a batch per recvmmsg call where available
+        :return: list of (packet, address)
+        """
+        packets = []
+        while True:
+            self.syscalls += 1
+            if self.use_mmsg:
+                if not self.__receiver:
+                    # larger datagrams are never sent, probes included
+                    self.__receiver = mmsg.MMsgReceiver(IO_BATCH, MAX_PLPMTU)
+                try:
+                    batch = self.__receiver.receive(self.socket.fileno())
+                except OSError as e:
+                    if e.errno in _UNSUPPORTED:
+                        self.use_mmsg = False
+                        continue
+                    # an ICMP error queued on the socket, the next datagrams are read on the next call
+                    return packets
+                packets.extend((parse_packet(datagram), address) for datagram, address in batch)
+                if len(batch) < IO_BATCH:
+                    return packets
+            else:
+                try:
+                    packet_bytes, address = self.socket.recvfrom(RECV_BUFFER_SIZE, socket.MSG_DONTWAIT)
+                except (BlockingIOError, InterruptedError):
+                    return packets
+                except (ConnectionRefusedError, ConnectionResetError):
+                    # an ICMP error of an earlier send, reading it cleared it and datagrams may follow
+                    continue
+                except OSError:
+                    # the packets read so far aren't lost, the error is raised again by the next call
+                    if packets:
+                        return packets
+                    raise
+                packets.append((parse_packet(packet_bytes), address))
 
     def send(self, address, packet):
-        self.socket.sendto(bytes(packet), address)
+        self.syscalls += 1
+        if _SENDMSG and isinstance(packet, Packet) and packet.payload_size:
+            # the kernel gathers header and payload, the payload isn't copied into a datagram first
+            self.socket.sendmsg([packet.header(), packet.payload], [], 0, address)
+        else:
+            self.socket.sendto(bytes(packet), address)
+
+    def send_fragmentable(self, address, packet):
+        """
+        Sends a packet the network may fragment, one larger than the path MTU found after it was segmented
+        :param address: target address
+        :param packet: packet or bytes
+        """
+        if not self.pmtu_discovery:
+            return self.send(address, packet)
+        # the socket's other datagrams sent meanwhile may be fragmented too, they fit the path anyway
+        with self.__fragment_lock:
+            allow_fragments(self.socket, True)
+            try:
+                self.send(address, packet)
+            finally:
+                allow_fragments(self.socket, False)
+
+    def send_batch(self, address, packets):
+        """
+        Sends packets to one address with as few syscalls as possible: equally sized packets are
+        encoded into a UDP GSO super-datagram buffer, others are sent by sendmmsg, or one by one elsewhere
+        :param address: target address
+        :param packets: list of packets
+        """
+        if len(packets) == 1:
+            self.send(address, packets[0])
+            return
+        start = 0
+        while start < len(packets):
+            if self.use_gso:
+                end = self.__gso_run(packets, start)
+                if end - start > 1:
+                    try:
+                        with self.__gso_lock:
+                            length = 0
+                            for packet in packets[start:end]:
+                                length += packet.encode_into(self.__gso_buffer, length)
+                            self.syscalls += 1
+                            with memoryview(self.__gso_buffer) as view:
+                                self.socket.sendmsg([view[:length]],
+                                                   [(_SOL_UDP, _UDP_SEGMENT, _SEGMENT_SIZE.pack(len(packets[start])))],
+                                                   0, address)
+                        start = end
+                        continue
+                    except OSError as e:
+                        if e.errno in _UNSUPPORTED:
+                            self.use_gso = False
+            if self.use_mmsg:
+                end = min(start + IO_BATCH, len(packets))
+                try:
+                    self.syscalls += 1
+                    start += mmsg.send_mmsg(self.socket.fileno(), address,
+                                            [bytes(packet) for packet in packets[start:end]])
+                    continue
+                except OSError as e:
+                    if e.errno in _UNSUPPORTED:
+                        self.use_mmsg = False
+            self.send(address, packets[start])
+            start += 1
+
+    @staticmethod
+    def __gso_run(packets, start):
+        """
+        Returns the end of the run of packets that can share one GSO send: equal sizes, the last one may be shorter
+        """
+        size = len(packets[start])
+        end = start + 1
+        total = size
+        while end < len(packets) and end - start < GSO_MAX_SEGMENTS:
+            length = len(packets[end])
+            if length > size or total + length > GSO_MAX_BYTES:
+                break
+            total += length
+            end += 1
+            if length < size:
+                break
+        return end
+
+    @staticmethod
+    def path_mtu(address):
+        """
+        Returns the MTU of the local route to an address, the upper bound of its path MTU
+        :param address: target (ip, port) address
+        :return: (int) MTU, or None where unknown
+        """
+        if not sys.platform.startswith('linux'):
+            return None
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            probe.setsockopt(socket.IPPROTO_IP, _IP_MTU_DISCOVER, _IP_PMTUDISC_DO)
+            probe.connect(address)
+            return probe.getsockopt(socket.IPPROTO_IP, _IP_MTU)
+        except OSError:
+            return None
+        finally:
+            probe.close()
 
     def set_timeout(self, timeout):
         self.socket.settimeout(timeout)
 
     def close(self):
-        self.socket.close()
\ No newline at end of file
+        self.socket.close()
+
+
+def set_dont_fragment(sock):
+    """
+    Sets the don't fragment bit on socket's datagrams, leaving path MTU to packetization layer probing
+    :param sock: UDP socket
+    :return: (bool) whether it's supported
+    """
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, _IP_MTU_DISCOVER, _IP_PMTUDISC_PROBE)
+        return True
+    except OSError:
+        return False
+
+
+def allow_fragments(sock, allowed):
+    """
+    Clears or sets back the don't fragment bit of a socket set by set_dont_fragment()
+    :param sock: UDP socket
+    :param allowed: whether the next datagrams may be fragmented
+    """
+    sock.setsockopt(socket.IPPROTO_IP, _IP_MTU_DISCOVER, _IP_PMTUDISC_DONT if allowed else _IP_PMTUDISC_PROBE)
+
+
+def set_buffer_size(sock, size):
+    """
+    Sets socket's receive and send buffer sizes, beyond the system's limits where the process is allowed to
+    :param sock: UDP socket
+    :param size: bytes of each buffer
+    """
+    for force, option in ((_SO_RCVBUFFORCE, socket.SO_RCVBUF), (_SO_SNDBUFFORCE, socket.SO_SNDBUF)):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, force, size)
+        except OSError:
+            try:
+                # capped by net.core.rmem_max / wmem_max
+                sock.setsockopt(socket.SOL_SOCKET, option, size)
+            except OSError:
+                pass
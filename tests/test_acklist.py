@@ -0,0 +1,77 @@
+from src.models.packet import Packet
+from src.models.constants import PAYLOAD, SEQ_LIMIT
+from src.session.models.acklist import AckList
+from src.session.models.timer import TimerWheel
+
+
+def _sent(initial_seq, count, size=100):
+    """
+    Returns an ack list of count packets sent from initial_seq. Its wheel isn't driven, no timer ever fires
+    """
+    acks = AckList(initial_seq, TimerWheel())
+    for index in range(count):
+        acks.new_packet(Packet(seq=(initial_seq + index) % SEQ_LIMIT, oper=PAYLOAD, ack=0, payload=bytes(size)))
+    return acks
+
+
+def test_cumulative_ack():
+    acks = _sent(10, 10)
+    acked, size, sample = acks.confirm_range(14)
+    assert (acked, size) == (4, 400)
+    assert sample is not None and sample >= 0
+    assert acks.base == 14
+    assert (acks.in_flight, acks.bytes_in_flight) == (6, 600)
+
+
+def test_selective_acks():
+    acks = _sent(10, 10)
+    acked, size, _ = acks.confirm_range(12, [(14, 16), (18, 19)])
+    assert (acked, size) == (5, 500)
+    # the window slides up to the first hole only
+    assert acks.base == 12
+    assert acks.in_flight == 5
+    acked, _, _ = acks.confirm_range(14)
+    assert acked == 2
+    assert acks.base == 16
+
+
+def test_repeated_acks_count_once():
+    acks = _sent(10, 10)
+    acks.confirm_range(12, [(14, 16)])
+    assert acks.confirm_range(12, [(14, 16)]) == (0, 0, None)
+    assert acks.confirm_range(11) == (0, 0, None)
+    assert acks.in_flight == 6
+
+
+def test_blocks_are_clipped_to_the_window():
+    acks = _sent(10, 5)
+    acked, _, _ = acks.confirm_range(10, [(5, 12), (13, 40)])
+    assert acked == 4
+    assert acks.in_flight == 1
+    assert acks.base == 12
+
+
+def test_resent_packets_give_no_rtt_sample():
+    acks = _sent(10, 3)
+    acks.resend_packet(10)
+    assert acks.confirm_range(11)[2] is None
+    assert acks.confirm_range(12)[2] is not None
+
+
+def test_wraps_around():
+    initial_seq = SEQ_LIMIT - 3
+    acks = _sent(initial_seq, 6)
+    acked, _, _ = acks.confirm_range(SEQ_LIMIT - 1, [(0, 2)])
+    assert acked == 4
+    acked, _, _ = acks.confirm_range(3)
+    assert acked == 2
+    assert acks.base == 3
+    assert acks.in_flight == 0
+
+
+def test_released():
+    acks = _sent(10, 4)
+    acks.confirm_range(10, [(11, 14)])
+    assert not acks.released(11)
+    acks.confirm_range(14)
+    assert acks.released(13)
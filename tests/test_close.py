@@ -0,0 +1,42 @@
+import queue, threading, time
+from src.sockets.server import ReliableServer
+from src.sockets.client import ReliableSocket
+
+SIZE = 500000
+LOSS_PERIOD = 20
+
+
+def test_close_drains_data_first():
+    server = ReliableServer('127.0.0.1', 0)
+    server.listen()
+    accepted = queue.Queue()
+    threading.Thread(target=lambda: accepted.put(server.accept()), daemon=True).start()
+    while server.acceptors == 0:
+        time.sleep(0.001)
+    client = ReliableSocket(*server.socket.socket.getsockname())
+    client.connect()
+    # a datagram in LOSS_PERIOD is lost from now on, resent ones included
+    send, send_batch, sent = client.socket.send, client.socket.send_batch, [0]
+
+    def lossy():
+        sent[0] += 1
+        return sent[0] % LOSS_PERIOD != 0
+    client.socket.send = lambda address, packet: send(address, packet) if lossy() else None
+    client.socket.send_batch = lambda address, packets: send_batch(address, [p for p in packets if lossy()])
+    data = bytes(range(256)) * (SIZE // 256)
+    session = accepted.get(timeout=5)
+    received = bytearray()
+
+    def receive():
+        while len(received) < len(data):
+            chunk = session.receive(1 << 16, timeout=5)
+            if not chunk:
+                return
+            received.extend(chunk)
+    reader = threading.Thread(target=receive, daemon=True)
+    reader.start()
+    client.send(data)
+    client.close()
+    reader.join(10)
+    assert received == data
+    server.shutdown(graceful=False)
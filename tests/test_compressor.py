@@ -0,0 +1,52 @@
+import os, zlib
+from src.models.constants import COMPRESSION_MIN_SIZE, COMPRESSION_BACKOFF, COMPRESSION_MAX_BACKOFF
+from src.session.models.compressor import Compressor, decompress
+
+LIMIT = 1500
+
+
+def test_round_trip():
+    compressor = Compressor(6)
+    segment = b'compressible ' * 100
+    payload, compressed = compressor.compress(segment)
+    assert compressed and len(payload) < len(segment)
+    assert decompress(payload, LIMIT) == segment
+    assert compressor.saved == len(segment) - len(payload)
+
+
+def test_short_segments_are_sent_as_they_are():
+    segment = b'a' * (COMPRESSION_MIN_SIZE - 1)
+    assert Compressor(6).compress(segment) == (segment, False)
+
+
+def test_incompressible_data_backs_off():
+    compressor = Compressor(6)
+    noise = os.urandom(1000)
+    assert compressor.compress(noise) == (noise, False)
+    # the following segments aren't tried, compressible or not
+    for _ in range(COMPRESSION_BACKOFF):
+        assert compressor.compress(b'a' * 1000)[1] is False
+    assert compressor.compress(b'a' * 1000)[1] is True
+
+
+def test_backoff_doubles_up_to_its_limit():
+    compressor = Compressor(6)
+    noise = os.urandom(1000)
+    backoffs = []
+    for _ in range(6):
+        compressor.compress(noise)
+        backoffs.append(compressor.skip)
+        compressor.skip = 0
+    assert backoffs == [min(COMPRESSION_BACKOFF << i, COMPRESSION_MAX_BACKOFF) for i in range(6)]
+    # a compressible segment resets it
+    compressor.compress(b'a' * 1000)
+    assert compressor.backoff == COMPRESSION_BACKOFF
+
+
+def test_invalid_payloads_are_rejected():
+    assert decompress(b'not zlib', LIMIT) is None
+    # truncated, followed by garbage, and expanding beyond the limit
+    payload = zlib.compress(b'a' * 1000)
+    assert decompress(payload[:-4], LIMIT) is None
+    assert decompress(payload + b'x', LIMIT) is None
+    assert decompress(zlib.compress(b'a' * (LIMIT + 1)), LIMIT) is None
@@ -0,0 +1,89 @@
+import pytest
+from src.models.constants import INITIAL_CWND, MIN_CWND, MAX_CWND, PACING_BURST, PACING_GAIN
+from src.session.models.congestion import CongestionControl, NewReno, Cubic, create_congestion_control
+from src.session.models.pacer import Pacer
+
+SRTT = 0.05
+
+
+def _grown(algorithm):
+    """
+    Returns a controller out of slow start, its window at 40 packets
+    """
+    controller = create_congestion_control(algorithm)
+    controller.ssthresh = 40.0
+    controller.on_ack(30, SRTT)
+    return controller
+
+
+def test_creates_by_name_or_class():
+    assert isinstance(create_congestion_control('newreno'), NewReno)
+    assert isinstance(create_congestion_control(Cubic), Cubic)
+    with pytest.raises(Exception):
+        create_congestion_control('unknown')
+
+
+@pytest.mark.parametrize('algorithm', ['newreno', 'cubic'])
+def test_slow_start_grows_per_ack(algorithm):
+    controller = create_congestion_control(algorithm)
+    assert controller.window() == INITIAL_CWND
+    controller.on_ack(5, SRTT)
+    assert controller.window() == INITIAL_CWND + 5
+    controller.on_ack(10 * MAX_CWND, SRTT)
+    assert controller.window() == MAX_CWND
+
+
+def test_newreno_grows_a_packet_per_window():
+    controller = _grown('newreno')
+    for _ in range(40):
+        controller.on_ack(1, SRTT)
+    assert controller.window() == 40
+
+
+@pytest.mark.parametrize('algorithm, decrease', [('newreno', 0.5), ('cubic', Cubic.BETA)])
+def test_loss_decreases_once_per_rtt(algorithm, decrease):
+    controller = _grown(algorithm)
+    controller.on_loss()
+    assert controller.cwnd == pytest.approx(40 * decrease)
+    # losses of the same window
+    controller.on_loss()
+    assert controller.cwnd == pytest.approx(40 * decrease)
+    controller.recovery_start -= SRTT
+    controller.on_loss()
+    assert controller.cwnd == pytest.approx(40 * decrease * decrease)
+
+
+@pytest.mark.parametrize('algorithm', ['newreno', 'cubic'])
+def test_timeout_collapses_the_window(algorithm):
+    controller = _grown(algorithm)
+    controller.on_timeout()
+    assert controller.window() == MIN_CWND
+    assert controller.ssthresh == 20
+
+
+def test_window_is_never_below_its_minimum():
+    controller = CongestionControl()
+    controller.cwnd = 0.5
+    assert controller.window() == MIN_CWND
+
+
+def test_pacing_rate_spreads_a_window_over_an_rtt():
+    controller = _grown('newreno')
+    assert controller.pacing_rate() == pytest.approx(PACING_GAIN * 40 / SRTT)
+
+
+def test_pacer_allows_a_burst_then_spaces_packets():
+    pacer = Pacer()
+    # intervals exact in binary floating point
+    rate = 128.0
+    for _ in range(PACING_BURST):
+        assert pacer.delay(10.0) == 0
+        pacer.on_send(rate, 10.0)
+    assert pacer.delay(10.0) == pytest.approx(1 / rate)
+    # idle time earns a burst at most
+    for _ in range(PACING_BURST):
+        assert pacer.delay(20.0) == 0
+        pacer.on_send(rate, 20.0)
+    assert pacer.delay(20.0) > 0
+    pacer.on_send(None, 20.0)
+    assert pacer.delay(20.0) == pytest.approx(1 / rate)
@@ -0,0 +1,49 @@
+from src.sockets.cookies import SynCookies
+
+ADDRESS = ('192.0.2.1', 4000)
+PERIOD = 4
+PERIODS = 4
+
+
+def _cookies():
+    return SynCookies(secret=b'0123456789abcdef', period=PERIOD, periods=PERIODS)
+
+
+def test_valid_cookie():
+    cookies = _cookies()
+    cookie = cookies.make(ADDRESS, 7, now=100)
+    assert 0 <= cookie < 1 << 32
+    assert cookies.check(ADDRESS, 7, cookie, now=100)
+
+
+def test_bound_to_the_handshake():
+    cookies = _cookies()
+    cookie = cookies.make(ADDRESS, 7, now=100)
+    assert not cookies.check(('192.0.2.2', 4000), 7, cookie, now=100)
+    assert not cookies.check(('192.0.2.1', 4001), 7, cookie, now=100)
+    assert not cookies.check(ADDRESS, 8, cookie, now=100)
+    assert not cookies.check(ADDRESS, 7, cookie ^ 1, now=100)
+
+
+def test_bound_to_the_secret():
+    cookie = _cookies().make(ADDRESS, 7, now=100)
+    assert not SynCookies(secret=b'fedcba9876543210', period=PERIOD, periods=PERIODS).check(ADDRESS, 7, cookie,
+                                                                                            now=100)
+
+
+def test_expires():
+    cookies = _cookies()
+    now = 100
+    cookie = cookies.make(ADDRESS, 7, now=now)
+    assert cookies.check(ADDRESS, 7, cookie, now=now + PERIOD * (PERIODS - 1))
+    assert not cookies.check(ADDRESS, 7, cookie, now=now + PERIOD * PERIODS)
+    # nor is it valid before it was made
+    assert not cookies.check(ADDRESS, 7, cookie, now=now - PERIOD)
+
+
+def test_clock_wraps_around():
+    cookies = _cookies()
+    # the clock stamp wraps around after 256 periods
+    now = PERIOD * 255
+    cookie = cookies.make(ADDRESS, 7, now=now)
+    assert cookies.check(ADDRESS, 7, cookie, now=now + PERIOD)
@@ -0,0 +1,102 @@
+from src.models.constants import EGRESS_QUEUE_LIMIT, EGRESS_QUANTUM
+from src.sockets.egress import EgressScheduler
+
+
+class _Session:
+    def __init__(self, port):
+        self.address = ('127.0.0.1', port)
+
+
+class _Socket:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, address, datagram):
+        self.sent.append(address[1])
+
+
+class _Wheel:
+    def schedule(self, delay, callback, *args):
+        pass
+
+
+class _Reactor:
+    """
+    Reactor run by hand: deferred calls wait until run() is called
+    """
+    def __init__(self):
+        self.wheel = _Wheel()
+        self.calls = []
+
+    def call_soon(self, callback, *args):
+        self.calls.append((callback, args))
+
+    def run(self):
+        while self.calls:
+            callback, args = self.calls.pop(0)
+            callback(*args)
+
+
+def _scheduler():
+    scheduler = EgressScheduler()
+    socket, reactor = _Socket(), _Reactor()
+    return scheduler, socket, reactor
+
+
+def test_tiny_weight_is_served():
+    scheduler, socket, reactor = _scheduler()
+    scheduler.start(socket, reactor)
+    session = _Session(1)
+    scheduler.configure(session, weight=1e-6)
+    scheduler.send(session, bytes(100))
+    reactor.run()
+    assert socket.sent == [1]
+
+
+def test_weights_share_bytes():
+    scheduler, socket, reactor = _scheduler()
+    light, heavy = _Session(1), _Session(2)
+    scheduler.configure(light, weight=1)
+    scheduler.configure(heavy, weight=2)
+    # datagrams queue up while the scheduler isn't started
+    scheduler.send_batch(light, [bytes(1000)] * 90)
+    scheduler.send_batch(heavy, [bytes(1000)] * 90)
+    scheduler.start(socket, reactor)
+    scheduler.send(light, bytes(1000))
+    reactor.run()
+    assert len(socket.sent) == 181
+    # a round sends EGRESS_QUANTUM bytes of the light session and twice as many of the heavy one
+    rounds = socket.sent[:3 * (EGRESS_QUANTUM // 1000) * 3]
+    assert rounds.count(2) == 2 * rounds.count(1)
+
+
+def test_priority_classes_are_served_in_order():
+    scheduler, socket, reactor = _scheduler()
+    low, high = _Session(1), _Session(2)
+    scheduler.configure(low, priority=2)
+    scheduler.configure(high, priority=0)
+    scheduler.send_batch(low, [bytes(100)] * 10)
+    scheduler.send_batch(high, [bytes(100)] * 10)
+    scheduler.start(socket, reactor)
+    scheduler.send(high, bytes(100))
+    reactor.run()
+    assert socket.sent == [2] * 11 + [1] * 10
+
+
+def test_full_queue_drops():
+    scheduler, socket, reactor = _scheduler()
+    session = _Session(1)
+    scheduler.send_batch(session, [bytes(10)] * (EGRESS_QUEUE_LIMIT + 5))
+    assert scheduler.snapshot()['dropped'] == 5
+    assert scheduler.snapshot()['queued'] == EGRESS_QUEUE_LIMIT
+
+
+def test_invalid_weight_and_priority():
+    scheduler, socket, reactor = _scheduler()
+    for arguments in ({'weight': 0}, {'priority': -1}, {'priority': 99}):
+        try:
+            scheduler.configure(_Session(1), **arguments)
+        except Exception as e:
+            assert str(e).startswith('Egress error')
+        else:
+            assert False, 'configure accepted {}'.format(arguments)
@@ -0,0 +1,108 @@
+import itertools, random, struct
+from src.models.packet import Packet
+from src.models.constants import PAYLOAD, PARITY as PARITY_OPER, FLAG_UNORDERED, FLAG_FIN, FEC_MAX_GROUP, \
+    FEC_MAX_PARITY
+from src.session.models.fec import FecEncoder, FecDecoder, _invert
+
+FIRST = 1000
+GROUP = 6
+PARITY = 3
+
+
+def _group(seed):
+    """
+    Returns a group of payload packets of unequal sizes, an empty one (a stream FIN) among them
+    """
+    rng = random.Random(seed)
+    packets = []
+    for column in range(GROUP):
+        size = 0 if column == 2 else rng.randint(1, 300)
+        packets.append(Packet(seq=FIRST + column, oper=PAYLOAD, ack=0, stream=column % 3, stream_seq=column * 7,
+                              flags=FLAG_FIN if size == 0 else column % 2 * FLAG_UNORDERED,
+                              payload=bytes(rng.getrandbits(8) for _ in range(size))))
+    return packets
+
+
+def _encode(packets):
+    encoder = FecEncoder(GROUP, PARITY)
+    parity = []
+    for packet in packets:
+        parity += encoder.add(packet)
+    return parity
+
+
+def _decode(packets, parity, erased):
+    decoder = FecDecoder()
+    rebuilt = []
+    for packet in packets:
+        if packet.seq_number not in erased:
+            rebuilt += decoder.add_source(packet, FIRST)
+    for packet in parity:
+        rebuilt += decoder.add_parity(packet, FIRST)
+    return rebuilt
+
+
+def test_group_is_followed_by_its_parity():
+    parity = _encode(_group(0))
+    assert len(parity) == PARITY
+    assert all(packet.seq_number == FIRST for packet in parity)
+
+
+def test_rebuilds_up_to_parity_erasures():
+    packets = _group(1)
+    parity = _encode(packets)
+    for count in range(1, PARITY + 1):
+        for erased in itertools.combinations(range(FIRST, FIRST + GROUP), count):
+            rebuilt = {packet.seq_number: packet for packet in _decode(packets, parity, erased)}
+            assert sorted(rebuilt) == list(erased)
+            for seq_number in erased:
+                original = packets[seq_number - FIRST]
+                packet = rebuilt[seq_number]
+                assert bytes(packet.payload) == bytes(original.payload)
+                assert (packet.stream_id, packet.stream_seq, packet.flags) == \
+                    (original.stream_id, original.stream_seq, original.flags)
+
+
+def test_rebuilds_whichever_parity_arrives():
+    packets = _group(2)
+    parity = _encode(packets)
+    erased = (FIRST, FIRST + 4)
+    for rows in itertools.combinations(parity, len(erased)):
+        rebuilt = _decode(packets, list(rows), erased)
+        assert [bytes(packet.payload) for packet in rebuilt] == \
+            [bytes(packets[seq_number - FIRST].payload) for seq_number in erased]
+
+
+def test_too_many_erasures_rebuild_nothing():
+    packets = _group(3)
+    parity = _encode(packets)
+    assert _decode(packets, parity, range(FIRST, FIRST + PARITY + 1)) == []
+
+
+def test_parity_before_sources():
+    packets = _group(4)
+    parity = _encode(packets)
+    decoder = FecDecoder()
+    rebuilt = []
+    for packet in parity[:1]:
+        rebuilt += decoder.add_parity(packet, FIRST)
+    for packet in packets[1:]:
+        rebuilt += decoder.add_source(packet, FIRST)
+    assert [bytes(packet.payload) for packet in rebuilt] == [bytes(packets[0].payload)]
+
+
+def test_out_of_bounds_parity_is_ignored():
+    packets = _group(5)
+    parity = _encode(packets)
+    payload = bytes(parity[0].payload)
+    decoder = FecDecoder()
+    for header in ((FEC_MAX_GROUP + 1, PARITY, 0), (GROUP, FEC_MAX_PARITY + 1, 0), (GROUP, PARITY, PARITY)):
+        rogue = Packet(seq=FIRST, oper=PARITY_OPER, ack=0, payload=struct.pack("!B B B", *header) + payload[3:])
+        assert decoder.add_parity(rogue, FIRST) == []
+    assert decoder.groups == {}
+
+
+def test_singular_matrix_is_not_inverted():
+    assert _invert([[1, 2], [2, 4]]) is None
+    assert _invert([[0, 0], [0, 0]]) is None
+    assert _invert([[1, 0], [0, 1]]) == [[1, 0], [0, 1]]
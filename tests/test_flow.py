@@ -0,0 +1,68 @@
+import queue, threading, time
+import pytest
+from src.models.constants import FLOW_WINDOW
+from src.sockets.server import ReliableServer
+from src.sockets.client import ReliableSocket
+
+
+@pytest.fixture
+def connection():
+    """
+    Yields a connected client socket and the server's session
+    """
+    server = ReliableServer('127.0.0.1', 0)
+    server.listen()
+    accepted = queue.Queue()
+    threading.Thread(target=lambda: accepted.put(server.accept()), daemon=True).start()
+    while server.acceptors == 0:
+        time.sleep(0.001)
+    client = ReliableSocket(*server.socket.socket.getsockname())
+    client.connect()
+    yield client, accepted.get(timeout=5)
+    server.shutdown(graceful=False)
+
+
+def _wait(condition):
+    deadline = time.monotonic() + 10
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def _window_full(client, session):
+    return session.advertised < client.session.max_payload and not client.session.awaiting_ack.in_flight
+
+
+def test_slow_reader_holds_the_sender_back(connection):
+    client, session = connection
+    data = bytes(range(256)) * (2 * FLOW_WINDOW // 256)
+    sender = threading.Thread(target=client.send, args=(data,), daemon=True)
+    sender.start()
+    _wait(lambda: _window_full(client, session))
+    time.sleep(0.1)
+    # probes of the closed window carry a byte each
+    buffered = len(session.stream)
+    assert buffered <= FLOW_WINDOW + client.session.window_probes
+    assert sender.is_alive()
+    # reading opens the window again
+    received = bytearray()
+    while len(received) < len(data):
+        chunk = session.receive(1 << 16, timeout=5)
+        assert chunk
+        received += chunk
+    sender.join(5)
+    assert not sender.is_alive()
+    assert received == data
+
+
+def test_non_blocking_send_fails_fast(connection):
+    client, session = connection
+    client.set_blocking(False)
+    chunk = b'x' * 65536
+    sent = 0
+    with pytest.raises(BlockingIOError):
+        while sent <= 2 * FLOW_WINDOW:
+            client.send(chunk)
+            sent += len(chunk)
+            _wait(lambda: not client.session.outbox_bytes or _window_full(client, session))
+    assert FLOW_WINDOW - len(chunk) <= sent <= FLOW_WINDOW
@@ -0,0 +1,32 @@
+import queue, threading, time
+import pytest
+from src.models.packet import parse_packet
+from src.models.constants import ACK
+from src.sockets.server import ReliableServer
+from src.sockets.client import ReliableSocket
+
+
+@pytest.mark.parametrize('syn_cookies', [False, True])
+def test_lost_handshake_ack(syn_cookies):
+    server = ReliableServer('127.0.0.1', 0, syn_cookies=syn_cookies)
+    server.listen()
+    accepted = queue.Queue()
+    threading.Thread(target=lambda: accepted.put(server.accept()), daemon=True).start()
+    while server.acceptors == 0:
+        time.sleep(0.001)
+    client = ReliableSocket(*server.socket.socket.getsockname())
+    send, dropped = client.socket.send, []
+
+    def lossy_send(address, packet):
+        if not dropped and parse_packet(bytes(packet)).operation == ACK:
+            dropped.append(packet)
+        else:
+            send(address, packet)
+    client.socket.send = lossy_send
+    client.connect()
+    client.send(b'data after the lost ACK')
+    session = accepted.get(timeout=5)
+    assert dropped
+    assert session.receive(100, timeout=5) == b'data after the lost ACK'
+    assert server.snapshot()['connections_accepted'] == 1
+    server.shutdown(graceful=False)
@@ -0,0 +1,105 @@
+from src.models.constants import BASE_PLPMTU, MAX_PLPMTU, PMTU_SEARCH_GRANULARITY, PMTU_BLACK_HOLE_TIMEOUTS, \
+    IP_UDP_OVERHEAD, PROBE_ACK
+from src.models.packet import Packet
+from src.session.models.pmtu import PathMtu
+from src.session.models.rtt import RttEstimator
+
+
+class _Timer:
+    def __init__(self, callback, args):
+        self.callback, self.args = callback, args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class _Scheduler:
+    """
+    Scheduler fired by hand: fire() fires the earliest pending timer
+    """
+    def __init__(self):
+        self.timers = []
+
+    def schedule(self, delay, callback, *args):
+        timer = _Timer(callback, args)
+        self.timers.append(timer)
+        return timer
+
+    def fire(self):
+        timer = self.timers.pop(0)
+        if not timer.cancelled:
+            timer.callback(*timer.args)
+
+
+class _Path:
+    """
+    Path delivering datagrams up to its MTU, the delivered probes wait to be acked
+    """
+    def __init__(self, mtu):
+        self.mtu = mtu
+        self.delivered = []
+        self.sizes = []
+
+    def send(self, packet):
+        size = len(packet) + IP_UDP_OVERHEAD
+        self.sizes.append(size)
+        if size <= self.mtu:
+            self.delivered.append(packet)
+
+
+def _search(path_mtu, route_mtu=None, current=BASE_PLPMTU):
+    """
+    Runs a search to its end
+    :return: PathMtu, the path and the sizes announced by the update emitter
+    """
+    path, scheduler = _Path(path_mtu), _Scheduler()
+    pmtu = PathMtu(path.send, scheduler, RttEstimator())
+    updates = []
+    pmtu.update_emitter.subscribe(lambda mtu: updates.append(mtu))
+    pmtu.start(current, route_mtu)
+    while path.delivered or scheduler.timers:
+        while path.delivered:
+            probe = path.delivered.pop(0)
+            pmtu.on_probe_ack(Packet(seq=probe.seq_number, oper=PROBE_ACK, ack=probe.ack_number))
+        if scheduler.timers:
+            scheduler.fire()
+    return pmtu, path, updates
+
+
+def test_finds_path_mtu():
+    pmtu, path, updates = _search(4000)
+    assert 4000 - PMTU_SEARCH_GRANULARITY < pmtu.low <= 4000
+    assert updates == sorted(updates) and updates[-1] == pmtu.low
+    assert pmtu.probe_id is None
+
+
+def test_never_exceeds_the_route_mtu():
+    pmtu, path, updates = _search(MAX_PLPMTU, route_mtu=1500)
+    assert 1500 - PMTU_SEARCH_GRANULARITY < pmtu.low <= 1500
+    assert max(path.sizes) <= 1500
+
+
+def test_never_exceeds_max_plpmtu():
+    pmtu, path, updates = _search(65535, route_mtu=65535)
+    assert pmtu.high <= MAX_PLPMTU and max(path.sizes) <= MAX_PLPMTU
+
+
+def test_path_below_the_base_size_stays_at_it():
+    pmtu, path, updates = _search(1000)
+    assert pmtu.low == BASE_PLPMTU
+    assert updates == []
+
+
+def test_black_hole_restarts_the_search():
+    pmtu, path, updates = _search(4000)
+    found = pmtu.low
+    # the route shrank, full sized packets time out
+    pmtu.on_timeout(found, PMTU_BLACK_HOLE_TIMEOUTS - 1)
+    assert pmtu.low == found
+    pmtu.on_timeout(found, PMTU_BLACK_HOLE_TIMEOUTS)
+    assert pmtu.low == BASE_PLPMTU and pmtu.high == found - 1
+    assert updates[-1] == BASE_PLPMTU
+    # smaller packets timing out don't mean a black hole
+    pmtu.on_timeout(BASE_PLPMTU, PMTU_BLACK_HOLE_TIMEOUTS)
+    assert pmtu.high == found - 1
@@ -0,0 +1,72 @@
+from src.models.constants import SEQ_LIMIT
+from src.session.models.reorder import ReorderBuffer
+
+
+def test_in_order():
+    buffer = ReorderBuffer(10)
+    assert buffer.insert(10, 'a') == ['a']
+    assert buffer.insert(11, 'b') == ['b']
+    assert buffer.base == 12
+    assert len(buffer) == 0
+
+
+def test_gap_is_filled():
+    buffer = ReorderBuffer(10)
+    assert buffer.insert(12, 'c') == []
+    assert buffer.insert(11, 'b') == []
+    assert len(buffer) == 2
+    assert buffer.insert(10, 'a') == ['a', 'b', 'c']
+    assert buffer.base == 13
+    assert len(buffer) == 0
+
+
+def test_duplicates_and_out_of_window():
+    buffer = ReorderBuffer(10, capacity=8)
+    buffer.insert(10, 'a')
+    buffer.insert(13, 'd')
+    assert buffer.insert(10, 'a') is None
+    assert buffer.insert(13, 'd') is None
+    assert buffer.insert(11 + 8, 'x') is None
+    assert buffer.insert(11 + 7, 'h') == []
+    assert buffer.contains(10) and buffer.contains(13) and not buffer.contains(12)
+
+
+def test_skip_delivers_what_follows():
+    buffer = ReorderBuffer(10)
+    buffer.insert(11, 'b')
+    buffer.insert(12, 'c')
+    buffer.insert(14, 'e')
+    assert buffer.skip() == ['b', 'c']
+    assert buffer.base == 13
+    assert buffer.skip() == ['e']
+    assert buffer.base == 15
+    assert len(buffer) == 0
+
+
+def test_sack_blocks():
+    buffer = ReorderBuffer(10)
+    for seq_number in (11, 12, 15, 17, 18):
+        buffer.insert(seq_number, seq_number)
+    assert buffer.sack_blocks(8) == [(11, 13), (15, 16), (17, 19)]
+    assert buffer.sack_blocks(2) == [(11, 13), (15, 16)]
+    buffer.insert(10, 10)
+    assert buffer.sack_blocks(8) == [(15, 16), (17, 19)]
+
+
+def test_wraps_around():
+    base = SEQ_LIMIT - 2
+    buffer = ReorderBuffer(base, capacity=8)
+    assert buffer.insert(1, 'd') == []
+    assert buffer.sack_blocks(8) == [(1, 2)]
+    assert buffer.insert(base, 'a') == ['a']
+    assert buffer.insert(0, 'c') == []
+    assert buffer.insert(SEQ_LIMIT - 1, 'b') == ['b', 'c', 'd']
+    assert buffer.base == 2
+
+
+def test_slots_are_reused():
+    buffer = ReorderBuffer(0, capacity=4)
+    for seq_number in range(0, 40, 2):
+        assert buffer.insert(seq_number + 1, seq_number + 1) == []
+        assert buffer.insert(seq_number, seq_number) == [seq_number, seq_number + 1]
+    assert buffer.base == 40
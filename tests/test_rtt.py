@@ -0,0 +1,46 @@
+import pytest
+from src.models.constants import ACK_TIMEOUT, MIN_RTO, MAX_RTO, TIMER_TICK
+from src.session.models.rtt import RttEstimator
+
+
+def test_initial_timeout():
+    rtt = RttEstimator()
+    assert rtt.timeout() == ACK_TIMEOUT
+    assert rtt.timeout(2) == 4 * ACK_TIMEOUT
+
+
+def test_first_sample():
+    rtt = RttEstimator()
+    rtt.sample(0.1)
+    assert rtt.srtt == 0.1 and rtt.rttvar == 0.05
+    # srtt + 4 * rttvar
+    assert rtt.timeout() == pytest.approx(0.3)
+
+
+def test_smoothing():
+    rtt = RttEstimator()
+    rtt.sample(0.1)
+    rtt.sample(0.2)
+    assert rtt.rttvar == pytest.approx(0.75 * 0.05 + 0.25 * 0.1)
+    assert rtt.srtt == pytest.approx(0.875 * 0.1 + 0.125 * 0.2)
+    assert rtt.latest == 0.2
+
+
+def test_stable_rtt_keeps_a_tick_of_margin():
+    rtt = RttEstimator()
+    for _ in range(100):
+        rtt.sample(0.1)
+    assert rtt.timeout() == pytest.approx(0.1 + TIMER_TICK, abs=1e-6)
+
+
+def test_delayed_acks_are_waited_for():
+    rtt = RttEstimator(max_ack_delay=0.01)
+    rtt.sample(0.1)
+    assert rtt.timeout() == pytest.approx(0.31)
+
+
+def test_timeout_is_clamped():
+    rtt = RttEstimator()
+    rtt.sample(0.0001)
+    assert rtt.timeout() == MIN_RTO
+    assert rtt.timeout(30) == MAX_RTO
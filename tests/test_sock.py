@@ -0,0 +1,57 @@
+import errno
+from src.models.packet import Packet
+from src.models.constants import PAYLOAD
+from src.sockets.sock import Socket
+
+ADDRESS = ('127.0.0.1', 9)
+
+
+class _Socket:
+    """
+    Socket whose recvfrom returns or raises the given results in turn
+    """
+    def __init__(self, results):
+        self.results = list(results)
+
+    def recvfrom(self, size, flags=0):
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result, ADDRESS
+
+    def close(self):
+        pass
+
+
+def _socket(results):
+    wrapper = Socket()
+    wrapper.socket.close()
+    wrapper.socket = _Socket(results)
+    wrapper.use_mmsg = False
+    return wrapper
+
+
+def _datagram(seq_number):
+    return bytes(Packet(seq=seq_number, oper=PAYLOAD, ack=0, payload=b'data'))
+
+
+def test_drains_until_would_block():
+    wrapper = _socket([_datagram(1), _datagram(2), BlockingIOError()])
+    assert [packet.seq_number for packet, _ in wrapper.read_packets()] == [1, 2]
+
+
+def test_icmp_errors_are_skipped():
+    wrapper = _socket([_datagram(1), ConnectionRefusedError(), _datagram(2), BlockingIOError()])
+    assert [packet.seq_number for packet, _ in wrapper.read_packets()] == [1, 2]
+
+
+def test_read_packets_are_returned_before_an_error():
+    error = OSError(errno.ENOBUFS, 'no buffer space')
+    wrapper = _socket([_datagram(1), error, error])
+    assert [packet.seq_number for packet, _ in wrapper.read_packets()] == [1]
+    try:
+        wrapper.read_packets()
+    except OSError as e:
+        assert e is error
+    else:
+        assert False, 'the error was swallowed'
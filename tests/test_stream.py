@@ -0,0 +1,78 @@
+import threading, time
+from src.session.models.stream import ByteStream
+
+
+def test_fetch_in_order_across_wrap_around():
+    stream = ByteStream()
+    stream.append(b'a' * 60000)
+    assert stream.fetch(50000) == b'a' * 50000
+    # the tail wraps around to the start of the ring
+    stream.append(bytes(range(256)) * 100)
+    assert len(stream) == 10000 + 25600
+    assert stream.fetch(10000) == b'a' * 10000
+    assert stream.fetch(100000) == bytes(range(256)) * 100
+    assert stream.fetch(10) == b''
+
+
+def test_grows_to_hold_unread_data():
+    stream = ByteStream()
+    data = bytes(range(256)) * 1000
+    for start in range(0, len(data), 1000):
+        stream.append(data[start:start + 1000])
+    target = bytearray(len(data))
+    assert stream.fetch_into(target) == len(data)
+    assert target == data
+
+
+def test_read_emitter_counts_read_bytes():
+    stream = ByteStream()
+    reads = []
+    stream.read_emitter.subscribe(lambda **args: reads.append(args['length']))
+    stream.append(b'abcdef')
+    stream.fetch(4)
+    stream.fetch_into(bytearray(10))
+    stream.fetch(4)
+    assert reads == [4, 2]
+
+
+def test_fetch_waits_for_data():
+    stream = ByteStream()
+    threading.Timer(0.05, stream.append, (b'late',)).start()
+    assert stream.fetch(10, timeout=None) == b'late'
+    assert stream.fetch(10, timeout=0.01) == b''
+
+
+def test_close_wakes_readers():
+    stream = ByteStream()
+    threading.Timer(0.05, stream.close).start()
+    assert stream.fetch(10, timeout=None) == b''
+
+
+def test_append_past_limit_raises():
+    stream = ByteStream(limit=10)
+    stream.append(b'0123456789')
+    assert stream.available_space == 0
+    for data in (b'x', b'y' * 11):
+        try:
+            stream.append(data)
+        except Exception as e:
+            assert str(e).startswith('Stream error')
+        else:
+            assert False, 'the limit was exceeded'
+    assert len(stream) == 10
+
+
+def test_append_waits_for_room():
+    stream = ByteStream(limit=10)
+    stream.append(b'0123456789')
+    threading.Timer(0.05, stream.fetch, (4,)).start()
+    started = time.monotonic()
+    stream.append(b'abcd', timeout=1)
+    assert time.monotonic() - started < 1
+    assert stream.fetch(10) == b'456789abcd'
+    try:
+        stream.append(b'0123456789x', timeout=1)
+    except Exception as e:
+        assert str(e).startswith('Stream error')
+    else:
+        assert False, 'a write larger than the limit was waited for'
@@ -0,0 +1,80 @@
+import queue, threading, time
+import pytest
+from src.models.constants import MAX_STREAMS
+from src.sockets.server import ReliableServer
+from src.sockets.client import ReliableSocket
+
+
+@pytest.fixture
+def connection():
+    """
+    Yields a connected client socket and the server's session
+    """
+    server = ReliableServer('127.0.0.1', 0)
+    server.listen()
+    accepted = queue.Queue()
+    threading.Thread(target=lambda: accepted.put(server.accept()), daemon=True).start()
+    while server.acceptors == 0:
+        time.sleep(0.001)
+    client = ReliableSocket(*server.socket.socket.getsockname())
+    client.connect()
+    yield client, accepted.get(timeout=5)
+    server.shutdown(graceful=False)
+
+
+def _read_all(stream):
+    data = b''
+    while True:
+        chunk = stream.receive(1 << 16, timeout=5)
+        if not chunk:
+            return data
+        data += chunk
+
+
+def _wait(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def test_streams_are_independent(connection):
+    client, session = connection
+    first, second = client.session.open_stream(), client.session.open_stream()
+    assert first.id != second.id and first.id % 2 == second.id % 2
+    second.send(b'second')
+    first.send(b'first')
+    accepted = {stream.id: stream for stream in (session.accept_stream(5), session.accept_stream(5))}
+    assert accepted[first.id].receive(100, timeout=5) == b'first'
+    assert accepted[second.id].receive(100, timeout=5) == b'second'
+
+
+def test_close_ends_the_peer_stream(connection):
+    client, session = connection
+    stream = client.session.open_stream()
+    stream.send(b'x' * 100000)
+    stream.close()
+    with pytest.raises(Exception):
+        stream.send(b'after close')
+    assert _read_all(session.accept_stream(5)) == b'x' * 100000
+
+
+def test_closed_stream_ids_are_reused(connection):
+    client, session = connection
+    stream = client.session.open_stream()
+    stream.send(b'data')
+    stream.close()
+    peer_stream = session.accept_stream(5)
+    assert _read_all(peer_stream) == b'data'
+    peer_stream.close()
+    _wait(lambda: client.session.local_streams == 0)
+    _wait(lambda: stream.id not in session.streams)
+    assert client.session.open_stream().id == stream.id
+
+
+def test_open_streams_are_capped(connection):
+    client, session = connection
+    for _ in range(MAX_STREAMS):
+        client.session.open_stream()
+    with pytest.raises(Exception):
+        client.session.open_stream()
@@ -0,0 +1,82 @@
+from src.session.models.timer import TimerWheel
+
+TICK = 0.5
+SLOTS = 8
+
+
+def _wheel():
+    """
+    Returns a wheel driven by hand, its clock starting at 0
+    """
+    wheel = TimerWheel(tick=TICK, slots=SLOTS)
+    wheel.last_tick = 0.0
+    return wheel
+
+
+def _fire_time(delay):
+    """
+    Returns the time a timer armed at 0 fires at, ticking the wheel by hand
+    """
+    wheel = _wheel()
+    fired = []
+    wheel.schedule(delay, fired.append, True)
+    wheel.last_tick = 0.0
+    now = 0.0
+    while not fired:
+        now += TICK
+        assert now <= delay + 2 * SLOTS * TICK, 'timer never fired'
+        wheel.advance(now)
+    return now
+
+
+def test_fires_after_its_delay():
+    for delay in (0.1, TICK, 1.2, 3 * TICK):
+        fired = _fire_time(delay)
+        assert delay <= fired < delay + TICK
+
+
+def test_fires_after_a_whole_rotation():
+    # a delay of exactly one or more rotations must not wait for an extra rotation
+    for rotations in (1, 2, 3):
+        assert _fire_time(rotations * SLOTS * TICK) == rotations * SLOTS * TICK
+
+
+def test_fires_across_rotations():
+    for delay in (SLOTS * TICK - TICK, SLOTS * TICK + TICK, 2.5 * SLOTS * TICK):
+        assert _fire_time(delay) == delay
+
+
+def test_cancelled_timer_doesnt_fire():
+    wheel = _wheel()
+    fired = []
+    wheel.schedule(TICK, fired.append, 'cancelled').cancel()
+    wheel.schedule(TICK, fired.append, 'kept')
+    wheel.last_tick = 0.0
+    assert wheel.advance(TICK) == 1
+    assert fired == ['kept']
+    assert wheel.pending == 0
+    assert wheel.next_timeout() is None
+
+
+def test_timers_fire_in_order():
+    wheel = _wheel()
+    fired = []
+    for delay in (3.0, 0.5, 6.0, 1.5):
+        wheel.schedule(delay, fired.append, delay)
+    wheel.last_tick = 0.0
+    now = 0.0
+    while wheel.pending:
+        now += TICK
+        wheel.advance(now)
+    assert fired == [0.5, 1.5, 3.0, 6.0]
+
+
+def test_failing_timer_doesnt_stop_the_wheel(capsys):
+    wheel = _wheel()
+    fired = []
+    wheel.schedule(TICK, lambda: 1 / 0)
+    wheel.schedule(TICK, fired.append, True)
+    wheel.last_tick = 0.0
+    wheel.advance(TICK)
+    assert fired == [True]
+    assert 'ZeroDivisionError' in capsys.readouterr().err